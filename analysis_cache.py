@@ -0,0 +1,206 @@
+"""
+Analysis Result Cache
+Caches NLP analysis results keyed by a hash of the cleaned note text and the
+model/backend version, so identical texts skip inference
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from copy import deepcopy
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+
+# In-memory LRU tier
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '1024'))
+
+# Optional SQLite tier shared by processes on the same host (empty path disables it)
+ANALYSIS_CACHE_DISK_PATH = os.getenv('ANALYSIS_CACHE_DISK_PATH', '')
+ANALYSIS_CACHE_DISK_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_DISK_MAX_ENTRIES', '50000'))
+
+
+class AnalysisCache:
+    """Two-tier (memory LRU, optional SQLite) cache for analysis results"""
+
+    def __init__(self, max_entries=ANALYSIS_CACHE_MAX_ENTRIES, disk_path=ANALYSIS_CACHE_DISK_PATH,
+                 disk_max_entries=ANALYSIS_CACHE_DISK_MAX_ENTRIES, enabled=ANALYSIS_CACHE_ENABLED):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_writes = 0
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0
+        }
+
+        if self.enabled and self.disk_path:
+            self._open_disk()
+
+    def _open_disk(self):
+        try:
+            self._disk = sqlite3.connect(self.disk_path, check_same_thread=False, timeout=5)
+            self._disk.execute(
+                'CREATE TABLE IF NOT EXISTS analysis_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)'
+            )
+            self._disk.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used)')
+            self._disk.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Analysis disk cache disabled, could not open {self.disk_path}: {e}")
+            self._disk = None
+
+    @staticmethod
+    def make_key(cleaned_text, version):
+        """
+        Build the cache key for a cleaned text
+
+        Args:
+            cleaned_text (str): Output of NLPAnalyzer._clean_text
+            version (str): Model/backend version string
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        return hashlib.sha256(f"{version}\x00{cleaned_text}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached result, promoting disk hits into memory
+
+        Args:
+            key (str): Cache key from make_key
+
+        Returns:
+            dict or None: A copy of the cached result
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return deepcopy(value)
+
+            value = self._disk_get(key)
+            if value is not None:
+                self.stats['disk_hits'] += 1
+                self._memory_put(key, value)
+                return deepcopy(value)
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, value):
+        """
+        Store a result in both tiers
+
+        Args:
+            key (str): Cache key from make_key
+            value (dict): JSON-serializable analysis result
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._memory_put(key, deepcopy(value))
+            self._disk_put(key, value)
+
+    def _memory_put(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['memory_evictions'] += 1
+
+    def _disk_get(self, key):
+        if self._disk is None:
+            return None
+        try:
+            row = self._disk.execute('SELECT value FROM analysis_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._disk.execute('UPDATE analysis_cache SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._disk.commit()
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Analysis disk cache read failed: {e}")
+            return None
+
+    def _disk_put(self, key, value):
+        if self._disk is None:
+            return
+        try:
+            self._disk.execute(
+                'INSERT OR REPLACE INTO analysis_cache (key, value, last_used) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time())
+            )
+            self._disk_writes += 1
+
+            # Trim least recently used rows every 100 writes rather than on every put
+            if self._disk_writes % 100 == 0:
+                excess = self._disk.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0] - self.disk_max_entries
+                if excess > 0:
+                    self._disk.execute(
+                        'DELETE FROM analysis_cache WHERE key IN '
+                        '(SELECT key FROM analysis_cache ORDER BY last_used ASC LIMIT ?)',
+                        (excess,)
+                    )
+                    self.stats['disk_evictions'] += excess
+            self._disk.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Analysis disk cache write failed: {e}")
+
+    def clear(self):
+        """Drop every cached result from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                try:
+                    self._disk.execute('DELETE FROM analysis_cache')
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Analysis disk cache clear failed: {e}")
+
+    def get_stats(self):
+        """
+        Get hit/miss/eviction counters and tier sizes
+
+        Returns:
+            dict: Cache statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_max_entries'] = self.max_entries
+            stats['disk_enabled'] = self._disk is not None
+            if self._disk is not None:
+                try:
+                    stats['disk_entries'] = self._disk.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+                except sqlite3.Error:
+                    stats['disk_entries'] = None
+                stats['disk_max_entries'] = self.disk_max_entries
+            stats['enabled'] = self.enabled
+        return stats
+
+
+# Global instance
+analysis_cache = AnalysisCache()
@@ -4,14 +4,13 @@ from dotenv import load_dotenv
 from functools import wraps
 from werkzeug.utils import secure_filename
 import uuid
-import requests
-import time
 import re
 from math import isnan
 import hashlib
 import math
 from datetime import datetime
 import json
+import threading
 
 # Load environment variables before importing Firebase config
 load_dotenv()
@@ -30,15 +29,90 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Geocoding configuration
-GOOGLE_GEOCODING_API_KEY = os.getenv('GOOGLE_GEOCODING_API_KEY')  # Optional: Add to .env file
-NOMINATIM_BASE_URL = 'https://nominatim.openstreetmap.org/search'
-
 # Import the new Laguna Location API
-from laguna_locations_api import laguna_api, get_municipality, get_all_municipalities, get_barangays, search_locations, get_location_stats
+from laguna_locations_api import laguna_api, get_municipality, get_all_municipalities, get_barangays, search_locations, get_location_stats, resolve_address, reverse_geocode
+
+# Persistent cache of geocoding results keyed by the cleaned address
+from geocode_cache import geocode_cache, normalize_address_key
+
+# Rate-limited concurrent geocoder (Google if GOOGLE_GEOCODING_API_KEY is set, then Nominatim)
+from geocoding_pipeline import geocoding_pipeline
+
+# Chunked, parallel, retrying WriteBatch commits for mass updates
+from firestore_bulk import BulkWriter
+
+# Server-side count() aggregation instead of streaming documents to count them
+from firestore_counts import count_query
+
+# Transactional counter behind sequential clientIds
+from client_ids import client_id_allocator
+
+# Cursor-paged, name-ordered clients list
+from client_pagination import client_paginator, sort_key_fields, normalize_care_type, normalize_status, LISTED_STATUSES
+
+# In-memory replica of the clients and users collections, kept current by snapshot listeners
+from client_replica import client_replica, user_replica
+
+# Zoom-aware clustering index behind /api/clients/clusters
+from map_index import client_map_index, map_point, MAP_FIELDS
+
+def _load_map_clients():
+    if client_replica.enabled:
+        return ((client.id, client.to_dict()) for client in client_replica.documents())
+    clients = db.collection('clients').where('archived', '==', False).select(MAP_FIELDS).stream()
+    return ((client.id, client.to_dict()) for client in clients)
+
+client_map_index.loader = _load_map_clients
+
+# Replica changes move map points as they happen instead of waiting for a resync
+client_replica.add_listener(lambda client_id, old, new: client_map_index.upsert(client_id, new))
+
+def record_client_write(client_id, changes):
+    """
+    Apply a successful client write to the replica, map and search indexes
+    right away, so the redirect that follows a write, the map and the
+    intervention picker already show it
+
+    Args:
+        client_id (str): Firestore document id
+        changes (dict): Fields that were written (the whole document for a new client)
+    """
+    if client_replica.enabled:
+        # Replica listeners update the map and search indexes
+        client_replica.note_write(client_id, changes)
+        return
+    current = client_replica.get(client_id)
+    client_dict = current.to_dict() if current is not None else {}
+    client_dict.update(changes)
+    # The intervention picker searches only this index, so keep it current too
+    client_search_index.upsert(client_id, client_dict)
+    if any(field in changes for field in MAP_FIELDS):
+        client_map_index.upsert(client_id, client_dict)
+
+# Typeahead index over client name, clientId, barangay and municipality
+from client_search import client_search_index
+client_search_index.loader = lambda: ((client.id, client.to_dict()) for client in client_replica.documents())
+client_replica.add_listener(lambda client_id, old, new: client_search_index.upsert(client_id, new))
+
+# Multi-resolution heat-map grid, kept current from the map index
+from density_grid import density_grid
+client_map_index.add_listener(density_grid.update)
 
 # Import NLP analyzer for sentiment analysis
-from nlp_analyzer import nlp_analyzer
+from nlp_analyzer import nlp_analyzer, NLP_PRELOAD
+import nlp_worker
+from nlp_worker import NLP_WORKER_MODE, NLPWorkerError, NLPWorkerTimeout
+
+# Run NLP inference in a separate worker process when configured
+if NLP_WORKER_MODE == 'local':
+    print("Starting local NLP worker process...")
+    nlp_worker.start_local_worker()
+
+# Optionally load the NLP models at startup instead of on the first note request
+# (skipped when a worker process owns the models)
+if NLP_WORKER_MODE == 'inprocess' and NLP_PRELOAD in ('background', 'blocking'):
+    print(f"Preloading NLP models ({NLP_PRELOAD})...")
+    nlp_analyzer.start_warm_up(background=NLP_PRELOAD == 'background')
 
 
 def allowed_file(filename):
@@ -47,7 +121,8 @@ def allowed_file(filename):
 def geocode_address(address):
     """
     Geocode an address to get latitude and longitude coordinates.
-    First tries Google Geocoding API (if key is available), then falls back to Nominatim.
+    Answers from the persistent geocode cache when possible; otherwise tries
+    Google Geocoding API (if key is available), then falls back to Nominatim.
     """
     if not address or len(address.strip()) < 5:
         return None
@@ -55,15 +130,32 @@ def geocode_address(address):
     # Clean and prepare the address
     cleaned_address = clean_address(address)
     
-    # Try Google Geocoding API first (if API key is available)
-    if GOOGLE_GEOCODING_API_KEY:
-        coords = geocode_with_google(cleaned_address)
-        if coords:
-            return coords
+    return geocoding_pipeline.geocode(cleaned_address)
+
+def geocode_addresses(addresses):
+    """
+    Geocode a batch of addresses concurrently, resolving each distinct cleaned
+    address once (clients in the same barangay often share an address).
+    Each provider is held to its own request rate by the geocoding pipeline.
+    
+    Returns a dict mapping every input address to its coordinates or None.
+    """
+    results = {}
+    keys = {}
+    for address in addresses:
+        if address in results or address in keys:
+            continue
+        if not address or len(address.strip()) < 5:
+            results[address] = None
+            continue
+        keys[address] = clean_address(address)
     
-    # Fallback to Nominatim (OpenStreetMap)
-    coords = geocode_with_nominatim(cleaned_address)
-    return coords
+    coords_by_key = geocoding_pipeline.geocode_many(list(keys.values()))
+    for address, cleaned_address in keys.items():
+        coords = coords_by_key.get(normalize_address_key(cleaned_address))
+        results[address] = dict(coords) if coords else None
+    
+    return results
 
 def clean_address(address):
     """Clean and standardize the address for better geocoding results."""
@@ -87,73 +179,6 @@ def clean_address(address):
     
     return address
 
-def geocode_with_google(address):
-    """Geocode using Google Geocoding API."""
-    try:
-        url = 'https://maps.googleapis.com/maps/api/geocode/json'
-        params = {
-            'address': address,
-            'key': GOOGLE_GEOCODING_API_KEY,
-            'region': 'ph',  # Bias towards Philippines
-            'bounds': '13.9,120.8|14.7,121.6'  # Laguna bounds
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == 'OK' and data['results']:
-                location = data['results'][0]['geometry']['location']
-                coords = {
-                    'lat': round(location['lat'], 6),
-                    'lng': round(location['lng'], 6),
-                    'source': 'google',
-                    'formatted_address': data['results'][0]['formatted_address']
-                }
-                print(f"Google geocoded '{address}' to {coords['lat']}, {coords['lng']}")
-                return coords
-    except Exception as e:
-        print(f"Google geocoding error for '{address}': {e}")
-    
-    return None
-
-def geocode_with_nominatim(address):
-    """Geocode using Nominatim (OpenStreetMap) service."""
-    try:
-        # Rate limiting for Nominatim (max 1 request per second)
-        time.sleep(1.1)
-        
-        params = {
-            'q': address,
-            'format': 'json',
-            'limit': 1,
-            'countrycodes': 'ph',  # Limit to Philippines
-            'bounded': 1,
-            'viewbox': '120.8,13.9,121.6,14.7',  # Laguna bounds (west,south,east,north)
-            'addressdetails': 1
-        }
-        
-        headers = {
-            'User-Agent': 'BreakFree-App/1.0'  # Required by Nominatim
-        }
-        
-        response = requests.get(NOMINATIM_BASE_URL, params=params, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data and len(data) > 0:
-                result = data[0]
-                coords = {
-                    'lat': round(float(result['lat']), 6),
-                    'lng': round(float(result['lon']), 6),
-                    'source': 'nominatim',
-                    'formatted_address': result.get('display_name', address)
-                }
-                print(f"Nominatim geocoded '{address}' to {coords['lat']}, {coords['lng']}")
-                return coords
-    except Exception as e:
-        print(f"Nominatim geocoding error for '{address}': {e}")
-    
-    return None
-
 def generate_fallback_coordinates():
     """Generate random coordinates within Laguna bounds as last resort."""
     import random
@@ -175,44 +200,21 @@ def generate_fallback_coordinates():
     }
 
 def geocode_with_laguna_api(address):
-    """Geocode using Laguna Location API for municipalities and barangays."""
+    """
+    Geocode offline from the Laguna gazetteer (municipality and barangay names).
+    Makes no network call; returns None when no Laguna place is recognized.
+    """
     try:
-        address_lower = address.lower()
-        
-        # Search for locations using the Laguna API
-        search_results = search_locations(address_lower)
-        
-        if search_results:
-            # Prioritize municipality matches over barangay matches
-            municipality_matches = [r for r in search_results if r.type == 'municipality']
-            barangay_matches = [r for r in search_results if r.type == 'barangay']
-            
-            # Use municipality match if available, otherwise use barangay match
-            best_match = municipality_matches[0] if municipality_matches else barangay_matches[0]
-            
+        match = resolve_address(address)
+        if match:
             coords = {
-                'lat': best_match.lat,
-                'lng': best_match.lng,
+                'lat': match.lat,
+                'lng': match.lng,
                 'source': 'laguna_api',
-                'formatted_address': f"{best_match.name}, Laguna"
+                'formatted_address': f"{match.name}, Laguna"
             }
-            print(f"Laguna API geocoded '{address}' to {coords['lat']}, {coords['lng']} ({best_match.type}: {best_match.name})")
+            print(f"Laguna API geocoded '{address}' to {coords['lat']}, {coords['lng']} ({match.type}: {match.name})")
             return coords
-        
-        # If no direct match found, try to find municipality by partial name matching
-        all_municipalities = get_all_municipalities()
-        for municipality in all_municipalities:
-            # Check if municipality name appears in the address
-            if municipality.name.lower() in address_lower:
-                coords = {
-                    'lat': municipality.lat,
-                    'lng': municipality.lng,
-                    'source': 'laguna_api',
-                    'formatted_address': f"{municipality.name}, Laguna"
-                }
-                print(f"Laguna API partial match geocoded '{address}' to {coords['lat']}, {coords['lng']} ({municipality.name})")
-                return coords
-                
     except Exception as e:
         print(f"Laguna API geocoding error for '{address}': {e}")
     
@@ -297,95 +299,46 @@ def login():
     return render_template('login.html')
 
 def get_aggregated_analytics():
-    """Get aggregated analytics data across all clients"""
+    """Get aggregated analytics data across all clients from the materialized rollup"""
     try:
-        # Fetch all clients from Firestore
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
-        
-        # Initialize data structures
-        sentiment_scores = []
-        domain_scores = {'emotional': [], 'cognitive': [], 'social': []}
-        all_behaviors = []
-        total_notes = 0
-        positive_improvements = 0
-        
-        # Process each client and their notes
-        client_count = 0
-        for client in clients:
-            client_id = client.id
-            client_data = client.to_dict()
-            client_count += 1
-            
-            # Get notes from client's subcollection
-            notes_ref = db.collection('clients').document(client_id).collection('notes')
-            notes = notes_ref.stream()
-            
-            note_count = 0
-            for note in notes:
-                note_count += 1
-                note_data = note.to_dict()
-                
-                # Check if note has already been analyzed (has sentiment data)
-                if 'sentiment' in note_data:
-                    total_notes += 1
-                    
-                    # Extract sentiment from pre-analyzed note
-                    sentiment = note_data.get('sentiment', {})
-                    sentiment_score = sentiment.get('score', 0)  # Use actual score from analysis
-                    
-                    # Convert sentiment score to 1-10 scale for display
-                    if sentiment_score == 1:  # positive
-                        display_score = 8.0
-                    elif sentiment_score == 0:  # neutral
-                        display_score = 5.0
-                    else:  # negative
-                        display_score = 2.0
-                    
-                    sentiment_scores.append(display_score)
-                    
-                    # Extract domain scores from pre-analyzed note
-                    tags = note_data.get('tags', {})
-                    for domain in ['emotional', 'cognitive', 'social']:
-                        domain_data = tags.get(domain, {})
-                        domain_score = domain_data.get('score', 0.0)
-                        # Convert to 1-10 scale
-                        display_domain_score = max(1.0, min(10.0, (domain_score + 1) * 5))
-                        domain_scores[domain].append(display_domain_score)
-                    
-                    # Extract behaviors (keywords) from pre-analyzed note
-                    keywords = note_data.get('keywords', [])
-                    all_behaviors.extend(keywords)
-                    
-                    # Check for positive improvement (sentiment > 6.0)
-                    if display_score > 6.0:
-                        positive_improvements += 1
-            
-            print(f"Client {client_id}: {note_count} notes found")
+        # A few small document reads instead of streaming every client's notes
+        rollup = firestore_schema.get_analytics_rollup()
+        if rollup is None:
+            # Built once in the background; the dashboard shows default data meanwhile
+            if firestore_schema.start_analytics_rollup_rebuild():
+                print("Analytics rollup not found. Building it from existing notes in the background...")
+            return get_default_analytics()
         
-        print(f"Analytics Summary: {client_count} clients processed, {total_notes} analyzed notes found")
+        total_notes = int(rollup.get('total_notes', 0))
         
         # If no notes found, return default data with a message
-        if total_notes == 0:
+        if total_notes <= 0:
             print("No analyzed notes found in database. Using default analytics data.")
             return get_default_analytics()
         
+        positive_improvements = int(rollup.get('positive_improvements', 0))
+        
         # Calculate aggregated metrics
-        avg_sentiment = sum(sentiment_scores) / len(sentiment_scores) if sentiment_scores else 5.0
-        improvement_percentage = (positive_improvements / total_notes * 100) if total_notes > 0 else 0
+        avg_sentiment = rollup.get('sentiment_display_sum', 0.0) / total_notes
+        improvement_percentage = positive_improvements / total_notes * 100
         
         # Calculate average domain scores
+        domain_sums = rollup.get('domain_display_sums', {})
         avg_domain_scores = {}
-        for domain, scores in domain_scores.items():
-            avg_domain_scores[domain] = sum(scores) / len(scores) if scores else 5.0
+        for domain in ['emotional', 'cognitive', 'social']:
+            avg_domain_scores[domain] = domain_sums.get(domain, 5.0 * total_notes) / total_notes
         
         # Get top behaviors
-        from collections import Counter
-        behavior_counts = Counter(all_behaviors)
-        top_behaviors = [{'text': behavior, 'count': count} for behavior, count in behavior_counts.most_common(15)]
+        keyword_counts = rollup.get('keyword_counts', {})
+        sorted_behaviors = sorted(
+            ((behavior, count) for behavior, count in keyword_counts.items() if count > 0),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        top_behaviors = [{'text': behavior, 'count': count} for behavior, count in sorted_behaviors[:15]]
         
         # Generate sentiment trend data (last 7 days)
-        sentiment_trend = generate_sentiment_trend()
+        sentiment_trend = generate_sentiment_trend(rollup)
         
         return {
             'sentiment_trend': sentiment_trend,
@@ -403,61 +356,15 @@ def get_aggregated_analytics():
         print(f"Error generating analytics: {e}")
         return get_default_analytics()
 
-def generate_sentiment_trend():
-    """Generate sentiment trend data for the last 7 days"""
+def generate_sentiment_trend(rollup=None):
+    """Generate sentiment trend data for the last 7 days from the rollup's daily buckets"""
     try:
-        # Get notes from the last 7 days
         from datetime import datetime, timedelta
         end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-        
-        # Fetch all clients and their notes
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
         
-        # Group by day
-        daily_sentiments = {}
-        for client in clients:
-            client_id = client.id
-            
-            # Get notes from client's subcollection
-            notes_ref = db.collection('clients').document(client_id).collection('notes')
-            notes = notes_ref.where('created_at', '>=', start_date).where('created_at', '<=', end_date).stream()
-            
-            for note in notes:
-                note_data = note.to_dict()
-                
-                # Check if note has already been analyzed
-                if 'sentiment' in note_data and 'created_at' in note_data:
-                    timestamp_str = note_data.get('created_at')
-                    if timestamp_str:
-                        try:
-                            # Parse timestamp
-                            if isinstance(timestamp_str, str):
-                                timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                            else:
-                                timestamp = timestamp_str
-                            
-                            day = timestamp.strftime('%Y-%m-%d')
-                            
-                            # Extract sentiment score
-                            sentiment = note_data.get('sentiment', {})
-                            sentiment_score = sentiment.get('score', 0)
-                            
-                            # Convert to display scale
-                            if sentiment_score == 1:  # positive
-                                display_score = 8.0
-                            elif sentiment_score == 0:  # neutral
-                                display_score = 5.0
-                            else:  # negative
-                                display_score = 2.0
-                            
-                            if day not in daily_sentiments:
-                                daily_sentiments[day] = []
-                            daily_sentiments[day].append(display_score)
-                        except Exception as e:
-                            print(f"Error parsing timestamp: {e}")
-                            continue
+        if rollup is None:
+            rollup = firestore_schema.get_analytics_rollup() or {}
+        daily_buckets = rollup.get('daily', {})
         
         # Calculate average sentiment for each day
         trend_data = []
@@ -468,8 +375,9 @@ def generate_sentiment_trend():
             day_name = (end_date - timedelta(days=6-i)).strftime('%a')
             labels.append(day_name)
             
-            if date in daily_sentiments:
-                avg_sentiment = sum(daily_sentiments[date]) / len(daily_sentiments[date])
+            bucket = daily_buckets.get(date, {})
+            if bucket.get('count', 0) > 0:
+                avg_sentiment = bucket['sentiment_display_sum'] / bucket['count']
                 trend_data.append(round(avg_sentiment, 1))
             else:
                 trend_data.append(5.0)  # Default neutral
@@ -525,25 +433,11 @@ def dashboard():
         return redirect(url_for('login'))
     
     try:
-        # Fetch clients from Firestore
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
-        
-        # Initialize counters
-        total_clients = 0
-        in_house_clients = 0
-        after_care_clients = 0
-        
-        # Count clients by care type
-        for client in clients:
-            client_data = client.to_dict()
-            total_clients += 1
-            
-            care_type = client_data.get('care_type', 'in_house').lower().replace(' ', '_')
-            if care_type in ['after_care', 'aftercare']:
-                after_care_clients += 1
-            else:
-                in_house_clients += 1
+        # Count clients by care type from the in-memory replica
+        care_type_counts = client_replica.care_type_counts()
+        in_house_clients = care_type_counts['in_house']
+        after_care_clients = care_type_counts['after_care']
+        total_clients = in_house_clients + after_care_clients
         
         # Role-based filtering: House workers only see in-house statistics
         user_role = session.get('role', '')
@@ -595,24 +489,22 @@ def create_sample_notes():
             "Client demonstrated strong problem-solving skills during cognitive exercises."
         ]
         
-        notes_created = 0
+        # Pick 2-3 sample notes for each client
+        import random
+        planned_notes = []
         for client in clients:
-            client_id = client.id
-            client_data = client.to_dict()
-            
-            # Create 2-3 sample notes for each client
-            import random
             num_notes = random.randint(2, 3)
-            selected_notes = random.sample(sample_notes, num_notes)
-            
-            for note_text in selected_notes:
-                # Analyze the note
-                analysis = nlp_analyzer.analyze_note(note_text)
-                
-                # Add to client's notes subcollection
-                notes_ref = db.collection('clients').document(client_id).collection('notes')
-                notes_ref.add(analysis)
-                notes_created += 1
+            for note_text in random.sample(sample_notes, num_notes):
+                planned_notes.append((client.id, note_text))
+        
+        # Analyze every note in one batched pass instead of one model call per note
+        analyses = nlp_analyzer.analyze_notes_batch([note_text for _, note_text in planned_notes])
+        
+        # Batched writes; note counts and the analytics rollup are incremented once per batch
+        outcome = firestore_schema.add_notes_to_clients(
+            [(client_id, analysis) for (client_id, _), analysis in zip(planned_notes, analyses)]
+        )
+        notes_created = outcome['created']
         
         return jsonify({
             'success': True, 
@@ -624,6 +516,25 @@ def create_sample_notes():
         print(f"Error creating sample notes: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analytics/rollup/rebuild', methods=['POST'])
+@admin_required
+def rebuild_analytics_rollup():
+    """Recompute the dashboard analytics rollup from all notes (repair/backfill)"""
+    try:
+        rollup = firestore_schema.rebuild_analytics_rollup()
+        if rollup is None:
+            return jsonify({'success': False, 'error': 'Failed to rebuild analytics rollup (or another rebuild is running)'}), 500
+        
+        return jsonify({
+            'success': True,
+            'message': f"Rebuilt analytics rollup from {rollup['total_notes']} notes",
+            'total_notes': rollup['total_notes']
+        })
+        
+    except Exception as e:
+        print(f"Error rebuilding analytics rollup: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/check_in')
 @role_required(['admin', 'psychometrician', 'house_worker'])
 def check_in():
@@ -909,27 +820,32 @@ def clients():
         
         # Get pagination parameters
         page = request.args.get('page', 1, type=int)
-        per_page = 10  # Maximum 10 clients per page
+        page_token = request.args.get('page_token')
+        per_page = client_paginator.per_page  # Maximum 10 clients per page
+        status_filter = request.args.get('status') if request.args.get('status') in LISTED_STATUSES else None
+        care_type_filter = request.args.get('care_type') if request.args.get('care_type') in ('in_house', 'after_care') else None
         print(f"Pagination: page {page}, per_page {per_page}")
         
-        # Fetch clients from Firestore
-        clients_ref = db.collection('clients')
-        all_clients_data = []
-        print("Starting to fetch clients from Firestore...")
+        # Role-based filtering: House workers can only see in-house clients
+        if session.get('role', '') == 'house_worker':
+            care_type_filter = 'in_house'
         
-        print("Fetching clients stream...")
-        clients_stream = clients_ref.stream()
-        print("Got clients stream, iterating...")
+        # Served from the in-memory replica when it is enabled; otherwise only this
+        # page's documents are read, with filters and name ordering run in Firestore
+        if client_replica.enabled:
+            page_docs, pagination = client_replica.page(page, per_page, care_type=care_type_filter, status=status_filter)
+        else:
+            page_docs, pagination = client_paginator.page(page, page_token, care_type=care_type_filter, status=status_filter)
+        pagination['filters'] = {'status': status_filter, 'care_type': care_type_filter}
         
-        for client in clients_stream:
-            client_dict = client.to_dict()
-            client_dict['id'] = client.id
-            print(f"Processing client: {client_dict.get('name', 'Unknown')} (ID: {client.id})")
+        clients_data = []
+        for client_id, client_dict in page_docs:
+            client_dict['id'] = client_id
             
             # Ensure ALL required fields exist with proper defaults
             # Skip clients with None names or fix them
             if client_dict.get('name') is None or client_dict.get('name') == '':
-                print(f"Skipping client with None/empty name (ID: {client.id})")
+                print(f"Skipping client with None/empty name (ID: {client_id})")
                 continue
             
             # Basic fields with defaults
@@ -991,104 +907,69 @@ def clients():
             if 'rehabilitation_goals' not in client_dict:
                 client_dict['rehabilitation_goals'] = None
 
-            # Normalize care type
-            if 'care_type' not in client_dict or client_dict['care_type'] is None:
-                client_dict['care_type'] = 'in_house'  # Default to in_house
-            else:
-                care_type = str(client_dict['care_type']).lower().replace(' ', '_')
-                if care_type in ['after_care', 'aftercare']:
-                    client_dict['care_type'] = 'after_care'
-                else:
-                    client_dict['care_type'] = 'in_house'
-
-            # Normalize status value
-            if 'status' in client_dict and client_dict['status'] is not None:
-                status = str(client_dict['status']).lower()
-                if status == 'active':
-                    client_dict['status'] = 'active'
-                elif status == 'relapsed':
-                    client_dict['status'] = 'relapsed'
-                elif status in ['review', 'under review']:
-                    client_dict['status'] = 'review'
-                elif status == 'pending':
-                    client_dict['status'] = 'pending'
-                elif status == 'rejected':
-                    client_dict['status'] = 'rejected'
-                elif status == 'completed':
-                    client_dict['status'] = 'completed'
-                elif status == 'ready_for_aftercare':
-                    client_dict['status'] = 'ready_for_aftercare'
-                elif status == 'pending_aftercare':
-                    client_dict['status'] = 'pending_aftercare'
-                else:
-                    client_dict['status'] = 'active'  # Default status
-            else:
-                client_dict['status'] = 'active'  # Default if no status
+            # Normalize care type and status value
+            client_dict['care_type'] = normalize_care_type(client_dict.get('care_type'))
+            client_dict['status'] = normalize_status(client_dict.get('status'))
             
-            # Only add non-archived clients that are NOT pending (but include rejected clients)
-            archived = client_dict.get('archived', False)
-            status = client_dict.get('status', 'active')
-            print(f"Client {client_dict.get('name', 'Unknown')}: archived = {archived}, status = {status}")
-            if not archived and status not in ['pending', 'pending_aftercare']:
-                all_clients_data.append(client_dict)
-                print(f"Added client {client_dict.get('name', 'Unknown')} to display list")
-
-        # Role-based filtering: House workers can only see in-house clients
-        user_role = session.get('role', '')
-        if user_role == 'house_worker':
-            print("House worker detected - filtering to show only in-house clients")
-            all_clients_data = [client for client in all_clients_data if client.get('care_type') != 'after_care']
-            print(f"After filtering: {len(all_clients_data)} in-house clients")
-
-        # Sort clients by name for consistent pagination
-        all_clients_data.sort(key=lambda x: x.get('name', '').lower())
-        
-        # Calculate pagination
-        total_clients = len(all_clients_data)
-        total_pages = (total_clients + per_page - 1) // per_page  # Ceiling division
-        print(f"Total clients: {total_clients}, Total pages: {total_pages}")
-        
-        # Calculate start and end indices for current page
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        
-        # Get clients for current page
-        clients_data = all_clients_data[start_idx:end_idx]
-        print(f"Displaying clients {start_idx + 1} to {min(end_idx, total_clients)}")
-        
-        # Create pagination info
-        pagination = {
-            'page': page,
-            'per_page': per_page,
-            'total': total_clients,
-            'total_pages': total_pages,
-            'has_prev': page > 1,
-            'has_next': page < total_pages,
-            'prev_num': page - 1 if page > 1 else None,
-            'next_num': page + 1 if page < total_pages else None,
-            'start_record': start_idx + 1 if total_clients > 0 else 0,
-            'end_record': min(end_idx, total_clients)
-        }
+            clients_data.append(client_dict)
 
-        print(f"Pagination: Page {page}/{total_pages}, showing {len(clients_data)} of {total_clients} clients")
+        print(f"Pagination: Page {pagination['page']}/{pagination['total_pages']}, showing {len(clients_data)} of {pagination['total']} clients")
     except Exception as e:
         print(f"Error fetching clients: {e}")
         clients_data = []
         pagination = {
             'page': 1,
-            'per_page': per_page,
+            'per_page': client_paginator.per_page,
             'total': 0,
             'total_pages': 0,
             'has_prev': False,
             'has_next': False,
             'prev_num': None,
             'next_num': None,
+            'prev_token': None,
+            'next_token': None,
             'start_record': 0,
-            'end_record': 0
+            'end_record': 0,
+            'filters': {}
         }
     
     return render_template('clients.html', email=session['email'], clients=clients_data, pagination=pagination, active_tab='clients')
 
+@app.route('/api/clients/backfill-sort-keys', methods=['POST'])
+@admin_required
+def backfill_client_sort_keys():
+    """Store name_lower and canonical status/care_type on older clients so they appear on the paged /clients list"""
+    try:
+        summary = client_paginator.backfill_sort_keys()
+        return jsonify({
+            'success': summary['failed'] == 0,
+            'message': f"Updated {summary['succeeded']} clients",
+            'results': summary
+        })
+    except Exception as e:
+        print(f"Error backfilling client sort keys: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/replica/stats')
+@admin_required
+def get_replica_stats():
+    """Listener health, staleness and memory use of the in-memory clients/users replicas"""
+    try:
+        return jsonify({
+            'success': True,
+            'replicas': {
+                replica.collection: {
+                    'stats': replica.get_stats(),
+                    'memory': replica.memory_report()
+                }
+                for replica in (client_replica, user_replica)
+            },
+            'client_search': client_search_index.get_stats()
+        })
+    except Exception as e:
+        print(f"Error fetching replica stats: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/pending-clients')
 @role_required(['admin'])
 def pending_clients():
@@ -1099,11 +980,10 @@ def pending_clients():
         page = request.args.get('page', 1, type=int)
         per_page = 10
         
-        # Fetch pending clients from Firestore
-        clients_ref = db.collection('clients')
+        # Read pending clients from the in-memory replica
         all_pending_clients = []
         
-        clients_stream = clients_ref.stream()
+        clients_stream = client_replica.documents()
         
         for client in clients_stream:
             client_dict = client.to_dict()
@@ -1281,15 +1161,17 @@ def add_client():
             client_data['rehabilitation_goals'] = request.form.get('rehabilitation_goals')
             client_data['rehabilitation_questions'] = request.form.get('rehabilitation_questions')
 
-            # Ensure clientId is unique
-            try:
-                existing_iter = db.collection('clients').where('clientId', '==', client_id).limit(1).stream()
-                existing_list = [doc for doc in existing_iter]
-                if existing_list:
-                    return jsonify({'success': False, 'error': 'Client ID already exists. Please choose another.'}), 409
-            except Exception as e:
-                # Log but do not block creation in case of transient read error
-                print(f"Warning: could not verify clientId uniqueness: {e}")
+            # Custom client IDs must be unique; numeric ones are assigned by the allocator below
+            client_id = (client_data.get('clientId') or '').strip()
+            if client_id and not client_id.isdigit():
+                try:
+                    existing_iter = db.collection('clients').where('clientId', '==', client_id).limit(1).stream()
+                    existing_list = [doc for doc in existing_iter]
+                    if existing_list:
+                        return jsonify({'success': False, 'error': 'Client ID already exists. Please choose another.'}), 409
+                except Exception as e:
+                    # Log but do not block creation in case of transient read error
+                    print(f"Warning: could not verify clientId uniqueness: {e}")
 
             # Validate phone numbers (more flexible)
             phone = client_data['phone'].replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
@@ -1305,16 +1187,12 @@ def add_client():
             client_data['phone'] = phone
             client_data['emergency_contact']['phone'] = emergency_phone
 
-            # Validate client credentials (basic)
-            client_id = (client_data.get('clientId') or '').strip()
-            # Auto-generate client_id if missing
-            if not client_id:
-                try:
-                    total_existing = sum(1 for _ in db.collection('clients').stream())
-                    client_id = str(total_existing + 1)
-                    client_data['clientId'] = client_id
-                except Exception as e:
-                    print(f"Error auto-generating clientId: {e}")
+            # Reserve the next sequential ID unless a custom one was given; the form's
+            # read-only suggested ID is only a preview, so concurrent intakes cannot collide
+            previewed_client_id = client_id
+            if not client_id or client_id.isdigit():
+                client_id = client_id_allocator.allocate()
+                client_data['clientId'] = client_id
             # Password field removed - no longer required
 
             # Geocode the address automatically
@@ -1322,20 +1200,14 @@ def add_client():
             if address and address != 'No address provided':
                 print(f"Geocoding address for new client {client_data['name']}: {address}")
                 try:
-                    coordinates = geocode_address(address)
+                    # Resolve from the offline Laguna gazetteer first, then the geocoding providers
+                    coordinates = geocode_with_laguna_api(address) or geocode_address(address)
                     if coordinates:
                         # Generate offset coordinates to ensure unique positioning
                         client_data['coordinates'] = generate_offset_coordinates(coordinates, client_data.get('clientId', client_data.get('name', 'unknown')))
                         print(f"Successfully geocoded address with offset: {client_data['coordinates']['lat']}, {client_data['coordinates']['lng']} (source: {client_data['coordinates']['source']})")
                     else:
                         print(f"Failed to geocode address: {address}")
-                        # Try manual mapping using Laguna API
-                        manual_coords = geocode_with_laguna_api(address)
-                        
-                        if manual_coords:
-                            # Generate offset coordinates to ensure unique positioning
-                            client_data['coordinates'] = generate_offset_coordinates(manual_coords, client_data.get('clientId', client_data.get('name', 'unknown')))
-                            print(f"Used Laguna API coordinates with offset: {client_data['coordinates']['lat']}, {client_data['coordinates']['lng']}")
                 except Exception as geocode_error:
                     print(f"Error geocoding address: {geocode_error}")
                     # Continue without coordinates rather than failing the entire operation
@@ -1355,8 +1227,12 @@ def add_client():
                     # Store the relative path in client data
                     client_data['image_url'] = os.path.join('uploads', 'client_images', unique_filename)
 
+            # Sort key and canonical filter values used by the paged clients list
+            client_data.update(sort_key_fields(client_data))
+
             # Add to Firestore
             new_client = db.collection('clients').add(client_data)
+            record_client_write(new_client[1].id, client_data)
             
             # Log client creation activity
             log_activity(
@@ -1371,9 +1247,14 @@ def add_client():
             
             response_data = {
                 'success': True, 
-                'message': 'Client assessment submitted successfully and is pending admin approval',
-                'client_id': new_client[1].id
+                'message': f'Client assessment submitted successfully and is pending admin approval (Client ID: {client_id})',
+                'client_id': new_client[1].id,
+                'clientId': client_id
             }
+            if previewed_client_id and previewed_client_id != client_id:
+                # Another intake took the previewed ID first; say which one was assigned instead
+                response_data['clientId_changed'] = True
+                response_data['message'] += f" (ID {previewed_client_id} was taken by another intake, so {client_id} was assigned)"
             
             # Add coordinates info to response
             if 'coordinates' in client_data:
@@ -1390,11 +1271,9 @@ def add_client():
             traceback.print_exc()
             return jsonify({'success': False, 'error': str(e)}), 400
 
-    # GET: suggest next client ID based on current total count
+    # GET: preview the next ID from the counter (reserved only when the form is submitted)
     try:
-        clients_ref = db.collection('clients')
-        total = sum(1 for _ in clients_ref.stream())
-        suggested_client_id = str(total + 1)
+        suggested_client_id = client_id_allocator.peek()
     except Exception as e:
         print(f"Error counting clients for suggested ID: {e}")
         suggested_client_id = ''
@@ -1440,6 +1319,7 @@ def flag_client(client_id):
 
         # Update client document
         client_ref.update({'flags': flags})
+        record_client_write(client_id, {'flags': flags})
 
         return jsonify({'success': True, 'message': 'Flag updated successfully'})
     except Exception as e:
@@ -1458,11 +1338,16 @@ def archive_client(client_id):
             return jsonify({'success': False, 'error': 'Client not found'}), 404
         
         # Update the client to archived
-        client_ref.update({
+        changes = {
             'archived': True,
             'archived_at': datetime.now(),
             'archived_by': session['user_id']
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
+        
+        # Archived clients are excluded from dashboard analytics and cross-client note queries
+        firestore_schema.set_client_notes_archived(client_id, True)
         
         # Log client archiving activity
         log_activity(
@@ -1499,11 +1384,13 @@ def approve_client(client_id):
             return jsonify({'success': False, 'error': 'Client is not pending approval'}), 400
         
         # Update the client status to active
-        client_ref.update({
+        changes = {
             'status': 'active',
             'approved_at': datetime.now(),
             'approved_by': session['user_id']
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
         
         # Log client approval activity
         log_activity(
@@ -1543,12 +1430,14 @@ def reject_client(client_id):
         rejection_reason = request.json.get('reason', 'No reason provided')
         
         # Update the client status to rejected
-        client_ref.update({
+        changes = {
             'status': 'rejected',
             'rejected_at': datetime.now(),
             'rejected_by': session['user_id'],
             'rejection_reason': rejection_reason
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
         
         # Log client rejection activity
         log_activity(
@@ -1588,11 +1477,13 @@ def send_to_aftercare(client_id):
             return jsonify({'success': False, 'error': 'Client treatment must be completed first'}), 400
         
         # Update client status to pending aftercare approval
-        client_ref.update({
+        changes = {
             'status': 'pending_aftercare',
             'aftercare_request_date': datetime.now(),
             'aftercare_requested_by': session['user_id']
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
         
         return jsonify({
             'success': True, 
@@ -1621,12 +1512,14 @@ def approve_aftercare(client_id):
             return jsonify({'success': False, 'error': 'Client is not pending aftercare approval'}), 400
         
         # Update client status to approved and transfer to aftercare
-        client_ref.update({
+        changes = {
             'status': 'active',
             'care_type': 'after_care',
             'aftercare_approved_date': datetime.now(),
             'aftercare_approved_by': session['user_id']
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
         
         return jsonify({
             'success': True, 
@@ -1658,12 +1551,14 @@ def reject_aftercare(client_id):
         rejection_reason = request.json.get('reason', 'No reason provided')
         
         # Update client status back to completed (rejected aftercare)
-        client_ref.update({
+        changes = {
             'status': 'completed',
             'aftercare_rejected_date': datetime.now(),
             'aftercare_rejected_by': session['user_id'],
             'aftercare_rejection_reason': rejection_reason
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
         
         return jsonify({
             'success': True, 
@@ -1720,11 +1615,13 @@ def complete_treatment(client_id):
             }), 400
         
         # Update client status to completed
-        client_ref.update({
+        changes = {
             'status': 'completed',
             'completion_date': datetime.now(),
             'completed_by': session['user_id']
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
         
         return jsonify({
             'success': True, 
@@ -1923,7 +1820,15 @@ def update_client_fields(client_id):
         if 'date_of_birth' in payload and 'birthdate' not in payload:
             payload['birthdate'] = payload.pop('date_of_birth')
 
+        # Keep the paged list's sort key and filter values in step
+        paged_fields = sort_key_fields({**doc.to_dict(), **payload})
+        for field in ('name', 'care_type', 'status'):
+            if field in payload:
+                key = 'name_lower' if field == 'name' else field
+                payload[key] = paged_fields[key]
+
         client_ref.update(payload)
+        record_client_write(client_id, payload)
         return jsonify({'success': True, 'updated': list(payload.keys())})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1979,9 +1884,8 @@ def activity_log():
         logs_for_page = all_logs[start_idx:end_idx]
         
         # Get unique users and actions for filter dropdowns
-        users_ref = db.collection('users')
         all_users = []
-        for user in users_ref.stream():
+        for user in user_replica.documents():
             user_data = user.to_dict()
             all_users.append(user_data.get('email', ''))
         
@@ -2040,11 +1944,10 @@ def activity_log():
 @role_required(['admin', 'psychometrician', 'house_worker'])
 def settings():
     try:
-        # Get all users from Firestore (only for admin and psychometrician)
+        # Get all users from the in-memory replica (only for admin and psychometrician)
         users = []
         if session.get('role') in ['admin', 'psychometrician']:
-            users_ref = db.collection('users')
-            for user in users_ref.stream():
+            for user in user_replica.documents():
                 user_data = user.to_dict()
                 user_data['id'] = user.id
                 users.append(user_data)
@@ -2059,10 +1962,9 @@ def settings():
 def get_users():
     """API endpoint to get all users"""
     try:
-        users_ref = db.collection('users')
         users = []
         
-        for user in users_ref.stream():
+        for user in user_replica.documents():
             user_data = user.to_dict()
             user_data['id'] = user.id
             # Don't include sensitive data like passwords
@@ -2266,9 +2168,8 @@ def logout():
 @role_required(['admin', 'facilitator', 'caseworker'])
 def get_client_locations():
     try:
-        # Fetch clients from Firestore
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
+        # Read clients from the in-memory replica
+        clients = client_replica.documents(archived=False)
         
         clients_data = []
         debug_info = []  # For debugging
@@ -2358,14 +2259,129 @@ def get_client_locations():
         traceback.print_exc()  # Print full error traceback
         return jsonify([])
 
+@app.route('/api/clients/<client_id>/location')
+@role_required(['admin', 'facilitator', 'caseworker'])
+def get_client_location(client_id):
+    """Map details of one client, fetched when its marker popup is opened"""
+    try:
+        client = client_replica.get(client_id)
+        client_dict = client.to_dict() if client is not None else {}
+        point = map_point(client_id, client_dict) if client is not None else None
+
+        # House workers can only see in-house clients
+        if point is None or (session.get('role', '') == 'house_worker' and point['care_type'] == 'after_care'):
+            return jsonify({'success': False, 'error': 'Client location not found'}), 404
+
+        raw_coordinates = client_dict.get('coordinates')
+        if isinstance(raw_coordinates, str):
+            raw_coordinates = json.loads(raw_coordinates)
+        coordinates = {'lat': point['lat'], 'lng': point['lng']}
+        if raw_coordinates.get('offset_applied'):
+            coordinates['offset_applied'] = True
+
+        location = {
+            'id': client_id,
+            'name': point['name'],
+            'address': client_dict.get('address', 'No address provided'),
+            'coordinates': coordinates,
+            'care_type': point['care_type'],
+            'status': point['status'],
+            'coordinate_source': point['source']
+        }
+        if 'formatted_address' in raw_coordinates:
+            location['formatted_address'] = raw_coordinates['formatted_address']
+
+        return jsonify({'success': True, 'client': location})
+
+    except Exception as e:
+        print(f"Error fetching client location: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _map_viewport_args():
+    """
+    Parse the viewport query shared by the cluster and heat-map endpoints
+
+    Returns:
+        tuple: (bbox, zoom, care_types, statuses, error) where error is a
+        message when the parameters are invalid
+    """
+    try:
+        bbox = tuple(float(value) for value in request.args.get('bbox', '').split(','))
+        if len(bbox) != 4:
+            raise ValueError
+    except ValueError:
+        return None, None, None, None, 'bbox must be west,south,east,north'
+    zoom = request.args.get('zoom', type=int)
+    if zoom is None:
+        return None, None, None, None, 'zoom is required'
+
+    care_type = request.args.get('care_type', 'all')
+    status = request.args.get('status', 'all')
+    care_types = None if care_type == 'all' else {care_type}
+    statuses = None if status == 'all' else {status}
+
+    # House workers can only see in-house clients
+    if session.get('role', '') == 'house_worker':
+        care_types = (care_types or {'in_house'}) & {'in_house'}
+
+    return bbox, zoom, care_types, statuses, None
+
+@app.route('/api/clients/clusters')
+@role_required(['admin', 'facilitator', 'caseworker'])
+def get_client_clusters():
+    """
+    Clustered client locations for a map viewport
+
+    Query parameters:
+        bbox: west,south,east,north (Leaflet's toBBoxString order)
+        zoom: Map zoom level
+        care_type / status: Optional filters ('all' or omitted for every value)
+    """
+    bbox, zoom, care_types, statuses, error = _map_viewport_args()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    try:
+        client_map_index.ensure_fresh()
+        results = client_map_index.clusters(bbox, zoom, care_types=care_types, statuses=statuses)
+        return jsonify({
+            'success': True,
+            'zoom': zoom,
+            'clusters': results,
+            'total': sum(result.get('count', 1) for result in results)
+        })
+    except Exception as e:
+        print(f"Error clustering client locations: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/clients/heatmap')
+@role_required(['admin', 'facilitator', 'caseworker'])
+def get_client_heatmap():
+    """
+    Heat-map intensities for a map viewport from the precomputed density grid
+
+    Query parameters are the same as /api/clients/clusters; the response lists
+    [lat, lng, count] for each non-empty cell at the resolution for the zoom
+    """
+    bbox, zoom, care_types, statuses, error = _map_viewport_args()
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+
+    try:
+        client_map_index.ensure_fresh()
+        tile = density_grid.tile(bbox, zoom, care_types=care_types, statuses=statuses)
+        return jsonify({'success': True, 'zoom': zoom, **tile})
+    except Exception as e:
+        print(f"Error building heat map: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # Add a new endpoint for background geocoding
 @app.route('/api/clients/geocode-missing', methods=['POST'])
 @role_required(['admin', 'facilitator'])
 def geocode_missing_coordinates():
     try:
         # Get clients that need geocoding
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
+        clients = client_replica.documents(archived=False)
         
         to_geocode = []
         for client in clients:
@@ -2401,18 +2417,22 @@ def geocode_missing_coordinates():
         from threading import Thread
         
         def background_geocoding():
+            # Each distinct address is resolved once; repeats come from the cache
+            coords_by_address = geocode_addresses([client['address'] for client in to_geocode])
+            
             for client in to_geocode:
                 try:
-                    coords = geocode_address(client['address'])
+                    coords = coords_by_address.get(client['address'])
                     if coords:
                         client_ref = db.collection('clients').document(client['id'])
-                        client_ref.update({
+                        changes = {
                             'coordinates': coords,
                             'coordinates_updated_at': datetime.now(),
                             'coordinates_updated_by': 'system_geocoder'
-                        })
+                        }
+                        client_ref.update(changes)
+                        record_client_write(client['id'], changes)
                         print(f"Geocoded {client['name']}: {coords['lat']}, {coords['lng']} (source: {coords['source']})")
-                    time.sleep(1)  # Rate limiting
                 except Exception as e:
                     print(f"Error geocoding {client['name']}: {e}")
         
@@ -2460,11 +2480,13 @@ def update_client_coordinates(client_id):
             'lng': lng
         }
         
-        client_ref.update({
+        changes = {
             'coordinates': coordinates,
             'coordinates_updated_at': datetime.now(),
             'coordinates_updated_by': session['user_id']
-        })
+        }
+        client_ref.update(changes)
+        record_client_write(client_id, changes)
         
         return jsonify({
             'success': True,
@@ -2500,6 +2522,7 @@ def geocode_all_clients():
             'errors': []
         }
         
+        to_geocode = []
         for client in clients:
             if results['total_processed'] >= max_requests:
                 break
@@ -2529,35 +2552,43 @@ def geocode_all_clients():
                     needs_geocoding = True
             
             if needs_geocoding:
-                print(f"Geocoding {name}: {address}")
-                
-                try:
-                    geocoded_coords = geocode_address(address)
-                    
-                    if geocoded_coords:
-                        # Save to database
-                        client_ref = db.collection('clients').document(client_id)
-                        update_data = {
-                            'coordinates': geocoded_coords,
-                            'coordinates_updated_at': datetime.now(),
-                            'coordinates_updated_by': session['user_id']
-                        }
-                        client_ref.update(update_data)
-                        
-                        results['geocoded'] += 1
-                        print(f"Successfully geocoded {name}: {geocoded_coords['lat']}, {geocoded_coords['lng']} (source: {geocoded_coords['source']})")
-                    else:
-                        results['failed'] += 1
-                        results['errors'].append(f"Failed to geocode {name}: {address}")
-                        
-                except Exception as e:
-                    results['failed'] += 1
-                    error_msg = f"Error geocoding {name}: {str(e)}"
-                    results['errors'].append(error_msg)
-                    print(error_msg)
+                to_geocode.append((client_id, name, address))
             else:
                 results['cached'] += 1
         
+        # Each distinct address is resolved once; repeats come from the cache
+        coords_by_address = geocode_addresses([address for _, _, address in to_geocode])
+        
+        writer = BulkWriter()
+        names = {}
+        for client_id, name, address in to_geocode:
+            print(f"Geocoding {name}: {address}")
+            geocoded_coords = coords_by_address.get(address)
+            
+            if geocoded_coords:
+                writer.update(db.collection('clients').document(client_id), {
+                    'coordinates': geocoded_coords,
+                    'coordinates_updated_at': datetime.now(),
+                    'coordinates_updated_by': session['user_id']
+                }, key=client_id)
+                names[client_id] = (name, geocoded_coords)
+            else:
+                results['failed'] += 1
+                results['errors'].append(f"Failed to geocode {name}: {address}")
+        
+        # Save to database in batches
+        write_result = writer.flush()
+        for client_id in write_result.succeeded:
+            name, geocoded_coords = names[client_id]
+            record_client_write(client_id, {'coordinates': geocoded_coords})
+            results['geocoded'] += 1
+            print(f"Successfully geocoded {name}: {geocoded_coords['lat']}, {geocoded_coords['lng']} (source: {geocoded_coords['source']})")
+        for client_id, error in write_result.failed.items():
+            results['failed'] += 1
+            error_msg = f"Error geocoding {names[client_id][0]}: {error}"
+            results['errors'].append(error_msg)
+            print(error_msg)
+        
         return jsonify({
             'success': True,
             'message': f"Geocoding completed. Processed {results['total_processed']} clients.",
@@ -2587,6 +2618,8 @@ def update_all_client_coordinates():
         clients_ref = db.collection('clients')
         clients = clients_ref.where('archived', '==', False).stream()
         
+        writer = BulkWriter()
+        planned = {}
         for client in clients:
             try:
                 client_data = client.to_dict()
@@ -2600,24 +2633,64 @@ def update_all_client_coordinates():
                 # Generate new offset coordinates
                 new_coordinates = generate_offset_coordinates(coordinates, client_id)
                 
-                # Update the client
-                client_ref = db.collection('clients').document(client_id)
-                client_ref.update({
+                # Queue the client update
+                writer.update(client.reference, {
                     'coordinates': new_coordinates
-                })
-                
-                results['updated'] += 1
-                results['details'].append(f"Updated {client_data.get('name', 'Unknown')}: {new_coordinates['lat']}, {new_coordinates['lng']}")
+                }, key=client_id)
+                planned[client_id] = (client_data.get('name', 'Unknown'), new_coordinates)
                 
             except Exception as e:
                 results['errors'] += 1
                 results['details'].append(f"Error updating {client_data.get('name', 'Unknown')}: {str(e)}")
         
+        write_result = writer.flush()
+        for client_id in write_result.succeeded:
+            name, new_coordinates = planned[client_id]
+            record_client_write(client_id, {'coordinates': new_coordinates})
+            results['updated'] += 1
+            results['details'].append(f"Updated {name}: {new_coordinates['lat']}, {new_coordinates['lng']}")
+        for client_id, error in write_result.failed.items():
+            results['errors'] += 1
+            results['details'].append(f"Error updating {planned[client_id][0]}: {error}")
+        
         return jsonify(results)
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/clients/search', methods=['GET'])
+@role_required(['admin', 'psychometrician', 'house_worker'])
+def search_clients():
+    """
+    Typeahead search over client name, clientId, barangay and municipality
+
+    Query parameters:
+        q: Search text (every word must match the start or a fragment of a field)
+        limit: Maximum number of results (default 10, at most 50)
+        all_statuses: 'true' to include pending and rejected clients
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': True, 'clients': []})
+
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    include_all = request.args.get('all_statuses', 'false').lower() == 'true'
+
+    # Role-based filtering: House workers can only see in-house clients
+    care_type = 'in_house' if session.get('role', '') == 'house_worker' else None
+
+    try:
+        results = client_search_index.search(
+            query,
+            limit=limit,
+            care_type=care_type,
+            exclude_statuses=None if include_all else ['pending', 'rejected']
+        )
+        return jsonify({'success': True, 'clients': results})
+    except Exception as e:
+        print(f"Error searching clients: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/clients/list', methods=['GET'])
 @role_required(['admin', 'psychometrician', 'house_worker'])
 def get_clients_list():
@@ -2626,11 +2699,10 @@ def get_clients_list():
     Returns only active, non-archived clients.
     """
     try:
-        # Fetch clients from Firestore
-        clients_ref = db.collection('clients')
+        # Read clients from the in-memory replica
         clients_data = []
         
-        for client in clients_ref.stream():
+        for client in client_replica.documents():
             client_dict = client.to_dict()
             client_dict['id'] = client.id
             
@@ -2764,10 +2836,12 @@ def fix_client_coordinates():
                 
                 if needs_fix:
                     client_ref = db.collection('clients').document(client.id)
-                    client_ref.update({
+                    changes = {
                         'coordinates': fixed_coordinates,
                         'coordinates_updated_at': datetime.now()
-                    })
+                    }
+                    client_ref.update(changes)
+                    record_client_write(client.id, changes)
                     fixed_count += 1
                     
             except Exception as e:
@@ -2839,11 +2913,13 @@ def set_client_coordinates():
                 if matched_coords:
                     # Update client with coordinates
                     client_ref = db.collection('clients').document(client_id)
-                    client_ref.update({
+                    changes = {
                         'coordinates': matched_coords,
                         'coordinates_updated_at': datetime.now(),
                         'coordinates_updated_by': session.get('user_id', 'manual_update')
-                    })
+                    }
+                    client_ref.update(changes)
+                    record_client_write(client_id, changes)
                     updated_count += 1
                     print(f"Updated coordinates for {name}: {matched_coords}")
         
@@ -2878,7 +2954,28 @@ def force_geocode_all():
             'details': []
         }
         
-        for client in clients:
+        client_docs = list(clients)
+        
+        # Addresses naming a Laguna municipality/barangay resolve offline; only
+        # the rest go to the geocoding providers (each distinct address once)
+        coords_by_address = {}
+        unresolved = []
+        for client in client_docs:
+            address = client.to_dict().get('address', '').strip()
+            if not address or address == 'No address provided' or address in coords_by_address:
+                continue
+            coords_by_address[address] = geocode_with_laguna_api(address)
+            if not coords_by_address[address]:
+                unresolved.append(address)
+        
+        try:
+            coords_by_address.update(geocode_addresses(unresolved))
+        except Exception as e:
+            print(f"Batch geocoding error: {e}")
+        
+        writer = BulkWriter()
+        planned = {}
+        for client in client_docs:
             client_dict = client.to_dict()
             client_id = client.id
             name = client_dict.get('name', 'Unknown')
@@ -2892,128 +2989,31 @@ def force_geocode_all():
             
             print(f"Force geocoding {name}: {address}")
             
-            # Try geocoding first
-            coordinates = None
-            try:
-                coordinates = geocode_address(address)
-            except Exception as e:
-                print(f"Geocoding error for {name}: {e}")
-            
-            # If geocoding fails, try manual mapping with accurate coordinates
-            if not coordinates:
-                address_lower = address.lower()
-                
-                # PRIORITY 1: Municipality/City matching (highest priority)
-                # Cities
-                if 'calamba' in address_lower:
-                    coordinates = {'lat': 14.1877, 'lng': 121.1251, 'source': 'manual'}
-                elif 'san pablo' in address_lower and 'laguna' in address_lower:
-                    coordinates = {'lat': 14.0683, 'lng': 121.3251, 'source': 'manual'}
-                elif 'santa rosa' in address_lower and 'laguna' in address_lower:
-                    coordinates = {'lat': 14.3119, 'lng': 121.1114, 'source': 'manual'}
-                elif 'binan' in address_lower or 'biñan' in address_lower:
-                    coordinates = {'lat': 14.3306, 'lng': 121.0856, 'source': 'manual'}
-                elif 'cabuyao' in address_lower:
-                    coordinates = {'lat': 14.2471, 'lng': 121.1367, 'source': 'manual'}
-                elif 'san pedro' in address_lower and 'laguna' in address_lower:
-                    coordinates = {'lat': 14.3589, 'lng': 121.0476, 'source': 'manual'}
-                
-                # Municipalities - Northern Laguna
-                elif 'siniloan' in address_lower:
-                    coordinates = {'lat': 14.4167, 'lng': 121.4500, 'source': 'manual'}
-                elif 'famy' in address_lower:
-                    coordinates = {'lat': 14.4333, 'lng': 121.4500, 'source': 'manual'}
-                elif 'mabitac' in address_lower:
-                    coordinates = {'lat': 14.4500, 'lng': 121.4333, 'source': 'manual'}
-                elif 'sta maria' in address_lower or 'santa maria' in address_lower:
-                    coordinates = {'lat': 14.4667, 'lng': 121.4167, 'source': 'manual'}
-                elif 'magsaysay' in address_lower:
-                    coordinates = {'lat': 14.4833, 'lng': 121.4000, 'source': 'manual'}
-                elif 'sta catalina' in address_lower or 'santa catalina' in address_lower:
-                    coordinates = {'lat': 14.5000, 'lng': 121.3833, 'source': 'manual'}
-                elif 'pansol' in address_lower and 'laguna' in address_lower:
-                    coordinates = {'lat': 14.5167, 'lng': 121.3667, 'source': 'manual'}
-                
-                # Municipalities - Eastern Laguna
-                elif 'paete' in address_lower:
-                    coordinates = {'lat': 14.3667, 'lng': 121.4833, 'source': 'manual'}
-                elif 'pakil' in address_lower:
-                    coordinates = {'lat': 14.3833, 'lng': 121.4833, 'source': 'manual'}
-                elif 'pangil' in address_lower:
-                    coordinates = {'lat': 14.4000, 'lng': 121.4667, 'source': 'manual'}
-                elif 'pagsanjan' in address_lower:
-                    coordinates = {'lat': 14.2667, 'lng': 121.4500, 'source': 'manual'}
-                elif 'cavinti' in address_lower:
-                    coordinates = {'lat': 14.2500, 'lng': 121.5000, 'source': 'manual'}
-                elif 'lumban' in address_lower:
-                    coordinates = {'lat': 14.3000, 'lng': 121.4667, 'source': 'manual'}
-                elif 'kalayaan' in address_lower and 'laguna' in address_lower:
-                    coordinates = {'lat': 14.2691, 'lng': 121.4213, 'source': 'manual'}
-                elif 'longos' in address_lower and 'kalayaan' in address_lower:
-                    coordinates = {'lat': 14.2691, 'lng': 121.4213, 'source': 'manual'}
-                
-                # Municipalities - Central Laguna
-                elif 'sta cruz' in address_lower or 'santa cruz' in address_lower:
-                    if 'laguna' in address_lower or 'sambat' in address_lower:
-                        coordinates = {'lat': 14.2854, 'lng': 121.4134, 'source': 'manual'}
-                elif 'bay' in address_lower and 'laguna' in address_lower:
-                    coordinates = {'lat': 14.1833, 'lng': 121.2833, 'source': 'manual'}
-                elif 'los banos' in address_lower or 'los baños' in address_lower:
-                    coordinates = {'lat': 14.1692, 'lng': 121.2417, 'source': 'manual'}
-                elif 'calauan' in address_lower:
-                    coordinates = {'lat': 14.1497, 'lng': 121.3156, 'source': 'manual'}
-                elif 'alaminos' in address_lower:
-                    coordinates = {'lat': 14.0639, 'lng': 121.2461, 'source': 'manual'}
-                
-                # Municipalities - Southern Laguna
-                elif 'magdalena' in address_lower:
-                    coordinates = {'lat': 14.2000, 'lng': 121.4333, 'source': 'manual'}
-                elif 'majayjay' in address_lower:
-                    coordinates = {'lat': 14.1500, 'lng': 121.4667, 'source': 'manual'}
-                elif 'liliw' in address_lower:
-                    coordinates = {'lat': 14.1333, 'lng': 121.4333, 'source': 'manual'}
-                elif 'nagcarlan' in address_lower:
-                    coordinates = {'lat': 14.1333, 'lng': 121.4167, 'source': 'manual'}
-                elif 'rizal' in address_lower and 'laguna' in address_lower:
-                    coordinates = {'lat': 14.1167, 'lng': 121.4000, 'source': 'manual'}
-                elif 'san pascual' in address_lower:
-                    coordinates = {'lat': 14.1000, 'lng': 121.3833, 'source': 'manual'}
-                elif 'pila' in address_lower:
-                    coordinates = {'lat': 14.2333, 'lng': 121.3667, 'source': 'manual'}
-                elif 'victoria' in address_lower:
-                    coordinates = {'lat': 14.2167, 'lng': 121.3333, 'source': 'manual'}
-                
-                # PRIORITY 2: Specific barangay matching (if no municipality found)
-                elif 'longos' in address_lower:
-                    # Longos is a barangay in Kalayaan, Laguna
-                    coordinates = {'lat': 14.2691, 'lng': 121.4213, 'source': 'manual'}
-                
-                # PRIORITY 3: Street-specific mapping (lowest priority - only if no municipality/barangay found)
-                elif 'real' in address_lower and ('st' in address_lower or 'street' in address_lower):
-                    if 'zone' in address_lower or 'purok' in address_lower:
-                        coordinates = {'lat': 14.2100, 'lng': 121.1200, 'source': 'manual'}
-                    else:
-                        coordinates = {'lat': 14.2120, 'lng': 121.1250, 'source': 'manual'}
+            coordinates = coords_by_address.get(address)
             
             if coordinates:
-                try:
-                    client_ref = db.collection('clients').document(client_id)
-                    client_ref.update({
-                        'coordinates': coordinates,
-                        'coordinates_updated_at': datetime.now(),
-                        'coordinates_updated_by': session.get('user_id', 'force_geocode')
-                    })
-                    results['updated'] += 1
-                    results['details'].append(f"Updated {name}: {coordinates['lat']}, {coordinates['lng']} ({coordinates['source']})")
-                    print(f"Successfully updated coordinates for {name}")
-                except Exception as e:
-                    results['failed'] += 1
-                    results['details'].append(f"Failed to update {name}: {str(e)}")
-                    print(f"Error updating {name}: {e}")
+                writer.update(client.reference, {
+                    'coordinates': coordinates,
+                    'coordinates_updated_at': datetime.now(),
+                    'coordinates_updated_by': session.get('user_id', 'force_geocode')
+                }, key=client_id)
+                planned[client_id] = (name, coordinates)
             else:
                 results['failed'] += 1
                 results['details'].append(f"No coordinates found for {name}: {address}")
         
+        write_result = writer.flush()
+        for client_id in write_result.succeeded:
+            name, coordinates = planned[client_id]
+            record_client_write(client_id, {'coordinates': coordinates})
+            results['updated'] += 1
+            results['details'].append(f"Updated {name}: {coordinates['lat']}, {coordinates['lng']} ({coordinates['source']})")
+        for client_id, error in write_result.failed.items():
+            name = planned[client_id][0]
+            results['failed'] += 1
+            results['details'].append(f"Failed to update {name}: {error}")
+            print(f"Error updating {name}: {error}")
+        
         return jsonify({
             'success': True,
             'results': results,
@@ -3127,26 +3127,27 @@ def debug_locations():
 def get_location_stats():
     """Get statistics about client distribution across Laguna locations"""
     try:
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
+        clients = client_replica.documents(archived=False)
         
         location_stats = {}
         total_clients = 0
         
         for client in clients:
             client_dict = client.to_dict()
-            address = client_dict.get('address', '').lower()
+            address = client_dict.get('address', '')
+            coordinates = client_dict.get('coordinates') or {}
             total_clients += 1
             
-            # Match address to municipality using new API
-            matched_municipality = None
-            municipalities = get_all_municipalities()
-            for municipality in municipalities:
-                if municipality.id in address or municipality.name.lower() in address:
-                    matched_municipality = municipality.id
-                    break
+            # Place the client by its address; reverse geocoding only finds the nearest
+            # municipality center, so coordinates are used only when the address does not resolve
+            match = None
+            if address:
+                match = resolve_address(address)
+            if not match and 'lat' in coordinates and 'lng' in coordinates:
+                match = reverse_geocode(coordinates['lat'], coordinates['lng'])
             
-            if matched_municipality:
+            if match:
+                matched_municipality = match.municipality_id
                 if matched_municipality not in location_stats:
                     muni = get_municipality(matched_municipality)
                     location_stats[matched_municipality] = {
@@ -3155,10 +3156,14 @@ def get_location_stats():
                         'lng': muni.lng,
                         'count': 0,
                         'in_house': 0,
-                        'after_care': 0
+                        'after_care': 0,
+                        'barangays': {}
                     }
                 
                 location_stats[matched_municipality]['count'] += 1
+                if match.barangay:
+                    barangays = location_stats[matched_municipality]['barangays']
+                    barangays[match.barangay] = barangays.get(match.barangay, 0) + 1
                 care_type = client_dict.get('care_type', 'in_house').lower().replace(' ', '_')
                 if care_type == 'after_care':
                     location_stats[matched_municipality]['after_care'] += 1
@@ -3182,12 +3187,17 @@ def get_location_stats():
 @app.route('/api/locations/api-stats')
 @role_required(['admin', 'psychometrician', 'house_worker'])
 def get_location_api_stats():
-    """Get statistics about the Laguna location API data"""
+    """Get statistics about the Laguna location API data, the geocode cache and the geocoding pipeline"""
     try:
-        stats = get_location_stats()
+        # The /api/locations/stats view above shadows the imported get_location_stats
+        stats = laguna_api.get_location_stats()
         return jsonify({
             'success': True,
-            'stats': stats
+            'stats': stats,
+            'geocode_cache': geocode_cache.get_stats(),
+            'geocoding_pipeline': geocoding_pipeline.get_stats(),
+            'map_index': client_map_index.get_stats(),
+            'density_grid': density_grid.get_stats()
         })
     except Exception as e:
         return jsonify({
@@ -3195,10 +3205,42 @@ def get_location_api_stats():
             'error': str(e)
         }), 500
 
+@app.route('/api/locations/reverse')
+@role_required(['admin', 'psychometrician', 'house_worker'])
+def reverse_geocode_endpoint():
+    """Map coordinates to the nearest Laguna barangay/municipality"""
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None:
+        return jsonify({
+            'success': False,
+            'error': 'lat and lng parameters required'
+        }), 400
+    
+    match = reverse_geocode(lat, lng)
+    if not match:
+        return jsonify({
+            'success': True,
+            'result': None
+        })
+    
+    return jsonify({
+        'success': True,
+        'result': {
+            'type': match.type,
+            'name': match.name,
+            'id': match.municipality_id,
+            'municipality': match.municipality_name,
+            'barangay': match.barangay,
+            'lat': match.lat,
+            'lng': match.lng
+        }
+    })
+
 @app.route('/api/locations/search')
 @role_required(['admin', 'psychometrician', 'house_worker'])
 def search_locations_endpoint():
-    """Search for Laguna locations by name"""
+    """Search for Laguna locations by name (ranked prefix/fuzzy matches)"""
     query = request.args.get('q', '').lower()
     if not query or len(query) < 2:
         return jsonify({
@@ -3207,7 +3249,8 @@ def search_locations_endpoint():
             'total': 0
         })
     
-    results = search_locations(query)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    results = search_locations(query, limit=limit)
     formatted_results = [{
         'type': result.type,
         'name': result.name,
@@ -3220,7 +3263,7 @@ def search_locations_endpoint():
     
     return jsonify({
         'success': True,
-        'results': formatted_results[:20],  # Limit to 20 results
+        'results': formatted_results,
         'total': len(formatted_results)
     })
 
@@ -3304,7 +3347,7 @@ def check_activity_updates():
         if latest_timestamp:
             # Get activities newer than the latest one
             newer_query = logs_ref.where('timestamp', '>', latest_timestamp)
-            newer_count = sum(1 for _ in newer_query.stream())
+            newer_count = count_query(newer_query)
             
             return jsonify({
                 'success': True,
@@ -3413,7 +3456,7 @@ def get_activity_stats():
         logs_ref = db.collection('activity_logs')
         
         # Get total count
-        total_activities = sum(1 for _ in logs_ref.stream())
+        total_activities = count_query(logs_ref)
         
         # Get unique users
         users = set()
@@ -3431,12 +3474,12 @@ def get_activity_stats():
         from datetime import datetime, timedelta
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         today_query = logs_ref.where('timestamp', '>=', today_start)
-        today_activities = sum(1 for _ in today_query.stream())
+        today_activities = count_query(today_query)
         
         # Get this week's activities
         week_start = today_start - timedelta(days=today_start.weekday())
         week_query = logs_ref.where('timestamp', '>=', week_start)
-        week_activities = sum(1 for _ in week_query.stream())
+        week_activities = count_query(week_query)
         
         # Get most active users
         user_activity = {}
@@ -3835,15 +3878,14 @@ def test_progress_api(client_id):
         
         client_data = client_doc.to_dict()
         
-        # Get notes count
-        notes_ref = db.collection('clients').document(client_id).collection('notes')
-        notes = list(notes_ref.stream())
+        # Get notes count (server-side aggregation)
+        notes_count = count_query(client_ref.collection('notes'))
         
         return jsonify({
             'success': True,
             'client_id': client_id,
             'client_name': client_data.get('name', 'Unknown'),
-            'notes_count': len(notes),
+            'notes_count': notes_count,
             'message': 'Progress API is working'
         })
         
@@ -3876,8 +3918,7 @@ def get_monthly_summary_report():
             end_date = datetime.strptime(end_date, '%Y-%m-%d')
         
         # Get clients data
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
+        clients = client_replica.documents(archived=False)
         
         # Initialize counters
         monthly_data = {}
@@ -4048,8 +4089,7 @@ def get_relapse_trends_report():
             end_date = datetime.strptime(end_date, '%Y-%m-%d')
         
         # Get clients data
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
+        clients = client_replica.documents(archived=False)
         
         # Initialize monthly data structure
         monthly_data = {}
@@ -4242,8 +4282,7 @@ def get_aftercare_summary_report():
             end_date = datetime.strptime(end_date, '%Y-%m-%d')
         
         # Get aftercare clients
-        clients_ref = db.collection('clients')
-        aftercare_clients = clients_ref.where('care_type', '==', 'after_care').where('archived', '==', False).stream()
+        aftercare_clients = client_replica.documents(care_type='after_care', archived=False)
         
         # Initialize counters
         aftercare_stats = {
@@ -4336,8 +4375,7 @@ def get_clients_for_reports():
     """Get list of clients for report selection"""
     try:
         # Get clients data
-        clients_ref = db.collection('clients')
-        clients = clients_ref.where('archived', '==', False).stream()
+        clients = client_replica.documents(archived=False)
         
         clients_list = []
         for client_doc in clients:
@@ -4541,6 +4579,65 @@ def debug_client(client_id):
 # Import NLP modules
 from nlp_analyzer import nlp_analyzer, progress_aggregator
 from firestore_schema import firestore_schema
+from note_ingestion import note_ingestion, NOTE_ANALYSIS_MODE
+from analysis_cache import analysis_cache
+from note_search import note_search_index
+
+# Load the note search index in the background instead of on the first search
+note_search_index.start()
+
+# Pick up notes left pending by a restarted process, at startup and periodically
+if NOTE_ANALYSIS_MODE == 'async':
+    note_ingestion.start_sweeper()
+
+
+@app.route('/health/nlp')
+def nlp_health():
+    """
+    Readiness check for the NLP models. Returns 503 while a preload is still
+    running (or failed) so a load balancer can hold traffic until warm-up ends
+    """
+    if NLP_WORKER_MODE != 'inprocess':
+        # Models live in the worker process; report its readiness instead
+        try:
+            worker_status = nlp_worker.nlp_worker_client.ping()
+        except NLPWorkerError as e:
+            return jsonify({'ready': False, 'worker_mode': NLP_WORKER_MODE, 'error': str(e)}), 503
+        
+        readiness = worker_status['readiness']
+        readiness.update({
+            'worker_mode': NLP_WORKER_MODE,
+            'queued': worker_status['queued'],
+            'processed': worker_status['processed']
+        })
+        return jsonify(readiness), 200 if readiness['ready'] else 503
+    
+    readiness = nlp_analyzer.get_readiness()
+    readiness['worker_mode'] = NLP_WORKER_MODE
+    
+    if NLP_PRELOAD in ('background', 'blocking') and not readiness['ready']:
+        return jsonify(readiness), 503
+    
+    return jsonify(readiness), 200
+
+
+@app.route('/api/nlp/cache-stats')
+@admin_required
+def nlp_cache_stats():
+    """Hit/miss/eviction counters of the NLP analysis cache in this process"""
+    return jsonify({'success': True, 'stats': analysis_cache.get_stats()})
+
+
+@app.route('/api/nlp/cache-clear', methods=['POST'])
+@admin_required
+def nlp_cache_clear():
+    """Drop cached NLP analysis results (e.g. after changing keyword dictionaries)"""
+    try:
+        analysis_cache.clear()
+        return jsonify({'success': True})
+    except Exception as e:
+        print(f"Error clearing NLP cache: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/analyze-text', methods=['POST'])
@@ -4558,10 +4655,13 @@ def analyze_text():
             return jsonify({'error': 'Text cannot be empty'}), 400
         
         # Analyze the text with NLP
-        analysis = nlp_analyzer.analyze_note(text)
+        analysis = nlp_worker.analyze_note(text)
         
         return jsonify(analysis), 200
         
+    except NLPWorkerTimeout as e:
+        app.logger.warning(f"Text analysis timed out: {e}")
+        return jsonify({'error': 'Analysis is taking too long, please try again'}), 503
     except Exception as e:
         app.logger.error(f"Error analyzing text: {e}")
         return jsonify({'error': 'Analysis failed'}), 500
@@ -4602,24 +4702,50 @@ def add_client_note(client_id):
         if not user_id:
             return jsonify({'error': 'User not authenticated'}), 401
         
+        author = {
+            'user_id': user_id,
+            'email': user_email,
+            'role': user_role
+        }
+        
+        if NOTE_ANALYSIS_MODE == 'async':
+            # Store the raw note now and analyze it in the background
+            note_id = firestore_schema.create_pending_note(
+                client_id, {'text': text, 'author': author}, client_data.get('archived', False)
+            )
+            if not note_id:
+                return jsonify({'error': 'Failed to save note to database'}), 500
+            
+            note_ingestion.submit(client_id, note_id, text)
+            app.logger.info(f"Note {note_id} saved for client {client_id} by user {user_email}; analysis queued")
+            
+            return jsonify({
+                'message': 'Note saved; analysis in progress',
+                'client_id': client_id,
+                'note_id': note_id,
+                'analysis_status': 'pending',
+                'status_url': url_for('get_note_analysis_status', client_id=client_id, note_id=note_id)
+            }), 202
+        
         # Analyze the note with NLP
         try:
-            note_analysis = nlp_analyzer.analyze_note(text)
+            note_analysis = nlp_worker.analyze_note(text)
             app.logger.info(f"NLP analysis completed for client {client_id}")
+        except NLPWorkerTimeout as e:
+            app.logger.warning(f"NLP analysis timed out for client {client_id}: {e}")
+            return jsonify({'error': 'NLP analysis timed out, please try again'}), 503
         except Exception as e:
             app.logger.error(f"NLP analysis failed: {e}")
             return jsonify({'error': 'NLP analysis failed'}), 500
         
         # Add user information to the note analysis
-        note_analysis['author'] = {
-            'user_id': user_id,
-            'email': user_email,
-            'role': user_role
-        }
+        note_analysis['author'] = author
         
         # Save to Firestore
         try:
-            success = firestore_schema.add_note_to_client(client_id, note_analysis)
+            success = firestore_schema.add_note_to_client(
+                client_id, note_analysis, client_data.get('archived', False)
+            )
             if not success:
                 app.logger.error(f"Failed to save note to Firestore for client {client_id}")
                 return jsonify({'error': 'Failed to save note to database'}), 500
@@ -4639,6 +4765,51 @@ def add_client_note(client_id):
         app.logger.error(f"Error adding client note: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/clients/<client_id>/notes/<note_id>/status', methods=['GET'])
+def get_note_analysis_status(client_id, note_id):
+    """
+    Report the background analysis status of a note
+    
+    analysis_status is 'pending', 'complete' or 'failed'; notes saved before
+    asynchronous ingestion have no status and are reported as complete.
+    """
+    try:
+        note = firestore_schema.get_note(client_id, note_id)
+        if not note:
+            return jsonify({'error': 'Note not found'}), 404
+        
+        status = note.get('analysis_status', 'complete')
+        response = {
+            'client_id': client_id,
+            'note_id': note_id,
+            'analysis_status': status,
+            'attempts': note.get('analysis_attempts', 0),
+            'error': note.get('analysis_error')
+        }
+        if status == 'complete':
+            response['analysis'] = {
+                'sentiment': note.get('sentiment', {}),
+                'keywords': note.get('keywords', []),
+                'tags': note.get('tags', {})
+            }
+        
+        return jsonify(response), 200
+        
+    except Exception as e:
+        app.logger.error(f"Error getting note analysis status: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/notes/requeue-analysis', methods=['POST'])
+@admin_required
+def requeue_note_analysis():
+    """Queue every pending or failed note for background analysis again"""
+    try:
+        queued = note_ingestion.requeue_unanalyzed(include_failed=True)
+        return jsonify({'success': True, 'queued': queued, 'stats': note_ingestion.get_stats()})
+    except Exception as e:
+        print(f"Error requeueing note analysis: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/clients/<client_id>/notes', methods=['GET'])
 def get_client_notes(client_id):
     """
@@ -4725,10 +4896,12 @@ def get_all_clients_with_notes():
 @app.route('/clients/<client_id>/notes/search', methods=['GET'])
 def search_client_notes(client_id):
     """
-    Search client notes by keywords
+    Search client notes by keywords or a full-text query
     
     Query parameters:
     - keywords: Comma-separated list of keywords to search for
+    - q: Full-text query (terms, "quoted phrases", prefix*), used instead of keywords
+    - limit: Maximum number of results for q (default 20)
     """
     try:
         # Check if client exists
@@ -4736,9 +4909,20 @@ def search_client_notes(client_id):
         if not client_data:
             return jsonify({'error': 'Client not found'}), 404
         
+        query = request.args.get('q', '').strip()
+        if query:
+            limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+            matching_notes = firestore_schema.search_notes(query, client_id=client_id, limit=limit)
+            return jsonify({
+                'client_id': client_id,
+                'query': query,
+                'matching_notes': matching_notes,
+                'total_matches': len(matching_notes)
+            }), 200
+        
         keywords_param = request.args.get('keywords')
         if not keywords_param:
-            return jsonify({'error': 'Missing keywords parameter'}), 400
+            return jsonify({'error': 'Missing keywords or q parameter'}), 400
         
         keywords = [kw.strip() for kw in keywords_param.split(',') if kw.strip()]
         if not keywords:
@@ -4758,6 +4942,36 @@ def search_client_notes(client_id):
         app.logger.error(f"Error searching client notes: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/notes/search', methods=['GET'])
+@role_required(['admin', 'psychometrician', 'facilitator'])
+def search_all_notes():
+    """
+    Full-text search across every client's notes
+    
+    Query parameters:
+    - q: Terms, "quoted phrases" and prefix* terms
+    - limit: Maximum number of results (default 20, at most 100)
+    - include_archived: 'true' to include notes of archived clients
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Missing q parameter'}), 400
+        
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        matching_notes = firestore_schema.search_notes(query, include_archived=include_archived, limit=limit)
+        
+        return jsonify({
+            'query': query,
+            'matching_notes': matching_notes,
+            'total_matches': len(matching_notes)
+        }), 200
+        
+    except Exception as e:
+        app.logger.error(f"Error searching notes: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/clients/<client_id>/notes/<note_id>', methods=['DELETE'])
 def delete_client_note(client_id, note_id):
     """
@@ -0,0 +1,117 @@
+"""
+Benchmark script for the Laguna Location API
+Compares import and first-query time of the compiled gazetteer snapshot (cold
+compile and warm mmap) against parsing laguna_locations.json and building the
+indexes in every process, and measures search / address resolution latency
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+DATA_FILE = 'laguna_locations.json'
+
+SAMPLE_QUERIES = ['calamba', 'sa', 'sta rosa', 'parian cal', 'calmba', 'ampa']
+SAMPLE_ADDRESSES = [
+    "Blk 5 Lot 3, Brgy. Parian, Calamba City, Laguna, Philippines",
+    "Santa Cruz, Bay, Laguna",
+    "123 Rizal St., Los Baños",
+    "Quezon City, Metro Manila"
+]
+
+
+def run_json_loader(data_file, results):
+    """
+    Per-process loading without a persisted snapshot: parse the JSON into
+    dataclasses and build the search indexes in memory, as every worker did at import
+    """
+    start = time.perf_counter()
+    from laguna_locations_api import Municipality
+    from laguna_snapshot import GazetteerSnapshot, build_snapshot
+    with open(data_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    municipalities = {m['id']: Municipality(**m) for m in data.get('municipalities', [])}
+    parsed = time.perf_counter()
+    GazetteerSnapshot(build_snapshot(data['municipalities'], b'\0' * 32))
+    results['parse_ms'] = (parsed - start) * 1000
+    results['load_ms'] = (time.perf_counter() - start) * 1000
+
+
+def run_snapshot_loader(data_file, snapshot_file, results):
+    """Import the module, then load the snapshot on the first query"""
+    start = time.perf_counter()
+    from laguna_locations_api import LagunaLocationAPI
+    api = LagunaLocationAPI(data_file, snapshot_file=snapshot_file)
+    imported = time.perf_counter()
+    api.search_locations(SAMPLE_QUERIES[0], limit=20)
+    results['import_ms'] = (imported - start) * 1000
+    results['first_query_ms'] = (time.perf_counter() - imported) * 1000
+
+
+def in_subprocess(target, *args):
+    """Run a loader in a fresh interpreter so module and page caches start cold"""
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        results = manager.dict()
+        process = context.Process(target=target, args=(*args, results))
+        process.start()
+        process.join()
+        return dict(results)
+
+
+def benchmark_loaders(data_file, runs):
+    snapshot_file = os.path.join(tempfile.mkdtemp(prefix='laguna_bench_'), 'laguna_locations.snapshot')
+
+    print("Loader (fresh process per run)")
+    json_runs = [in_subprocess(run_json_loader, data_file) for _ in range(runs)]
+    print(f"  JSON + indexes          load {min(r['load_ms'] for r in json_runs):7.2f} ms   "
+          f"(JSON parse + dataclasses {min(r['parse_ms'] for r in json_runs):.2f} ms)")
+
+    cold = in_subprocess(run_snapshot_loader, data_file, snapshot_file)
+    print(f"  snapshot (compile)    import {cold['import_ms']:7.2f} ms   first query {cold['first_query_ms']:6.2f} ms")
+
+    warm_runs = [in_subprocess(run_snapshot_loader, data_file, snapshot_file) for _ in range(runs)]
+    print(f"  snapshot (mmap)       import {min(r['import_ms'] for r in warm_runs):7.2f} ms   "
+          f"first query {min(r['first_query_ms'] for r in warm_runs):6.2f} ms")
+    print(f"  snapshot size {os.path.getsize(snapshot_file)} bytes")
+    return snapshot_file
+
+
+def benchmark_queries(data_file, snapshot_file, iterations):
+    from laguna_locations_api import LagunaLocationAPI
+    api = LagunaLocationAPI(data_file, snapshot_file=snapshot_file)
+    api.search_locations(SAMPLE_QUERIES[0])
+
+    print("\nSearch latency (limit=20)")
+    for query in SAMPLE_QUERIES:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            results = api.search_locations(query, limit=20)
+        per_query = (time.perf_counter() - start) / iterations * 1e6
+        print(f"  {query!r:14} {per_query:8.1f} us   {len(results)} results")
+
+    print("\nAddress resolution latency")
+    for address in SAMPLE_ADDRESSES:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            match = api.resolve_address(address)
+        per_query = (time.perf_counter() - start) / iterations * 1e6
+        print(f"  {per_query:8.1f} us   {address} -> {match.name if match else None}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Laguna location loading and search')
+    parser.add_argument('--data-file', default=DATA_FILE, help='Location JSON file')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh-process runs per loader (best is reported)')
+    parser.add_argument('--iterations', type=int, default=1000, help='Repetitions per query')
+    args = parser.parse_args()
+
+    snapshot_file = benchmark_loaders(args.data_file, args.runs)
+    benchmark_queries(args.data_file, snapshot_file, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
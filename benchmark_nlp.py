@@ -0,0 +1,259 @@
+"""
+Benchmark script for the NLP Pipeline
+Measures note analysis throughput (notes/sec) for single vs. batched inference on CPU,
+and compares domain tagging engines and inference backends for latency, memory
+and agreement
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+from nlp_analyzer import nlp_analyzer, keyword_matcher
+from analysis_cache import analysis_cache
+
+# Sample narrative observations, repeated to build a workload
+SAMPLE_NOTES = [
+    "Client appeared calm and cooperative during morning activities. He was attentive during group therapy and showed good social interaction with other residents.",
+    "Client seemed withdrawn and quiet today. He appeared forgetful during medication time and was less engaged in activities.",
+    "Excellent progress today! Client was very cheerful and outgoing. He actively participated in all group activities and helped other residents.",
+    "Client was agitated and frustrated during the afternoon. He had difficulty focusing on tasks and showed some aggressive behavior towards staff.",
+    "Client maintained stable mood throughout the day. He was cooperative with staff and followed routines well. Average cognitive performance observed.",
+    "Some resistance to activities but eventually engaged positively.",
+    "Client demonstrated strong problem-solving skills during cognitive exercises.",
+    "Patient appeared anxious but engaged well with staff. Good communication skills demonstrated."
+]
+
+
+def build_workload(count):
+    """Return `count` notes cycling through the samples"""
+    return [SAMPLE_NOTES[i % len(SAMPLE_NOTES)] for i in range(count)]
+
+
+def warm_up():
+    """Load every backend so model loading is not part of the measurements"""
+    nlp_analyzer.analyze_note(SAMPLE_NOTES[0])
+    nlp_analyzer.analyze_notes_batch(SAMPLE_NOTES[:2])
+
+
+def benchmark_single(notes):
+    """Analyze notes one at a time; returns (results, notes/sec)"""
+    start = time.perf_counter()
+    results = [nlp_analyzer.analyze_note(note) for note in notes]
+    elapsed = time.perf_counter() - start
+    return results, len(notes) / elapsed
+
+
+def benchmark_batch(notes, batch_size):
+    """Analyze notes with analyze_notes_batch; returns (results, notes/sec)"""
+    start = time.perf_counter()
+    results = nlp_analyzer.analyze_notes_batch(notes, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return results, len(notes) / elapsed
+
+
+def compare_results(single_results, batch_results):
+    """Count notes whose sentiment label, keywords and domain tags differ"""
+    mismatches = 0
+    for single, batch in zip(single_results, batch_results):
+        if (single['sentiment']['sentiment'] != batch['sentiment']['sentiment'] or
+                single['keywords'] != batch['keywords'] or
+                single['tags'] != batch['tags']):
+            mismatches += 1
+    return mismatches
+
+
+def benchmark_keyword_matcher(notes):
+    """Lexicon sentiment + domain tagging throughput; returns notes/sec"""
+    cleaned_notes = [nlp_analyzer._clean_text(note) for note in notes]
+    start = time.perf_counter()
+    for note in cleaned_notes:
+        nlp_analyzer._basic_sentiment_analysis(note)
+        nlp_analyzer._keyword_based_domain_tagging(note)
+    return len(cleaned_notes) / (time.perf_counter() - start)
+
+
+def top_domain(tags):
+    """Domain with the highest score in a domain tags dict"""
+    return max(tags, key=lambda domain: tags[domain]['score'])
+
+
+def benchmark_domain_engines(notes, engines, batch_size):
+    """
+    Time each domain tagging engine on the same cleaned notes and compare its
+    output with the first engine (the reference)
+    """
+    cleaned_notes = [nlp_analyzer._clean_text(note) for note in notes]
+    empty_keywords = [[] for _ in cleaned_notes]
+    reference = None
+    
+    for engine in engines:
+        nlp_analyzer.set_domain_engine(engine)
+        backend = nlp_analyzer.backend_version().split('|')[2]
+        nlp_analyzer._tag_domains(cleaned_notes[0], [])  # load/warm the engine
+        
+        start = time.perf_counter()
+        single_tags = [nlp_analyzer._tag_domains(note, []) for note in cleaned_notes]
+        single_ms = (time.perf_counter() - start) * 1000 / len(cleaned_notes)
+        
+        start = time.perf_counter()
+        nlp_analyzer._tag_domains_batch(cleaned_notes, empty_keywords, batch_size)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(cleaned_notes)
+        
+        line = f"{engine:>10} ({backend}): {single_ms:8.2f} ms/note single, {batch_ms:8.2f} ms/note batched"
+        if reference is None:
+            reference = single_tags
+        else:
+            agree = sum(top_domain(a) == top_domain(b) for a, b in zip(reference, single_tags))
+            score_diff = sum(
+                abs(a[domain]['score'] - b[domain]['score'])
+                for a, b in zip(reference, single_tags) for domain in a
+            ) / (len(single_tags) * len(reference[0]))
+            line += f", top-domain agreement {agree / len(single_tags):.0%}, mean score diff {score_diff:.3f}"
+        print(line)
+
+
+def rss_mb():
+    """Resident memory of this process in MB"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak RSS where /proc is unavailable (KB on Linux, bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_inference_backend(backend, notes, results):
+    """
+    Child-process body: load the sentiment and zero-shot pipelines on one backend
+    ('torch', 'onnx' or 'onnx-int8') and time _analyze_sentiment/_tag_domains
+    """
+    import nlp_analyzer as analyzer_module
+    
+    analyzer_module.INFERENCE_BACKEND = 'torch' if backend == 'torch' else 'onnx'
+    analyzer_module.ONNX_QUANTIZE = backend == 'onnx-int8'
+    analyzer = analyzer_module.nlp_analyzer
+    analysis_cache.enabled = False
+    
+    baseline_mb = rss_mb()
+    analyzer.set_domain_engine('zero-shot')
+    analyzer._ensure_transformers()
+    loaded_mb = rss_mb()
+    
+    cleaned_notes = [analyzer._clean_text(note) for note in notes]
+    analyzer._analyze_sentiment(cleaned_notes[0])
+    analyzer._tag_domains(cleaned_notes[0], [])
+    
+    start = time.perf_counter()
+    sentiments = [analyzer._analyze_sentiment(note)['sentiment'] for note in cleaned_notes]
+    sentiment_ms = (time.perf_counter() - start) * 1000 / len(cleaned_notes)
+    
+    start = time.perf_counter()
+    domains = [top_domain(analyzer._tag_domains(note, [])) for note in cleaned_notes]
+    domain_ms = (time.perf_counter() - start) * 1000 / len(cleaned_notes)
+    
+    results.put({
+        'backend': backend,
+        'active': dict(analyzer_module.active_inference_backends),
+        'model_mb': loaded_mb - baseline_mb,
+        'peak_mb': rss_mb(),
+        'sentiment_ms': sentiment_ms,
+        'domain_ms': domain_ms,
+        'sentiments': sentiments,
+        'domains': domains
+    })
+
+
+def benchmark_inference_backends(notes, backends):
+    """
+    Run each backend in a fresh process (so memory numbers are not shared) and
+    compare labels with the first backend (the reference)
+    """
+    context = multiprocessing.get_context('spawn')
+    reference = None
+    
+    for backend in backends:
+        results = context.Queue()
+        process = context.Process(target=run_inference_backend, args=(backend, notes, results))
+        process.start()
+        result = results.get()
+        process.join()
+        
+        active = '/'.join(value or 'fallback' for value in result['active'].values())
+        line = (f"{backend:>10} (ran on {active}): sentiment {result['sentiment_ms']:8.2f} ms/note, "
+                f"domains {result['domain_ms']:8.2f} ms/note, models {result['model_mb']:7.1f} MB, "
+                f"RSS {result['peak_mb']:7.1f} MB")
+        if reference is None:
+            reference = result
+        else:
+            sentiment_agree = sum(a == b for a, b in zip(reference['sentiments'], result['sentiments']))
+            domain_agree = sum(a == b for a, b in zip(reference['domains'], result['domains']))
+            line += (f", sentiment agreement {sentiment_agree / len(notes):.0%}, "
+                     f"top-domain agreement {domain_agree / len(notes):.0%}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark NLP note analysis throughput')
+    parser.add_argument('--notes', type=int, default=64, help='Number of notes to analyze')
+    parser.add_argument('--batch-sizes', default='8,16,32', help='Comma-separated batch sizes to try')
+    parser.add_argument('--with-cache', action='store_true', help='Also measure repeated texts served by the analysis cache')
+    parser.add_argument('--domain-engines', default='',
+                        help='Comma-separated domain engines to compare, reference first (e.g. zero-shot,embedding)')
+    parser.add_argument('--inference-backends', default='',
+                        help='Comma-separated inference backends to compare, reference first (e.g. torch,onnx,onnx-int8)')
+    args = parser.parse_args()
+    
+    # The workload repeats sample texts, so measure raw inference with the cache off
+    analysis_cache.enabled = False
+    
+    notes = build_workload(args.notes)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',') if size.strip()]
+    
+    print("NLP Throughput Benchmark")
+    print("=" * 50)
+    print("Warming up models...")
+    warm_up()
+    
+    single_results, single_rate = benchmark_single(notes)
+    print(f"Single-note analysis: {single_rate:8.2f} notes/sec ({len(notes)} notes)")
+    
+    for batch_size in batch_sizes:
+        batch_results, batch_rate = benchmark_batch(notes, batch_size)
+        mismatches = compare_results(single_results, batch_results)
+        print(f"Batch size {batch_size:>3}:        {batch_rate:8.2f} notes/sec "
+              f"(x{batch_rate / single_rate:.2f}, {mismatches} mismatched results)")
+    
+    if args.with_cache:
+        analysis_cache.enabled = True
+        analysis_cache.clear()
+        _, cached_rate = benchmark_single(notes)
+        print(f"Single-note, cached:  {cached_rate:8.2f} notes/sec "
+              f"(x{cached_rate / single_rate:.2f}, {len(SAMPLE_NOTES)} distinct texts)")
+        print(f"Cache stats: {analysis_cache.get_stats()}")
+    
+    lexicon_rate = benchmark_keyword_matcher(notes * max(1, 2000 // len(notes)))
+    print(f"Lexicon tagging:      {lexicon_rate:8.2f} notes/sec (lexicon {keyword_matcher.version})")
+    
+    engines = [engine.strip() for engine in args.domain_engines.split(',') if engine.strip()]
+    if engines:
+        analysis_cache.enabled = False
+        print()
+        print("Domain tagging engines")
+        print("-" * 50)
+        benchmark_domain_engines(notes, engines, max(batch_sizes or [16]))
+    
+    backends = [backend.strip() for backend in args.inference_backends.split(',') if backend.strip()]
+    if backends:
+        print()
+        print("Inference backends (sentiment + zero-shot pipelines)")
+        print("-" * 50)
+        benchmark_inference_backends(notes, backends)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Client ID Allocator
+Sequential clientId numbers reserved from a single counter document
+(counters/client_ids) inside a Firestore transaction, so concurrent intakes
+never receive the same ID and allocating one costs a read and a write instead
+of streaming the clients collection. A worker may reserve a block of IDs per
+transaction and hand them out locally; IDs left in a block when the process
+exits are skipped, never reused
+"""
+
+import os
+import logging
+import threading
+
+from firebase_admin import firestore
+
+from firebase_config import db
+
+logger = logging.getLogger(__name__)
+
+# IDs reserved per transaction; 1 keeps IDs strictly sequential across workers
+CLIENT_ID_BLOCK_SIZE = max(int(os.getenv('CLIENT_ID_BLOCK_SIZE', '1')), 1)
+
+COUNTER_COLLECTION = 'counters'
+COUNTER_DOCUMENT = 'client_ids'
+
+
+@firestore.transactional
+def _reserve_in_transaction(transaction, counter_ref, count, seed):
+    snapshot = counter_ref.get(transaction=transaction)
+    start = snapshot.get('next') if snapshot.exists else seed
+    transaction.set(counter_ref, {'next': start + count, 'updated_at': firestore.SERVER_TIMESTAMP}, merge=True)
+    return start
+
+
+class ClientIdAllocator:
+    """Hands out numeric clientIds from a transactional counter"""
+
+    def __init__(self, block_size=CLIENT_ID_BLOCK_SIZE):
+        """
+        Args:
+            block_size (int): IDs reserved per counter transaction
+        """
+        self.block_size = max(block_size, 1)
+        self._lock = threading.Lock()
+        # Locally reserved, not yet issued range [next, end)
+        self._next = 0
+        self._end = 0
+        self.stats = {'allocated': 0, 'transactions': 0}
+
+    @property
+    def counter_ref(self):
+        return db.collection(COUNTER_COLLECTION).document(COUNTER_DOCUMENT)
+
+    def _seed(self):
+        """First ID when the counter does not exist yet: one past the highest numeric clientId"""
+        highest = 0
+        for doc in db.collection('clients').select(['clientId']).stream():
+            client_id = str(doc.to_dict().get('clientId') or '').strip()
+            if client_id.isdigit():
+                highest = max(highest, int(client_id))
+        return highest + 1
+
+    def reserve(self, count):
+        """
+        Reserve a contiguous range of IDs in one transaction
+
+        Args:
+            count (int): Number of IDs to reserve
+
+        Returns:
+            int: First reserved ID (the range is [first, first + count))
+        """
+        counter_ref = self.counter_ref
+        seed = 1
+        if not counter_ref.get().exists:
+            seed = self._seed()
+        start = _reserve_in_transaction(db.transaction(), counter_ref, count, seed)
+        self.stats['transactions'] += 1
+        return start
+
+    def allocate(self):
+        """
+        Next unused clientId
+
+        Returns:
+            str: The allocated ID
+        """
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self.reserve(self.block_size)
+                self._end = self._next + self.block_size
+            client_id = self._next
+            self._next += 1
+            self.stats['allocated'] += 1
+        return str(client_id)
+
+    def peek(self):
+        """
+        ID the next allocate() would most likely return, without reserving it
+
+        Returns:
+            str: Suggested ID (another intake may still take it first)
+        """
+        with self._lock:
+            if self._next < self._end:
+                return str(self._next)
+        snapshot = self.counter_ref.get()
+        return str(snapshot.get('next') if snapshot.exists else self._seed())
+
+    def get_stats(self):
+        """
+        Get allocation statistics
+
+        Returns:
+            dict: Allocator statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['block_size'] = self.block_size
+            stats['reserved_remaining'] = self._end - self._next
+        return stats
+
+
+# Global instance
+client_id_allocator = ClientIdAllocator()
@@ -0,0 +1,236 @@
+"""
+Client Pagination
+Cursor-based paging of the clients list. Clients are ordered by a stored
+lowercase name (name_lower) with the document id as tie-breaker, the
+archived/status/care_type filters run inside the Firestore query, and
+Previous/Next move with start_after/end_before cursors carried in opaque page
+tokens, so a page reads about per_page documents however large the caseload is.
+Clients stored before those fields existed are backfilled automatically the
+first time a process pages through the list (once per database)
+"""
+
+import json
+import base64
+import binascii
+import logging
+import threading
+from datetime import datetime
+
+from firebase_config import db
+from firestore_bulk import BulkWriter
+from firestore_counts import count_query
+
+logger = logging.getLogger(__name__)
+
+# Statuses shown on the clients page (pending ones live on /pending-clients)
+LISTED_STATUSES = ['active', 'relapsed', 'review', 'rejected', 'completed', 'ready_for_aftercare']
+
+KNOWN_STATUSES = set(LISTED_STATUSES) | {'pending', 'pending_aftercare'}
+
+# Records that every client carries the stored sort keys; bump the version to backfill again
+SORT_KEYS_MARKER_COLLECTION = 'meta'
+SORT_KEYS_MARKER_DOCUMENT = 'client_sort_keys'
+SORT_KEYS_VERSION = 1
+
+
+def normalize_care_type(care_type):
+    """Map stored care_type spellings onto 'in_house' / 'after_care'"""
+    if care_type is None:
+        return 'in_house'
+    care_type = str(care_type).lower().replace(' ', '_')
+    return 'after_care' if care_type in ['after_care', 'aftercare'] else 'in_house'
+
+
+def normalize_status(status):
+    """Map stored status spellings onto the canonical values (unknown ones become 'active')"""
+    if status is None:
+        return 'active'
+    status = str(status).lower()
+    if status == 'under review':
+        return 'review'
+    return status if status in KNOWN_STATUSES else 'active'
+
+
+def sort_key_fields(client_dict):
+    """
+    Stored fields the paged query filters and orders on
+
+    Args:
+        client_dict (dict): Client document data
+
+    Returns:
+        dict: name_lower, care_type, status and archived in canonical form
+    """
+    name = client_dict.get('name')
+    return {
+        'name_lower': name.strip().lower() if isinstance(name, str) and name.strip() else None,
+        'care_type': normalize_care_type(client_dict.get('care_type')),
+        'status': normalize_status(client_dict.get('status')),
+        'archived': bool(client_dict.get('archived', False))
+    }
+
+
+def encode_page_token(page, direction, anchor_id):
+    """Opaque token for the page reached by moving in direction from the anchor document"""
+    raw = json.dumps({'p': page, 'd': direction, 'a': anchor_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_page_token(token):
+    """
+    Read a page token
+
+    Returns:
+        tuple or None: (page, direction, anchor_id), or None if the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if data['d'] not in ('next', 'prev') or not isinstance(data['p'], int) or data['p'] < 1:
+            return None
+        return data['p'], data['d'], str(data['a'])
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None
+
+
+class ClientPaginator:
+    """Pages through the non-archived, non-pending clients in name order"""
+
+    def __init__(self, per_page=10):
+        self.per_page = per_page
+        self._sort_keys_lock = threading.Lock()
+        self._sort_keys_checked = False
+
+    @property
+    def sort_keys_marker_ref(self):
+        return db.collection(SORT_KEYS_MARKER_COLLECTION).document(SORT_KEYS_MARKER_DOCUMENT)
+
+    def ensure_sort_keys(self):
+        """
+        Backfill the stored sort keys before the first page if no backfill has
+        completed yet, so older clients are not silently missing from the list
+        """
+        if self._sort_keys_checked:
+            return
+        with self._sort_keys_lock:
+            if self._sort_keys_checked:
+                return
+            marker = self.sort_keys_marker_ref.get()
+            if not marker.exists or marker.to_dict().get('version') != SORT_KEYS_VERSION:
+                logger.warning("Clients may lack stored sort keys and be missing from /clients; backfilling now")
+                self.backfill_sort_keys()
+            # Checked once per process either way; a failed backfill is logged and can be rerun by an admin
+            self._sort_keys_checked = True
+
+    def base_query(self, care_type=None, status=None):
+        """
+        Filtered (unordered) clients query
+
+        Args:
+            care_type (str): Restrict to one care type (None for both)
+            status (str): Restrict to one listed status (None for all listed)
+        """
+        query = db.collection('clients').where('archived', '==', False)
+        if status:
+            query = query.where('status', '==', status)
+        else:
+            query = query.where('status', 'in', LISTED_STATUSES)
+        if care_type:
+            query = query.where('care_type', '==', care_type)
+        return query
+
+    def page(self, page=1, page_token=None, care_type=None, status=None):
+        """
+        Fetch one page of clients
+
+        Args:
+            page (int): 1-based page number (used when there is no valid token)
+            page_token (str): Token from a previous page's prev_token/next_token
+            care_type (str): Care type filter
+            status (str): Status filter
+
+        Returns:
+            tuple: (list of (document id, client dict), pagination dict)
+        """
+        self.ensure_sort_keys()
+        base = self.base_query(care_type, status)
+        ordered = base.order_by('name_lower').order_by('__name__')
+        total = count_query(base)
+        total_pages = (total + self.per_page - 1) // self.per_page
+        page = min(max(page, 1), max(total_pages, 1))
+
+        docs = None
+        token = decode_page_token(page_token) if page_token else None
+        if token:
+            token_page, direction, anchor_id = token
+            anchor = db.collection('clients').document(anchor_id).get()
+            if anchor.exists and token_page <= max(total_pages, 1):
+                page = token_page
+                if direction == 'next':
+                    docs = list(ordered.start_after(anchor).limit(self.per_page).stream())
+                else:
+                    docs = list(ordered.end_before(anchor).limit_to_last(self.per_page).get())
+
+        if docs is None:
+            # Jumping straight to a page number falls back to an offset
+            query = ordered.limit(self.per_page)
+            if page > 1:
+                query = query.offset((page - 1) * self.per_page)
+            docs = list(query.stream())
+
+        start_idx = (page - 1) * self.per_page
+        end_idx = start_idx + len(docs)
+        has_prev = page > 1 and bool(docs)
+        has_next = page < total_pages and bool(docs)
+
+        pagination = {
+            'page': page,
+            'per_page': self.per_page,
+            'total': total,
+            'total_pages': total_pages,
+            'has_prev': has_prev,
+            'has_next': has_next,
+            'prev_num': page - 1 if page > 1 else None,
+            'next_num': page + 1 if page < total_pages else None,
+            'prev_token': encode_page_token(page - 1, 'prev', docs[0].id) if has_prev else None,
+            'next_token': encode_page_token(page + 1, 'next', docs[-1].id) if has_next else None,
+            'start_record': start_idx + 1 if docs else 0,
+            'end_record': end_idx if docs else 0
+        }
+        return [(doc.id, doc.to_dict()) for doc in docs], pagination
+
+    def backfill_sort_keys(self):
+        """
+        Write name_lower and canonical care_type/status/archived onto clients
+        created before the paged query relied on them, and record the backfill
+        in meta/client_sort_keys once every write succeeded
+
+        Returns:
+            dict: Bulk write summary
+        """
+        writer = BulkWriter()
+        for doc in db.collection('clients').stream():
+            client_dict = doc.to_dict()
+            fields = sort_key_fields(client_dict)
+            if fields['name_lower'] is None:
+                # Nameless clients stay out of the name-ordered query
+                del fields['name_lower']
+            changes = {field: value for field, value in fields.items()
+                       if field not in client_dict or client_dict[field] != value}
+            if changes:
+                writer.update(doc.reference, changes, key=doc.id)
+        result = writer.flush()
+        if result.failed or result.uncertain:
+            logger.error(f"Client sort key backfill left {result.failure_count + len(result.uncertain)} clients unconfirmed")
+        else:
+            self.sort_keys_marker_ref.set({
+                'version': SORT_KEYS_VERSION,
+                'backfilled_at': datetime.now(),
+                'updated': result.success_count
+            })
+        logger.info(f"Backfilled client sort keys on {result.success_count} clients")
+        return result.to_dict()
+
+
+# Global instance
+client_paginator = ClientPaginator()
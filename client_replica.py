@@ -0,0 +1,418 @@
+"""
+Client Replica
+Process-wide, in-memory read model of the clients and users collections kept
+current by Firestore on_snapshot listeners. Request handlers read documents,
+counts and the name-ordered client list from memory instead of streaming the
+collection per request. If a listener dies or reports an error the replica
+keeps serving for at most REPLICA_MAX_STALENESS seconds, then resubscribes
+and reloads before answering. Writes made by this process are applied
+through note_write() as soon as they succeed, so a redirect after a write
+reads the change without waiting for the listener to deliver it
+"""
+
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+
+from google.cloud.firestore import DELETE_FIELD, SERVER_TIMESTAMP, Increment, ArrayUnion, ArrayRemove
+
+from firebase_config import db
+from firestore_counts import count_query
+from client_pagination import LISTED_STATUSES, sort_key_fields
+
+logger = logging.getLogger(__name__)
+
+# 'on' serves reads from the replica; 'off' makes every read go to Firestore
+CLIENT_REPLICA = os.getenv('CLIENT_REPLICA', 'on').lower()
+
+# Longest time (seconds) an unhealthy replica may keep answering before a resync
+REPLICA_MAX_STALENESS = float(os.getenv('REPLICA_MAX_STALENESS', '30'))
+
+# Seconds to wait for a listener's first snapshot before reading the collection directly
+REPLICA_START_TIMEOUT = float(os.getenv('REPLICA_START_TIMEOUT', '30'))
+
+# Stored care_type values that normalize to 'after_care'
+AFTER_CARE_SPELLINGS = ['after_care', 'aftercare', 'After Care', 'After_Care', 'Aftercare', 'after care']
+
+_MISSING = object()
+
+
+class ReplicaDocument:
+    """Snapshot-like view of a replicated document (id, exists, reference, to_dict())"""
+    __slots__ = ('id', '_data', '_collection')
+
+    exists = True
+
+    def __init__(self, collection, doc_id, data):
+        self._collection = collection
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def reference(self):
+        return db.collection(self._collection).document(self.id)
+
+    def get(self, field, default=None):
+        return self._data.get(field, default)
+
+    def to_dict(self):
+        """Shallow copy of the document data; nested values are shared and must not be mutated"""
+        return dict(self._data)
+
+
+def _deep_size(value, seen):
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(item, seen) for item in value)
+    return size
+
+
+class CollectionReplica:
+    """Listener-maintained copy of one Firestore collection"""
+
+    def __init__(self, collection, enabled=CLIENT_REPLICA != 'off',
+                 max_staleness=REPLICA_MAX_STALENESS, start_timeout=REPLICA_START_TIMEOUT):
+        """
+        Args:
+            collection (str): Collection name
+            enabled (bool): When False, reads stream from Firestore every time
+            max_staleness (float): Seconds an unhealthy replica may keep serving
+            start_timeout (float): Seconds to wait for the first snapshot
+        """
+        self.collection = collection
+        self.enabled = enabled
+        self.max_staleness = max_staleness
+        self.start_timeout = start_timeout
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._docs = {}
+        self._listeners = []
+        self._watch = None
+        self._ready = threading.Event()
+        self._reconcile = False
+        self._unhealthy_since = None
+        self._last_error = None
+        self._read_time = None
+        self.stats = {'snapshots': 0, 'changes': 0, 'resyncs': 0, 'errors': 0, 'direct_reads': 0}
+
+    def add_listener(self, listener):
+        """
+        Register a callback for document changes, called as listener(doc_id, old, new)
+        with the previous and current document data (None when absent)
+        """
+        self._listeners.append(listener)
+
+    def _apply(self, doc_id, data):
+        old = self._docs.get(doc_id)
+        if data is None:
+            if old is None:
+                return
+            del self._docs[doc_id]
+        else:
+            self._docs[doc_id] = data
+        self.stats['changes'] += 1
+        for listener in self._listeners:
+            try:
+                listener(doc_id, old, data)
+            except Exception as e:
+                logger.error(f"{self.collection} replica listener failed for {doc_id}: {e}")
+
+    def note_write(self, doc_id, data, merge=True):
+        """
+        Apply a write this process has just made, ahead of the listener
+
+        The listener later delivers the stored document and replaces this copy.
+        Server-side transforms (SERVER_TIMESTAMP, Increment, array unions) are
+        left for the listener to fill in.
+
+        Args:
+            doc_id (str): Document id
+            data (dict): Fields written (None when the document was deleted)
+            merge (bool): True for update()/set(merge=True); False when data is the whole document
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if data is None:
+                self._apply(doc_id, None)
+                return
+            current = self._docs.get(doc_id)
+            new = dict(current) if merge and current is not None else {}
+            for field, value in data.items():
+                if value is DELETE_FIELD:
+                    new.pop(field, None)
+                elif value is SERVER_TIMESTAMP or isinstance(value, (Increment, ArrayUnion, ArrayRemove)):
+                    continue
+                else:
+                    new[field] = value
+            if new != current:
+                self._apply(doc_id, new)
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        try:
+            with self._lock:
+                if self._reconcile:
+                    # The first snapshot after subscribing is the whole collection;
+                    # documents deleted while unsubscribed are simply absent from it
+                    present = {doc.id for doc in snapshots}
+                    for doc_id in [doc_id for doc_id in self._docs if doc_id not in present]:
+                        self._apply(doc_id, None)
+                    self._reconcile = False
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == 'REMOVED':
+                        self._apply(doc.id, None)
+                    else:
+                        self._apply(doc.id, doc.to_dict())
+                self._read_time = read_time
+                self._unhealthy_since = None
+                self.stats['snapshots'] += 1
+            self._ready.set()
+        except Exception as e:
+            self._mark_unhealthy(e)
+
+    def _mark_unhealthy(self, error):
+        with self._lock:
+            self.stats['errors'] += 1
+            self._last_error = str(error)
+            if self._unhealthy_since is None:
+                self._unhealthy_since = time.time()
+        logger.error(f"{self.collection} replica error: {error}")
+
+    def _subscribe(self):
+        self._ready.clear()
+        self._reconcile = True
+        self._watch = db.collection(self.collection).on_snapshot(self._on_snapshot)
+        # Wait without holding _lock: the snapshot callback needs it
+        if not self._ready.wait(self.start_timeout):
+            raise TimeoutError(f"No snapshot for {self.collection} within {self.start_timeout}s")
+
+    def _load_directly(self):
+        docs = {doc.id: doc.to_dict() for doc in db.collection(self.collection).stream()}
+        with self._lock:
+            for doc_id in [doc_id for doc_id in self._docs if doc_id not in docs]:
+                self._apply(doc_id, None)
+            for doc_id, data in docs.items():
+                if self._docs.get(doc_id) != data:
+                    self._apply(doc_id, data)
+
+    def resync(self):
+        """Drop the listener, resubscribe and reconcile the replica with Firestore"""
+        with self._sync_lock:
+            self._resync()
+
+    def _resync(self):
+        self.stats['resyncs'] += 1
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+            self._watch = None
+        try:
+            self._subscribe()
+            self._unhealthy_since = None
+            logger.info(f"{self.collection} replica synced: {len(self._docs)} documents")
+        except Exception as e:
+            # Serve a direct read and try the listener again after max_staleness
+            self._mark_unhealthy(e)
+            self._load_directly()
+            self._unhealthy_since = time.time()
+
+    def _needs_resync(self):
+        if self._watch is None and self._unhealthy_since is None:
+            return True
+        return self._unhealthy_since is not None and time.time() - self._unhealthy_since > self.max_staleness
+
+    def _ensure_fresh(self):
+        if self._watch is not None and self._unhealthy_since is None and not getattr(self._watch, 'is_active', True):
+            self._mark_unhealthy('listener stopped')
+        if self._needs_resync():
+            with self._sync_lock:
+                if self._needs_resync():
+                    self._resync()
+
+    def is_stale(self):
+        """True while the listener is unhealthy (reads may lag Firestore by up to max_staleness)"""
+        return self._unhealthy_since is not None
+
+    def documents(self, **filters):
+        """
+        Documents whose fields equal the given values, like chained where('field', '==', value)
+        (a document lacking a filtered field never matches)
+
+        Returns:
+            list: ReplicaDocument objects
+        """
+        if not self.enabled:
+            self.stats['direct_reads'] += 1
+            query = db.collection(self.collection)
+            for field, value in filters.items():
+                query = query.where(field, '==', value)
+            return list(query.stream())
+
+        self._ensure_fresh()
+        with self._lock:
+            items = list(self._docs.items())
+        return [ReplicaDocument(self.collection, doc_id, data) for doc_id, data in items
+                if all(data.get(field, _MISSING) == value for field, value in filters.items())]
+
+    def get(self, doc_id):
+        """
+        One document by id
+
+        Returns:
+            ReplicaDocument or None
+        """
+        if not self.enabled:
+            doc = db.collection(self.collection).document(doc_id).get()
+            return doc if doc.exists else None
+        self._ensure_fresh()
+        with self._lock:
+            data = self._docs.get(doc_id)
+        return ReplicaDocument(self.collection, doc_id, data) if data is not None else None
+
+    def memory_report(self):
+        """
+        Estimated memory held by the replicated documents
+
+        Returns:
+            dict: Document count and approximate deep size in bytes
+        """
+        with self._lock:
+            seen = set()
+            size = _deep_size(self._docs, seen)
+            return {'documents': len(self._docs), 'approx_bytes': size}
+
+    def get_stats(self):
+        """
+        Get listener health and change counters
+
+        Returns:
+            dict: Replica statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['enabled'] = self.enabled
+            stats['documents'] = len(self._docs)
+            stats['listening'] = self._watch is not None
+            stats['stale'] = self.is_stale()
+            stats['unhealthy_seconds'] = round(time.time() - self._unhealthy_since, 1) if self._unhealthy_since else 0
+            stats['last_error'] = self._last_error
+            stats['read_time'] = str(self._read_time) if self._read_time else None
+        return stats
+
+
+class ClientReplica(CollectionReplica):
+    """Clients replica with normalized summaries, care-type counts and a name-ordered list"""
+
+    def __init__(self, **kwargs):
+        super().__init__('clients', **kwargs)
+        # Normalized care_type/status/archived/name_lower per client
+        self._summaries = {}
+        # (name_lower, id) of listed clients, kept sorted
+        self._ordered = []
+        self.add_listener(self._update_summary)
+
+    def _update_summary(self, doc_id, old, new):
+        previous = self._summaries.pop(doc_id, None)
+        if previous is not None and self._is_listed(previous):
+            index = bisect.bisect_left(self._ordered, (previous['name_lower'], doc_id))
+            if index < len(self._ordered) and self._ordered[index] == (previous['name_lower'], doc_id):
+                del self._ordered[index]
+        if new is None:
+            return
+        summary = sort_key_fields(new)
+        self._summaries[doc_id] = summary
+        if self._is_listed(summary):
+            bisect.insort(self._ordered, (summary['name_lower'], doc_id))
+
+    @staticmethod
+    def _is_listed(summary):
+        return summary['name_lower'] is not None and not summary['archived'] and summary['status'] in LISTED_STATUSES
+
+    def care_type_counts(self):
+        """
+        Non-archived clients per normalized care type
+
+        Returns:
+            dict: {'in_house': n, 'after_care': n}
+        """
+        if not self.enabled:
+            # Server-side counts; stored care types are canonical once sort keys are backfilled
+            query = db.collection(self.collection).where('archived', '==', False)
+            total = count_query(query)
+            after_care = count_query(query.where('care_type', 'in', AFTER_CARE_SPELLINGS))
+            return {'in_house': total - after_care, 'after_care': after_care}
+        counts = {'in_house': 0, 'after_care': 0}
+        self._ensure_fresh()
+        with self._lock:
+            for summary in self._summaries.values():
+                if not summary['archived']:
+                    counts[summary['care_type']] += 1
+        return counts
+
+    def page(self, page, per_page, care_type=None, status=None):
+        """
+        One page of the /clients list (listed statuses, name order) from memory
+
+        Args:
+            page (int): 1-based page number
+            per_page (int): Rows per page
+            care_type (str): Care type filter
+            status (str): Status filter
+
+        Returns:
+            tuple: (list of (document id, client dict), pagination dict) in
+            ClientPaginator.page's format
+        """
+        self._ensure_fresh()
+        with self._lock:
+            if care_type or status:
+                ids = [doc_id for _, doc_id in self._ordered
+                       if (not care_type or self._summaries[doc_id]['care_type'] == care_type)
+                       and (not status or self._summaries[doc_id]['status'] == status)]
+            else:
+                ids = [doc_id for _, doc_id in self._ordered]
+            total = len(ids)
+            total_pages = (total + per_page - 1) // per_page
+            page = min(max(page, 1), max(total_pages, 1))
+            start_idx = (page - 1) * per_page
+            rows = [(doc_id, dict(self._docs[doc_id])) for doc_id in ids[start_idx:start_idx + per_page]]
+
+        end_idx = start_idx + len(rows)
+        pagination = {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'total_pages': total_pages,
+            'has_prev': page > 1,
+            'has_next': page < total_pages,
+            'prev_num': page - 1 if page > 1 else None,
+            'next_num': page + 1 if page < total_pages else None,
+            'prev_token': None,
+            'next_token': None,
+            'start_record': start_idx + 1 if total > 0 else 0,
+            'end_record': end_idx
+        }
+        return rows, pagination
+
+    def memory_report(self):
+        report = super().memory_report()
+        with self._lock:
+            seen = set()
+            report['index_bytes'] = _deep_size(self._summaries, seen) + _deep_size(self._ordered, seen)
+        return report
+
+
+# Global instances
+client_replica = ClientReplica()
+user_replica = CollectionReplica('users')
@@ -0,0 +1,337 @@
+"""
+Client Search
+In-process typeahead index over client name, clientId, barangay and
+municipality. Every token is stored under its leading prefixes (edge n-grams)
+and its trigrams, so a query token is resolved to candidate clients with a few
+set lookups whether it is the start of a word ("mar" -> Maria) or a fragment
+of an ID ("042" -> BF-0042). Clients are added, changed and removed one at a
+time as the clients replica reports changes; a TTL resync covers anything the
+change feed missed
+"""
+
+import os
+import re
+import time
+import heapq
+import logging
+import threading
+import unicodedata
+
+from laguna_locations_api import resolve_address
+from client_pagination import normalize_care_type, normalize_status
+
+logger = logging.getLogger(__name__)
+
+# Longest prefix stored per token; longer query tokens are checked against the tokens
+CLIENT_SEARCH_MAX_PREFIX = int(os.getenv('CLIENT_SEARCH_MAX_PREFIX', '12'))
+
+# Seconds before the index is resynchronized through its loader
+CLIENT_SEARCH_TTL = float(os.getenv('CLIENT_SEARCH_TTL', '300'))
+
+# Relative weight of a match in each field
+FIELD_WEIGHTS = {'clientId': 4.0, 'name': 3.0, 'barangay': 1.5, 'municipality': 1.0}
+
+# Match quality multipliers: whole token, token prefix, fragment inside a token
+EXACT_MATCH = 3.0
+PREFIX_MATCH = 2.0
+INFIX_MATCH = 1.0
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lowercase text without accents (Biñan -> binan)"""
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    """Normalized word tokens of a field value"""
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class ClientSearchIndex:
+    """Prefix and trigram index for client typeahead"""
+
+    def __init__(self, loader=None, ttl=CLIENT_SEARCH_TTL, max_prefix=CLIENT_SEARCH_MAX_PREFIX):
+        """
+        Args:
+            loader (callable): Returns an iterable of (client_id, client_dict)
+                for the full client set; used by ensure_fresh()
+            ttl (float): Seconds before ensure_fresh() resynchronizes
+            max_prefix (int): Longest prefix stored per token
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.max_prefix = max_prefix
+        self._lock = threading.RLock()
+        # client_id -> {'tokens': {token: weight}, 'result': dict, 'name_key': str}
+        self._entries = {}
+        # prefix -> {client_id: best score of a query token equal to the prefix}
+        self._prefixes = {}
+        # trigram -> set of client ids
+        self._trigrams = {}
+        # address -> (barangay, municipality) resolved through the gazetteer
+        self._places = {}
+        self._loaded_at = None
+        self._stale = True
+        self.stats = {'syncs': 0, 'upserts': 0, 'searches': 0, 'last_sync_ms': 0.0}
+
+    def _place(self, client_dict):
+        """Barangay and municipality of a client, from stored fields or its address"""
+        barangay = client_dict.get('barangay')
+        municipality = client_dict.get('municipality')
+        if barangay and municipality:
+            return barangay, municipality
+        address = (client_dict.get('address') or '').strip()
+        if not address:
+            return barangay, municipality
+        if address not in self._places:
+            match = resolve_address(address)
+            self._places[address] = (match.barangay, match.municipality_name) if match else (None, None)
+        resolved_barangay, resolved_municipality = self._places[address]
+        return barangay or resolved_barangay, municipality or resolved_municipality
+
+    def _entry(self, client_id, client_dict):
+        """Searchable entry for a client, or None when it should not be searchable"""
+        if client_dict is None or client_dict.get('archived'):
+            return None
+        name = client_dict.get('name')
+        if not name:
+            return None
+
+        barangay, municipality = self._place(client_dict)
+        values = {
+            'name': name,
+            'clientId': client_dict.get('clientId'),
+            'barangay': barangay,
+            'municipality': municipality
+        }
+        tokens = {}
+        for field, value in values.items():
+            for token in tokenize(value):
+                tokens[token] = max(tokens.get(token, 0.0), FIELD_WEIGHTS[field])
+
+        return {
+            'tokens': tokens,
+            'name_key': normalize(name),
+            'result': {
+                'id': client_id,
+                'name': name,
+                'clientId': client_dict.get('clientId', 'N/A'),
+                'age': client_dict.get('age', 'N/A'),
+                'gender': client_dict.get('gender', 'Not specified'),
+                'care_type': normalize_care_type(client_dict.get('care_type')),
+                'status': normalize_status(client_dict.get('status')),
+                'barangay': barangay,
+                'municipality': municipality
+            }
+        }
+
+    def _add(self, client_id, entry):
+        for token, weight in entry['tokens'].items():
+            for length in range(1, min(len(token), self.max_prefix) + 1):
+                scores = self._prefixes.setdefault(token[:length], {})
+                score = weight * (EXACT_MATCH if length == len(token) else PREFIX_MATCH)
+                if score > scores.get(client_id, 0.0):
+                    scores[client_id] = score
+            for trigram in _trigrams(token):
+                self._trigrams.setdefault(trigram, set()).add(client_id)
+        self._entries[client_id] = entry
+
+    def _discard(self, client_id):
+        entry = self._entries.pop(client_id, None)
+        if entry is None:
+            return
+        for token in entry['tokens']:
+            for length in range(1, min(len(token), self.max_prefix) + 1):
+                self._remove_posting(self._prefixes, token[:length], client_id)
+            for trigram in _trigrams(token):
+                self._remove_posting(self._trigrams, trigram, client_id)
+
+    @staticmethod
+    def _remove_posting(postings, key, client_id):
+        members = postings.get(key)
+        if members is not None:
+            if isinstance(members, dict):
+                members.pop(client_id, None)
+            else:
+                members.discard(client_id)
+            if not members:
+                del postings[key]
+
+    def upsert(self, client_id, client_dict):
+        """
+        Add, update or drop one client according to its current document
+
+        Args:
+            client_id (str): Firestore document id
+            client_dict (dict): Client document data (None when deleted)
+
+        Returns:
+            bool: True if the index changed
+        """
+        entry = self._entry(client_id, client_dict)
+        with self._lock:
+            current = self._entries.get(client_id)
+            if current is None and entry is None:
+                return False
+            if current is not None and entry is not None and current['tokens'] == entry['tokens']:
+                # Only displayed fields changed
+                current['result'] = entry['result']
+                current['name_key'] = entry['name_key']
+                return True
+            self._discard(client_id)
+            if entry is not None:
+                self._add(client_id, entry)
+            self.stats['upserts'] += 1
+            return True
+
+    def sync(self, records):
+        """
+        Bring the index in line with a full client listing
+
+        Args:
+            records: Iterable of (client_id, client_dict)
+
+        Returns:
+            int: Number of searchable clients
+        """
+        start = time.perf_counter()
+        with self._lock:
+            seen = set()
+            for client_id, client_dict in records:
+                seen.add(client_id)
+                self.upsert(client_id, client_dict)
+            for client_id in [cid for cid in self._entries if cid not in seen]:
+                self._discard(client_id)
+            self._loaded_at = time.time()
+            self._stale = False
+            self.stats['syncs'] += 1
+            self.stats['last_sync_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            return len(self._entries)
+
+    def invalidate(self):
+        """Mark the index stale so the next search resynchronizes"""
+        self._stale = True
+
+    def ensure_fresh(self):
+        """Resynchronize through the loader when stale or older than the TTL"""
+        if self.loader is None:
+            return
+        expired = self._loaded_at is None or time.time() - self._loaded_at > self.ttl
+        if self._stale or expired:
+            # Load outside the lock: the loader may take locks of its own
+            self.sync(list(self.loader()))
+
+    def _matches(self, token):
+        """Best match score per client with a token starting with, or containing, a query token"""
+        if len(token) <= self.max_prefix:
+            matches = dict(self._prefixes.get(token, {}))
+        else:
+            matches = {}
+            for client_id in self._prefixes.get(token[:self.max_prefix], ()):
+                score = self._token_score(token, self._entries[client_id]['tokens'])
+                if score:
+                    matches[client_id] = score
+        if len(token) >= 3:
+            trigram_sets = [self._trigrams.get(trigram) for trigram in _trigrams(token)]
+            if all(trigram_sets):
+                for client_id in set.intersection(*trigram_sets):
+                    if client_id not in matches:
+                        score = self._token_score(token, self._entries[client_id]['tokens'])
+                        if score:
+                            matches[client_id] = score
+        return matches
+
+    @staticmethod
+    def _token_score(token, tokens):
+        best = 0.0
+        for candidate, weight in tokens.items():
+            if candidate == token:
+                quality = EXACT_MATCH
+            elif candidate.startswith(token):
+                quality = PREFIX_MATCH
+            elif token in candidate:
+                quality = INFIX_MATCH
+            else:
+                continue
+            best = max(best, weight * quality)
+        return best
+
+    def search(self, query, limit=10, care_type=None, exclude_statuses=None):
+        """
+        Top-ranked clients matching every token of a query
+
+        Args:
+            query (str): Free text (name, clientId, barangay, municipality fragments)
+            limit (int): Maximum number of results
+            care_type (str): Only clients of this normalized care type
+            exclude_statuses (iterable): Normalized statuses to leave out
+
+        Returns:
+            list: Client summaries with a 'score', best first
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        self.ensure_fresh()
+        excluded = set(exclude_statuses or ())
+        normalized_query = normalize(query).strip()
+
+        with self._lock:
+            # Resolve the longest (most selective) token first and stop on no match
+            candidates = None
+            for token in sorted(tokens, key=len, reverse=True):
+                matches = self._matches(token)
+                if candidates is None:
+                    candidates = matches
+                else:
+                    candidates = {client_id: score + matches[client_id]
+                                  for client_id, score in candidates.items() if client_id in matches}
+                if not candidates:
+                    return []
+
+            scored = []
+            for client_id, score in candidates.items():
+                entry = self._entries[client_id]
+                result = entry['result']
+                if care_type and result['care_type'] != care_type:
+                    continue
+                if result['status'] in excluded:
+                    continue
+                if entry['name_key'].startswith(normalized_query):
+                    score += FIELD_WEIGHTS['name']
+                scored.append((score, entry['name_key'], client_id))
+
+            top = heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1]))
+            results = [dict(self._entries[client_id]['result'], score=round(score, 2))
+                       for score, _, client_id in top]
+            self.stats['searches'] += 1
+        return results
+
+    def get_stats(self):
+        """
+        Get index size and synchronization statistics
+
+        Returns:
+            dict: Index statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['clients'] = len(self._entries)
+            stats['prefixes'] = len(self._prefixes)
+            stats['trigrams'] = len(self._trigrams)
+            stats['stale'] = self._stale
+            stats['age_seconds'] = round(time.time() - self._loaded_at, 1) if self._loaded_at else None
+        return stats
+
+
+# Global instance (app.py sets the loader)
+client_search_index = ClientSearchIndex()
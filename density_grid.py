@@ -0,0 +1,163 @@
+"""
+Client Density Grid
+Multi-resolution heat-map grid of client locations. Clients are binned into a
+fine NumPy count grid over the Laguna extent, split by care type and status,
+with a pyramid of coarser levels (each cell summing 2x2 cells of the level
+below). Every level is updated in place when a client is added, moved or
+removed, so a heat-map request only slices and sums the level matching its zoom
+"""
+
+import os
+import math
+import logging
+import threading
+
+import numpy as np
+
+from map_index import CARE_TYPES, STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Grid extent (south, west, north, east); clients outside it are not binned
+DENSITY_BOUNDS = tuple(float(value) for value in
+                       os.getenv('DENSITY_BOUNDS', '13.9,120.8,14.7,121.6').split(','))
+
+# Finest cell size in degrees (~275m) and number of coarser pyramid levels
+DENSITY_BASE_CELL = float(os.getenv('DENSITY_BASE_CELL', '0.0025'))
+DENSITY_LEVELS = int(os.getenv('DENSITY_LEVELS', '8'))
+
+# Target on-screen size of a heat cell in pixels (the heat layer radius is 35px)
+HEAT_CELL_PX = int(os.getenv('HEAT_CELL_PX', '16'))
+
+
+class DensityGrid:
+    """Counts of clients per cell, per care type and status, at several resolutions"""
+
+    def __init__(self, bounds=DENSITY_BOUNDS, base_cell=DENSITY_BASE_CELL, levels=DENSITY_LEVELS):
+        """
+        Args:
+            bounds (tuple): (south, west, north, east) in degrees
+            base_cell (float): Cell size of the finest level in degrees
+            levels (int): Number of levels; level k cells are base_cell * 2**k wide
+        """
+        self.south, self.west, self.north, self.east = bounds
+        self.base_cell = base_cell
+        self._lock = threading.Lock()
+
+        rows = math.ceil((self.north - self.south) / base_cell)
+        cols = math.ceil((self.east - self.west) / base_cell)
+        # levels[k] has shape (care types, statuses, rows, cols) at cell size base_cell * 2**k
+        self.levels = [
+            np.zeros((len(CARE_TYPES), len(STATUSES), math.ceil(rows / 2 ** k), math.ceil(cols / 2 ** k)),
+                     dtype=np.int32)
+            for k in range(levels)
+        ]
+        self._care_index = {care_type: i for i, care_type in enumerate(CARE_TYPES)}
+        self._status_index = {status: i for i, status in enumerate(STATUSES)}
+        self.points = 0
+        self.outside = 0
+
+    def _base_cell(self, lat, lng):
+        row = int((lat - self.south) // self.base_cell)
+        col = int((lng - self.west) // self.base_cell)
+        rows, cols = self.levels[0].shape[2:]
+        if 0 <= row < rows and 0 <= col < cols:
+            return row, col
+        return None
+
+    def _apply(self, point, delta):
+        cell = self._base_cell(point['lat'], point['lng'])
+        if cell is None:
+            self.outside += delta
+            return
+        care = self._care_index[point['care_type']]
+        status = self._status_index[point['status']]
+        row, col = cell
+        for level in self.levels:
+            level[care, status, row, col] += delta
+            row >>= 1
+            col >>= 1
+        self.points += delta
+
+    def update(self, old, new):
+        """
+        Move one client's contribution (ClientMapIndex listener)
+
+        Args:
+            old (dict): Previous map point or None
+            new (dict): Current map point or None
+        """
+        with self._lock:
+            if old is not None:
+                self._apply(old, -1)
+            if new is not None:
+                self._apply(new, 1)
+
+    def level_for_zoom(self, zoom):
+        """Finest level whose cells are at least HEAT_CELL_PX wide at a zoom level"""
+        target = 360.0 / (2 ** zoom) * HEAT_CELL_PX / 256
+        level = 0
+        while level + 1 < len(self.levels) and self.base_cell * 2 ** level < target:
+            level += 1
+        return level
+
+    def tile(self, bbox, zoom, care_types=None, statuses=None):
+        """
+        Non-empty cells inside a bounding box at the resolution for a zoom level
+
+        Args:
+            bbox (tuple): (west, south, east, north) in degrees
+            zoom (int): Map zoom level
+            care_types (set): Only count these care types (None for all)
+            statuses (set): Only count these statuses (None for all)
+
+        Returns:
+            dict: 'cell_degrees', 'points' as [lat, lng, count] cell centers,
+            'max' cell count and 'total' clients in the box
+        """
+        west, south, east, north = bbox
+        level = self.level_for_zoom(max(0, int(zoom)))
+        cell = self.base_cell * 2 ** level
+        care = [i for name, i in self._care_index.items() if care_types is None or name in care_types]
+        status = [i for name, i in self._status_index.items() if statuses is None or name in statuses]
+
+        with self._lock:
+            grid = self.levels[level]
+            rows, cols = grid.shape[2:]
+            row0 = min(max(int((south - self.south) // cell), 0), rows)
+            row1 = min(max(int((north - self.south) // cell) + 1, 0), rows)
+            col0 = min(max(int((west - self.west) // cell), 0), cols)
+            col1 = min(max(int((east - self.west) // cell) + 1, 0), cols)
+            counts = grid[:, :, row0:row1, col0:col1][np.ix_(care, status)].sum(axis=(0, 1))
+
+        hit_rows, hit_cols = np.nonzero(counts)
+        values = counts[hit_rows, hit_cols]
+        lats = np.round(self.south + (hit_rows + row0 + 0.5) * cell, 5)
+        lngs = np.round(self.west + (hit_cols + col0 + 0.5) * cell, 5)
+        return {
+            'level': level,
+            'cell_degrees': cell,
+            'points': np.column_stack((lats, lngs, values)).tolist(),
+            'max': int(values.max()) if values.size else 0,
+            'total': int(values.sum())
+        }
+
+    def get_stats(self):
+        """
+        Get grid size and population
+
+        Returns:
+            dict: Grid statistics
+        """
+        with self._lock:
+            return {
+                'points': self.points,
+                'outside_bounds': self.outside,
+                'levels': [list(level.shape[2:]) for level in self.levels],
+                'base_cell_degrees': self.base_cell,
+                'memory_bytes': sum(level.nbytes for level in self.levels)
+            }
+
+
+# Global instance
+density_grid = DensityGrid()
@@ -0,0 +1,261 @@
+"""
+Firestore Bulk Writes
+Queues document writes and commits them as WriteBatches of up to 500
+operations (Firestore's per-batch limit), several batches in parallel.
+Transient failures are retried with exponential backoff; a batch that still
+fails is replayed one document at a time so the error is reported against the
+document that caused it instead of the whole chunk. A timeout or dropped
+connection leaves it unknown whether the commit landed, so batches holding
+Increment transforms are never re-sent after one (their keys are reported as
+uncertain), and a re-sent create that finds its document already there counts
+as written
+"""
+
+import os
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore import Increment
+
+from firebase_config import db
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects batches with more than 500 writes
+BULK_BATCH_SIZE = min(int(os.getenv('BULK_BATCH_SIZE', '500')), 500)
+
+# Batches committed concurrently
+BULK_WRITE_WORKERS = int(os.getenv('BULK_WRITE_WORKERS', '4'))
+
+# Retries per commit for transient errors, and the first backoff delay in seconds
+BULK_WRITE_RETRIES = int(os.getenv('BULK_WRITE_RETRIES', '4'))
+BULK_RETRY_BASE_DELAY = float(os.getenv('BULK_RETRY_BASE_DELAY', '0.5'))
+
+# Transient errors raised before the commit was applied; always safe to retry
+RETRYABLE_ERRORS = (
+    google_exceptions.Aborted,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests
+)
+
+# Transient errors after which the commit may or may not have been applied
+AMBIGUOUS_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    ConnectionError,
+    TimeoutError
+)
+
+
+def _has_increment(value):
+    """True if a write payload contains an Increment transform (applying it twice double-counts)"""
+    if isinstance(value, Increment):
+        return True
+    if isinstance(value, dict):
+        return any(_has_increment(item) for item in value.values())
+    return False
+
+
+class BulkWriteResult:
+    """Outcome of a flush: keys of written documents and errors per failed key"""
+
+    def __init__(self):
+        self.succeeded = []
+        self.failed = {}
+        # Keys whose commit hit an ambiguous error and was not re-sent
+        self.uncertain = {}
+        self.batches = 0
+        self.retries = 0
+
+    @property
+    def success_count(self):
+        return len(self.succeeded)
+
+    @property
+    def failure_count(self):
+        return len(self.failed)
+
+    def merge(self, other):
+        self.succeeded.extend(other.succeeded)
+        self.failed.update(other.failed)
+        self.uncertain.update(other.uncertain)
+        self.batches += other.batches
+        self.retries += other.retries
+
+    def to_dict(self):
+        return {
+            'succeeded': self.success_count,
+            'failed': self.failure_count,
+            'errors': dict(self.failed),
+            'uncertain': dict(self.uncertain),
+            'batches': self.batches,
+            'retries': self.retries
+        }
+
+
+class BulkWriter:
+    """Buffered writer committing queued operations in parallel WriteBatches"""
+
+    def __init__(self, client=None, batch_size=BULK_BATCH_SIZE, max_workers=BULK_WRITE_WORKERS,
+                 max_retries=BULK_WRITE_RETRIES, base_delay=BULK_RETRY_BASE_DELAY):
+        """
+        Args:
+            client: Firestore client (defaults to the app's db)
+            batch_size (int): Operations per WriteBatch (at most 500)
+            max_workers (int): Batches committed concurrently
+            max_retries (int): Retries per commit for transient errors
+            base_delay (float): First backoff delay in seconds, doubled per retry
+        """
+        self.client = client or db
+        self.batch_size = min(batch_size, 500)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._operations = []
+
+    def __len__(self):
+        return len(self._operations)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def _queue(self, method, ref, args, key):
+        incremental = any(_has_increment(arg) for arg in args)
+        self._operations.append((key if key is not None else ref.path, method, ref, args, incremental))
+
+    def set(self, ref, data, merge=False, key=None):
+        """Queue a set() of a document; key identifies it in the result (default: its path)"""
+        self._queue('set', ref, (data, merge), key)
+
+    def update(self, ref, data, key=None):
+        """Queue an update() of an existing document"""
+        self._queue('update', ref, (data,), key)
+
+    def create(self, ref, data, key=None):
+        """Queue a create() that fails if the document exists"""
+        self._queue('create', ref, (data,), key)
+
+    def delete(self, ref, key=None):
+        """Queue a delete() of a document"""
+        self._queue('delete', ref, (), key)
+
+    def _commit(self, operations):
+        batch = self.client.batch()
+        for _, method, ref, args, _ in operations:
+            if method == 'set':
+                batch.set(ref, args[0], merge=args[1])
+            else:
+                getattr(batch, method)(ref, *args)
+        batch.commit()
+
+    def _commit_with_retry(self, operations, result):
+        """
+        Commit one batch, retrying transient errors
+
+        Returns:
+            tuple: (last error or None, True if a failed attempt may have been applied)
+        """
+        incremental = any(operation[4] for operation in operations)
+        ambiguous = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._commit(operations)
+                return None, ambiguous
+            except RETRYABLE_ERRORS as e:
+                error = e
+            except AMBIGUOUS_ERRORS as e:
+                ambiguous = True
+                if incremental:
+                    # Re-sending could apply the increments a second time
+                    return e, ambiguous
+                error = e
+            except Exception as e:
+                return e, ambiguous
+            if attempt == self.max_retries:
+                return error, ambiguous
+            result.retries += 1
+            delay = self.base_delay * 2 ** attempt
+            time.sleep(delay + random.uniform(0, delay / 2))
+
+    def _write_chunk(self, operations, maybe_applied=False):
+        result = BulkWriteResult()
+        result.batches += 1
+        error, ambiguous = self._commit_with_retry(operations, result)
+        maybe_applied = maybe_applied or ambiguous
+        if error is None:
+            result.succeeded.extend(operation[0] for operation in operations)
+            return result
+
+        if maybe_applied and any(operation[4] for operation in operations):
+            for operation in operations:
+                result.uncertain[operation[0]] = str(error)
+            logger.error("Batch of %d writes with increments may have been applied (%s); not re-sent",
+                         len(operations), error)
+            return result
+
+        if len(operations) == 1:
+            key, method = operations[0][:2]
+            if maybe_applied and method == 'create' and isinstance(error, google_exceptions.AlreadyExists):
+                # The attempt that timed out did create the document
+                result.succeeded.append(key)
+            else:
+                result.failed[key] = str(error)
+            return result
+
+        # A batch is all-or-nothing; replay it per document to find the bad ones
+        logger.warning("Batch of %d writes failed (%s); retrying documents individually", len(operations), error)
+        for operation in operations:
+            result.merge(self._write_chunk([operation], maybe_applied))
+        return result
+
+    def flush(self):
+        """
+        Commit every queued operation
+
+        Returns:
+            BulkWriteResult: Written keys and per-document errors
+        """
+        operations, self._operations = self._operations, []
+        result = BulkWriteResult()
+        if not operations:
+            return result
+
+        chunks = [operations[i:i + self.batch_size] for i in range(0, len(operations), self.batch_size)]
+        if len(chunks) == 1 or self.max_workers <= 1:
+            for chunk in chunks:
+                result.merge(self._write_chunk(chunk))
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks)),
+                                    thread_name_prefix='bulk-writer') as executor:
+                for chunk_result in executor.map(self._write_chunk, chunks):
+                    result.merge(chunk_result)
+
+        logger.info("Bulk write: %d succeeded, %d failed, %d uncertain in %d batches (%d retries)",
+                    result.success_count, result.failure_count, len(result.uncertain),
+                    result.batches, result.retries)
+        return result
+
+
+def bulk_update(updates, client=None):
+    """
+    Apply update() to many documents
+
+    Args:
+        updates: Iterable of (document reference, data) pairs
+        client: Firestore client (defaults to the app's db)
+
+    Returns:
+        BulkWriteResult: Results keyed by document path
+    """
+    writer = BulkWriter(client)
+    for ref, data in updates:
+        writer.update(ref, data)
+    return writer.flush()
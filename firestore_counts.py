@@ -0,0 +1,48 @@
+"""
+Firestore Counts
+Document counts through Firestore aggregation queries. count() is evaluated
+on the server and billed as one read per 1000 index entries, so counting a
+collection no longer streams and deserializes every document. When the
+aggregation is unavailable the count falls back to a keys-only query, which
+still avoids transferring document data
+"""
+
+import logging
+
+from firebase_config import db
+
+logger = logging.getLogger(__name__)
+
+
+def count_query(query):
+    """
+    Number of documents matching a query
+
+    Args:
+        query: Firestore query or collection reference
+
+    Returns:
+        int: Matching document count
+    """
+    try:
+        return query.count().get()[0][0].value
+    except Exception as e:
+        logger.warning(f"Count aggregation failed, counting keys instead: {e}")
+        return sum(1 for _ in query.select([]).stream())
+
+
+def count_collection(path, **filters):
+    """
+    Number of documents in a collection whose fields equal the given values
+
+    Args:
+        path (str): Collection path, e.g. 'clients' or 'clients/<id>/notes'
+        **filters: Field equality filters, like chained where('field', '==', value)
+
+    Returns:
+        int: Matching document count
+    """
+    query = db.collection(path)
+    for field, value in filters.items():
+        query = query.where(field, '==', value)
+    return count_query(query)
@@ -4,15 +4,142 @@ Firestore Schema and Database Operations for Client Notes NLP Pipeline
 
 from firebase_config import db
 from firebase_admin import firestore
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from firestore_bulk import BulkWriter
+from note_search import note_search_index
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Iterator, Union
+import os
+import time
+import hashlib
 import logging
+import threading
+
+# Materialized cross-client analytics document used by the dashboard
+ANALYTICS_ROLLUP_COLLECTION = 'meta'
+ANALYTICS_ROLLUP_DOCUMENT = 'analytics_rollup'
+ANALYTICS_DOMAINS = ['emotional', 'cognitive', 'social']
+# Keyword counts and daily buckets live in subcollections of the rollup document
+ANALYTICS_KEYWORDS_COLLECTION = 'keywords'
+ANALYTICS_DAILY_COLLECTION = 'daily'
+# Bumped when the rollup layout changes; an older rollup is rebuilt on first read
+ANALYTICS_ROLLUP_SCHEMA_VERSION = 2
+ANALYTICS_TOP_KEYWORDS = 15
+ANALYTICS_TREND_DAYS = 7
+
+# Seconds a rollup rebuild holds its lease (renewed while it streams notes); rollup
+# writers wait while a lease is held so the rebuilt totals cannot race their increments
+ANALYTICS_REBUILD_LEASE = float(os.getenv('ANALYTICS_REBUILD_LEASE', '300'))
+# Seconds a note write waits for a running rebuild before failing
+ANALYTICS_REBUILD_WAIT = float(os.getenv('ANALYTICS_REBUILD_WAIT', '30'))
+
+# Most writes committed in one rollup transaction (Firestore allows 500)
+ROLLUP_TRANSACTION_WRITES = 450
+
+
+class AnalyticsRollupBusy(Exception):
+    """Raised when a rollup rebuild holds its lease and increments must wait"""
+    pass
+
+
+def sentiment_display_score(sentiment_score) -> float:
+    """Convert a note sentiment score (-1/0/1) to the dashboard 1-10 scale"""
+    if sentiment_score == 1:  # positive
+        return 8.0
+    elif sentiment_score == 0:  # neutral
+        return 5.0
+    return 2.0  # negative
+
+
+def domain_display_score(domain_score) -> float:
+    """Convert a note domain score (-1..1) to the dashboard 1-10 scale"""
+    return max(1.0, min(10.0, (domain_score + 1) * 5))
+
+
+def note_day(note_data: Dict[str, Any]) -> Optional[str]:
+    """Return the YYYY-MM-DD bucket for a note's created_at value"""
+    created_at = note_data.get('created_at')
+    if not created_at:
+        return None
+    try:
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        return created_at.strftime('%Y-%m-%d')
+    except Exception:
+        return None
+
+
+def _rebuild_in_progress(rollup_data: Optional[Dict[str, Any]]) -> bool:
+    """Whether a rollup document carries an unexpired rebuild lease"""
+    return bool(rollup_data) and (rollup_data.get('rebuild_lease_expires') or 0) > time.time()
+
+
+@firestore.transactional
+def _claim_rebuild_lease(transaction, rollup_ref):
+    """Take the rollup rebuild lease; False if another rebuild holds it"""
+    snapshot = rollup_ref.get(transaction=transaction)
+    if snapshot.exists and _rebuild_in_progress(snapshot.to_dict()):
+        return False
+    transaction.set(rollup_ref, {'rebuild_lease_expires': time.time() + ANALYTICS_REBUILD_LEASE}, merge=True)
+    return True
+
+
+@firestore.transactional
+def _claim_stale_note(transaction, note_ref, stale_after):
+    """Claim a pending note nobody has worked on for stale_after seconds"""
+    snapshot = note_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return False
+    note_data = snapshot.to_dict()
+    if note_data.get('analysis_status') != 'pending' or time.time() - _analysis_claimed_at(note_data) < stale_after:
+        return False
+    transaction.update(note_ref, {'analysis_claimed_at': time.time()})
+    return True
+
+
+def _analysis_claimed_at(note_data: Dict[str, Any]) -> float:
+    """When a process last took on a note's analysis (its creation time for older notes)"""
+    claimed_at = note_data.get('analysis_claimed_at')
+    if claimed_at:
+        return claimed_at
+    try:
+        return datetime.fromisoformat(str(note_data.get('created_at')).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return 0.0
+
+
+@firestore.transactional
+def _write_with_rollup(transaction, rollup_ref, note_refs, plan):
+    """
+    Read notes, then apply note writes and their rollup increments atomically
+    
+    plan(snapshots) returns (writes, rollup_writes, result): writes are
+    (op, ref, payload) tuples with op 'create', 'set', 'update' or 'delete',
+    rollup_writes are (ref, merge payload) pairs. Raises AnalyticsRollupBusy
+    while a rebuild holds its lease, so no increment lands between the
+    rebuild's scan and its overwrite of the totals.
+    """
+    rollup_snapshot = rollup_ref.get(transaction=transaction)
+    if rollup_snapshot.exists and _rebuild_in_progress(rollup_snapshot.to_dict()):
+        raise AnalyticsRollupBusy('Analytics rollup rebuild in progress')
+    snapshots = list(transaction.get_all(note_refs)) if note_refs else []
+    
+    writes, rollup_writes, result = plan(snapshots)
+    for op, ref, payload in writes:
+        if op == 'delete':
+            transaction.delete(ref)
+        else:
+            getattr(transaction, op)(ref, payload)
+    for ref, payload in rollup_writes:
+        transaction.set(ref, payload, merge=True)
+    return result
+
 
 class FirestoreSchema:
     """Firestore schema definitions and database operations"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self._rebuild_lock = threading.Lock()
     
     def get_client_demographics(self, client_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -36,23 +163,166 @@ class FirestoreSchema:
             self.logger.error(f"Error retrieving client demographics: {e}")
             return None
     
-    def add_note_to_client(self, client_id: str, note_analysis: Dict[str, Any]) -> bool:
+    def add_note_to_client(self, client_id: str, note_analysis: Dict[str, Any], client_archived: bool) -> bool:
         """
         Add a new note with NLP analysis to client's notes subcollection
         
         Args:
             client_id (str): Client identifier
             note_analysis (dict): Complete note analysis from NLP pipeline
+            client_archived (bool): Whether the client is archived (copied onto the note)
             
         Returns:
             bool: Success status
         """
         try:
-            # Add note to subcollection
+            # Denormalize the owning client so collection-group queries can filter server-side
+            note_analysis.setdefault('client_id', client_id)
+            note_analysis['client_archived'] = bool(client_archived)
+            
+            client_ref = db.collection('clients').document(client_id)
+            note_ref = client_ref.collection('notes').document()
+            
+            # Add the note, update the client's note count and last note date and
+            # keep the dashboard rollup in step, all in one transaction
+            def plan(_):
+                writes = [
+                    ('create', note_ref, note_analysis),
+                    ('update', client_ref, {
+                        'total_notes': firestore.Increment(1),
+                        'last_note_date': datetime.now(),
+                        'updated_at': datetime.now()
+                    })
+                ]
+                return writes, self._analytics_rollup_writes(note_analysis, 1), None
+            
+            self._run_rollup_transaction([], plan)
+            note_search_index.add_note(client_id, note_ref.id, note_analysis)
+            
+            self.logger.info(f"Added note to client {client_id}")
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error adding note to client: {e}")
+            return False
+    
+    def add_notes_to_clients(self, notes: List[tuple]) -> Dict[str, Any]:
+        """
+        Add many analyzed notes through batched transactions
+        
+        Notes are grouped into transactions of up to ROLLUP_TRANSACTION_WRITES
+        writes; each one creates its notes and increments the clients' note
+        counts and the analytics rollup once for the whole group. The clients'
+        archived flags are read in one batch and copied onto their notes; notes
+        for clients that do not exist are not written.
+        
+        Args:
+            notes (list): (client_id, note_analysis) pairs
+            
+        Returns:
+            dict: 'created' count and 'errors' keyed by "client_id/index"
+        """
+        client_refs = [db.collection('clients').document(client_id)
+                       for client_id in dict.fromkeys(client_id for client_id, _ in notes)]
+        archived_by_client = {
+            doc.id: bool((doc.to_dict() or {}).get('archived', False))
+            for doc in db.get_all(client_refs, field_paths=['archived']) if doc.exists
+        }
+        
+        errors = {}
+        groups = [[]]
+        group_writes = 0
+        group_clients, group_keywords, group_days = set(), set(), set()
+        for index, (client_id, note_analysis) in enumerate(notes):
+            key = f"{client_id}/{index}"
+            if client_id not in archived_by_client:
+                errors[key] = 'Client not found'
+                continue
+            note_analysis.setdefault('client_id', client_id)
+            note_analysis['client_archived'] = archived_by_client[client_id]
+            note_ref = db.collection('clients').document(client_id).collection('notes').document()
+            
+            # Upper bound on the group's writes: notes, client counters, rollup documents
+            keywords = {keyword for keyword in note_analysis.get('keywords', []) if keyword}
+            added = (1 + (client_id not in group_clients) + len(keywords - group_keywords)
+                     + (note_day(note_analysis) not in group_days))
+            if groups[-1] and group_writes + added > ROLLUP_TRANSACTION_WRITES - 1:
+                groups.append([])
+                group_writes = 0
+                group_clients, group_keywords, group_days = set(), set(), set()
+                added = 2 + len(keywords) + 1
+            groups[-1].append((key, client_id, note_ref, note_analysis))
+            group_writes += added
+            group_clients.add(client_id)
+            group_keywords |= keywords
+            group_days.add(note_day(note_analysis))
+        
+        created = 0
+        clients = set()
+        for group in groups:
+            if not group:
+                continue
+            
+            def plan(_, group=group):
+                notes_per_client = {}
+                writes = []
+                for _, client_id, note_ref, note_analysis in group:
+                    writes.append(('create', note_ref, note_analysis))
+                    notes_per_client[client_id] = notes_per_client.get(client_id, 0) + 1
+                for client_id, count in notes_per_client.items():
+                    writes.append(('update', db.collection('clients').document(client_id), {
+                        'total_notes': firestore.Increment(count),
+                        'last_note_date': datetime.now(),
+                        'updated_at': datetime.now()
+                    }))
+                rollup_writes = self._analytics_rollup_notes_writes([item[3] for item in group], 1)
+                return writes, rollup_writes, None
+            
+            try:
+                self._run_rollup_transaction([], plan)
+            except Exception as e:
+                self.logger.error(f"Error adding a group of {len(group)} notes: {e}")
+                for key, *_ in group:
+                    errors[key] = str(e)
+                continue
+            
+            for _, client_id, note_ref, note_analysis in group:
+                note_search_index.add_note(client_id, note_ref.id, note_analysis)
+                clients.add(client_id)
+            created += len(group)
+        
+        self.logger.info(f"Added {created} notes for {len(clients)} clients")
+        return {'created': created, 'errors': errors}
+    
+    def create_pending_note(self, client_id: str, note_data: Dict[str, Any], client_archived: bool) -> Optional[str]:
+        """
+        Store a raw note immediately, before NLP analysis has run
+        
+        The note is saved with analysis_status 'pending'; complete_note_analysis
+        patches the results onto the same document later. Pending notes carry no
+        sentiment, so the analytics rollup ignores them until they are analyzed.
+        
+        Args:
+            client_id (str): Client identifier
+            note_data (dict): Raw note fields (text, author, ...)
+            client_archived (bool): Whether the client is archived (copied onto the note)
+            
+        Returns:
+            str or None: New note document ID or None on failure
+        """
+        try:
+            note_data.setdefault('created_at', datetime.now().isoformat())
+            note_data.setdefault('client_id', client_id)
+            note_data['client_archived'] = bool(client_archived)
+            note_data['analysis_status'] = 'pending'
+            note_data['analysis_attempts'] = 0
+            # This process analyzes it; other processes leave it alone until it goes stale
+            note_data['analysis_claimed_at'] = time.time()
+            
             notes_ref = db.collection('clients').document(client_id).collection('notes')
-            note_doc = notes_ref.add(note_analysis)
+            _, note_ref = notes_ref.add(note_data)
+            note_search_index.add_note(client_id, note_ref.id, note_data)
             
-            # Update client document with note count and last note date
             client_ref = db.collection('clients').document(client_id)
             client_ref.update({
                 'total_notes': firestore.Increment(1),
@@ -60,13 +330,200 @@ class FirestoreSchema:
                 'updated_at': datetime.now()
             })
             
-            self.logger.info(f"Added note to client {client_id}")
+            self.logger.info(f"Stored pending note {note_ref.id} for client {client_id}")
+            return note_ref.id
+            
+        except Exception as e:
+            self.logger.error(f"Error storing pending note: {e}")
+            return None
+    
+    def get_note(self, client_id: str, note_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a single note document
+        
+        Args:
+            client_id (str): Client identifier
+            note_id (str): Note document ID
+            
+        Returns:
+            dict or None: Note data or None if not found
+        """
+        try:
+            doc = db.collection('clients').document(client_id).collection('notes').document(note_id).get()
+            if doc.exists:
+                note_data = doc.to_dict()
+                note_data['note_id'] = doc.id
+                return note_data
+            return None
+            
+        except Exception as e:
+            self.logger.error(f"Error retrieving note {note_id}: {e}")
+            return None
+    
+    def complete_note_analysis(self, client_id: str, note_id: str, analysis: Dict[str, Any]) -> bool:
+        """
+        Patch NLP results onto a pending note and add it to the analytics rollup
+        
+        The note is read, patched and rolled up in one transaction that only
+        writes while the note is still pending, so a requeued or retried analysis
+        of the same note cannot count it twice and a crash cannot leave the note
+        complete without its rollup contribution.
+        
+        Args:
+            client_id (str): Client identifier
+            note_id (str): Note document ID
+            analysis (dict): Result of nlp_analyzer.analyze_note
+            
+        Returns:
+            bool: Success status (True if the note had already been completed,
+            False if the note was deleted meanwhile)
+        """
+        try:
+            note_ref = db.collection('clients').document(client_id).collection('notes').document(note_id)
+            
+            # Keep the original created_at so the note stays where it was saved
+            patch = {
+                'sentiment': analysis.get('sentiment', {}),
+                'keywords': analysis.get('keywords', []),
+                'tags': analysis.get('tags', {}),
+                'analysis_metadata': analysis.get('analysis_metadata', {}),
+                'analysis_status': 'complete',
+                'analysis_error': None,
+                'analyzed_at': datetime.now()
+            }
+            
+            def plan(snapshots):
+                snapshot = snapshots[0]
+                if not snapshot.exists:
+                    return [], [], (None, False)
+                note_data = snapshot.to_dict()
+                if note_data.get('analysis_status') != 'pending':
+                    return [], [], (note_data, False)
+                note_data.update(patch)
+                # Roll up the stored note (with its own created_at and client fields)
+                return [('update', note_ref, patch)], self._analytics_rollup_writes(note_data, 1), (note_data, True)
+            
+            note_data, applied = self._run_rollup_transaction([note_ref], plan)
+            if note_data is None:
+                return False
+            if not applied:
+                self.logger.info(f"Note {note_id} is already {note_data.get('analysis_status')}; analysis not stored")
+                return True
+            
+            # Re-index with the extracted keywords
+            note_search_index.add_note(client_id, note_id, note_data)
             return True
             
         except Exception as e:
-            self.logger.error(f"Error adding note to client: {e}")
+            self.logger.error(f"Error completing analysis for note {note_id}: {e}")
+            return False
+    
+    def reset_note_analysis(self, client_id: str, note_id: str) -> bool:
+        """
+        Put a note whose analysis failed back to pending so it can be analyzed again
+        
+        Args:
+            client_id (str): Client identifier
+            note_id (str): Note document ID
+            
+        Returns:
+            bool: Success status
+        """
+        try:
+            note_ref = db.collection('clients').document(client_id).collection('notes').document(note_id)
+            note_ref.update({
+                'analysis_status': 'pending',
+                'analysis_attempts': 0,
+                'analysis_error': None,
+                'analysis_claimed_at': time.time()
+            })
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error resetting analysis of note {note_id}: {e}")
+            return False
+    
+    def record_note_analysis_attempt(self, client_id: str, note_id: str,
+                                     error: Optional[str] = None, failed: bool = False) -> bool:
+        """
+        Record a failed analysis attempt on a pending note
+        
+        Args:
+            client_id (str): Client identifier
+            note_id (str): Note document ID
+            error (str, optional): Error message from the attempt
+            failed (bool): True when retries are exhausted
+            
+        Returns:
+            bool: Success status
+        """
+        try:
+            note_ref = db.collection('clients').document(client_id).collection('notes').document(note_id)
+            note_ref.update({
+                'analysis_attempts': firestore.Increment(1),
+                'analysis_error': error,
+                'analysis_status': 'failed' if failed else 'pending',
+                # A retry is scheduled, so the note is still being worked on
+                'analysis_claimed_at': time.time()
+            })
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error recording analysis attempt for note {note_id}: {e}")
             return False
     
+    def claim_stale_pending_note(self, client_id: str, note_id: str, stale_after: float) -> bool:
+        """
+        Take over a pending note whose analysis was abandoned, e.g. by a restart
+        
+        The claim is made in a transaction that refreshes analysis_claimed_at, so
+        when several processes sweep at once only one of them requeues the note.
+        
+        Args:
+            client_id (str): Client identifier
+            note_id (str): Note document ID
+            stale_after (float): Seconds since the last claim or attempt
+            
+        Returns:
+            bool: True if this process now owns the note's analysis
+        """
+        try:
+            note_ref = db.collection('clients').document(client_id).collection('notes').document(note_id)
+            return _claim_stale_note(db.transaction(), note_ref, stale_after)
+            
+        except Exception as e:
+            self.logger.error(f"Error claiming stale note {note_id}: {e}")
+            return False
+    
+    def get_unanalyzed_notes(self, include_failed: bool = True, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Find notes across all clients that still need NLP analysis
+        
+        Args:
+            include_failed (bool): Also return notes whose retries were exhausted
+            limit (int, optional): Maximum number of notes
+            
+        Returns:
+            list: Note documents with note_id and client_id
+        """
+        try:
+            statuses = ['pending', 'failed'] if include_failed else ['pending']
+            query = db.collection_group('notes').where('analysis_status', 'in', statuses)
+            if limit:
+                query = query.limit(limit)
+            
+            notes = []
+            for doc in query.stream():
+                note_data = doc.to_dict()
+                note_data['note_id'] = doc.id
+                note_data.setdefault('client_id', doc.reference.parent.parent.id)
+                notes.append(note_data)
+            return notes
+            
+        except Exception as e:
+            self.logger.error(f"Error retrieving unanalyzed notes: {e}")
+            return []
+    
     def get_client_notes(self, client_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Retrieve all notes for a client with optional limit
@@ -97,6 +554,175 @@ class FirestoreSchema:
             self.logger.error(f"Error retrieving client notes: {e}")
             return []
     
+    def _notes_query(self, client_id: Optional[str] = None,
+                     start_date: Optional[Union[datetime, str]] = None,
+                     end_date: Optional[Union[datetime, str]] = None,
+                     sentiment: Optional[str] = None,
+                     include_archived: bool = False,
+                     limit: Optional[int] = None):
+        """
+        Build a notes query with every filter pushed to Firestore
+        
+        A single client uses its own subcollection; cross-client queries use a
+        collection-group query over every `notes` subcollection. Cross-client
+        queries that combine filters need the matching collection-group
+        composite indexes (see NLP_PIPELINE_README.md).
+        """
+        if client_id:
+            query = db.collection('clients').document(client_id).collection('notes')
+        else:
+            query = db.collection_group('notes')
+            if not include_archived:
+                query = query.where('client_archived', '==', False)
+        
+        if sentiment:
+            query = query.where('sentiment.sentiment', '==', sentiment)
+        
+        # created_at is stored as an ISO-8601 string, which sorts chronologically
+        if start_date:
+            start_value = start_date.isoformat() if isinstance(start_date, datetime) else start_date
+            query = query.where('created_at', '>=', start_value)
+        if end_date:
+            end_value = end_date.isoformat() if isinstance(end_date, datetime) else end_date
+            query = query.where('created_at', '<=', end_value)
+        
+        if start_date or end_date:
+            query = query.order_by('created_at', direction='DESCENDING')
+        
+        if limit:
+            query = query.limit(limit)
+        
+        return query
+    
+    def stream_notes(self, client_id: Optional[str] = None,
+                     start_date: Optional[Union[datetime, str]] = None,
+                     end_date: Optional[Union[datetime, str]] = None,
+                     sentiment: Optional[str] = None,
+                     include_archived: bool = False,
+                     limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream notes across all clients (or one client) with server-side filters
+        
+        Args:
+            client_id (str, optional): Restrict to one client's notes
+            start_date (datetime or str, optional): Earliest created_at (inclusive)
+            end_date (datetime or str, optional): Latest created_at (inclusive)
+            sentiment (str, optional): positive/neutral/negative
+            include_archived (bool): Include notes of archived clients
+            limit (int, optional): Maximum number of notes to return
+            
+        Yields:
+            dict: Note data with note_id and client_id set
+        """
+        query = self._notes_query(client_id, start_date, end_date, sentiment, include_archived, limit)
+        for doc in query.stream():
+            note_data = doc.to_dict()
+            note_data['note_id'] = doc.id
+            if 'client_id' not in note_data:
+                note_data['client_id'] = doc.reference.parent.parent.id
+            yield note_data
+    
+    def query_notes(self, client_id: Optional[str] = None,
+                    start_date: Optional[Union[datetime, str]] = None,
+                    end_date: Optional[Union[datetime, str]] = None,
+                    sentiment: Optional[str] = None,
+                    include_archived: bool = False,
+                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        List notes matching the given filters (see stream_notes)
+        
+        Returns:
+            list: Matching note documents, or an empty list on error
+        """
+        try:
+            return list(self.stream_notes(client_id, start_date, end_date, sentiment, include_archived, limit))
+            
+        except Exception as e:
+            self.logger.error(f"Error querying notes: {e}")
+            return []
+    
+    def set_client_notes_archived(self, client_id: str, archived: bool) -> bool:
+        """
+        Propagate a client's archived flag onto its notes for collection-group filtering
+        
+        Archived clients are excluded from the analytics rollup, so each group of
+        notes is flagged and subtracted from (or added back to) the rollup in
+        the same transaction.
+        
+        Args:
+            client_id (str): Client identifier
+            archived (bool): New archived state
+            
+        Returns:
+            bool: Success status
+        """
+        try:
+            notes_ref = db.collection('clients').document(client_id).collection('notes')
+            note_refs = [doc.reference for doc in notes_ref.select([]).stream()]
+            
+            def plan(snapshots):
+                writes = []
+                changed = []
+                for snapshot in snapshots:
+                    if not snapshot.exists:
+                        continue
+                    note_data = snapshot.to_dict()
+                    if note_data.get('client_id') == client_id and bool(note_data.get('client_archived')) == archived:
+                        continue
+                    writes.append(('update', snapshot.reference, {'client_id': client_id, 'client_archived': archived}))
+                    # Roll up the note as counted: before archiving, after unarchiving
+                    changed.append(dict(note_data, client_archived=False))
+                return writes, self._analytics_rollup_notes_writes(changed, -1 if archived else 1), None
+            
+            # Up to 10 keywords per note may each need their own rollup write
+            for start in range(0, len(note_refs), 25):
+                self._run_rollup_transaction(note_refs[start:start + 25], plan)
+            note_search_index.set_client_archived(client_id, archived)
+            return True
+            
+        except Exception as e:
+            self.logger.error(f"Error updating archived flag on notes for client {client_id}: {e}")
+            return False
+    
+    def backfill_note_client_fields(self) -> int:
+        """
+        Stamp client_id/client_archived on notes written before they were denormalized
+        
+        Returns:
+            int: Number of notes updated
+        """
+        try:
+            archived_ids = {doc.id for doc in db.collection('clients').where('archived', '==', True).stream()}
+            
+            batch = db.batch()
+            pending = 0
+            updated = 0
+            for doc in db.collection_group('notes').stream():
+                note_data = doc.to_dict()
+                if 'client_id' in note_data and 'client_archived' in note_data:
+                    continue
+                
+                client_id = doc.reference.parent.parent.id
+                batch.update(doc.reference, {
+                    'client_id': client_id,
+                    'client_archived': client_id in archived_ids
+                })
+                pending += 1
+                updated += 1
+                if pending == 500:
+                    batch.commit()
+                    batch = db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
+            
+            self.logger.info(f"Backfilled client fields on {updated} notes")
+            return updated
+            
+        except Exception as e:
+            self.logger.error(f"Error backfilling note client fields: {e}")
+            return 0
+    
     def update_progress_metrics(self, client_id: str, metrics: Dict[str, Any], period: str) -> bool:
         """
         Update or create progress metrics document for a client
@@ -182,14 +808,24 @@ class FirestoreSchema:
             bool: Success status
         """
         try:
-            db.collection('clients').document(client_id).collection('notes').document(note_id).delete()
-            
-            # Update client document note count
             client_ref = db.collection('clients').document(client_id)
-            client_ref.update({
-                'total_notes': firestore.Increment(-1),
-                'updated_at': datetime.now()
-            })
+            note_ref = client_ref.collection('notes').document(note_id)
+            
+            # Delete the note, its count and its rollup contribution together
+            def plan(snapshots):
+                if not snapshots[0].exists:
+                    return [], [], None
+                writes = [
+                    ('delete', note_ref, None),
+                    ('update', client_ref, {
+                        'total_notes': firestore.Increment(-1),
+                        'updated_at': datetime.now()
+                    })
+                ]
+                return writes, self._analytics_rollup_writes(snapshots[0].to_dict(), -1), None
+            
+            self._run_rollup_transaction([note_ref], plan)
+            note_search_index.remove_note(client_id, note_id)
             
             self.logger.info(f"Deleted note {note_id} for client {client_id}")
             return True
@@ -202,30 +838,44 @@ class FirestoreSchema:
         """
         Search client notes by keywords
         
+        Each keyword is matched against the note text and extracted keywords
+        through the note search index (multi-word keywords as phrases).
+        
         Args:
             client_id (str): Client identifier
             keywords (list): List of keywords to search for
             
         Returns:
-            list: List of matching notes
+            list: List of matching notes, best match first
         """
         try:
-            notes_ref = db.collection('clients').document(client_id).collection('notes')
-            matching_notes = []
+            query = ' '.join(f'"{keyword}"' for keyword in keywords if keyword.strip())
+            return note_search_index.search(query, client_id=client_id, limit=None)
             
-            for doc in notes_ref.stream():
-                note_data = doc.to_dict()
-                note_keywords = note_data.get('keywords', [])
-                
-                # Check if any search keywords match note keywords
-                if any(keyword.lower() in [kw.lower() for kw in note_keywords] for keyword in keywords):
-                    note_data['note_id'] = doc.id
-                    matching_notes.append(note_data)
+        except Exception as e:
+            self.logger.error(f"Error searching notes by keywords: {e}")
+            return []
+    
+    def search_notes(self, query: str, client_id: Optional[str] = None,
+                     include_archived: bool = False, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Full-text search over note text and keywords
+        
+        Args:
+            query (str): Terms, "quoted phrases" and prefix* terms
+            client_id (str, optional): Restrict to one client's notes
+            include_archived (bool): Include notes of archived clients across clients
+            limit (int): Maximum number of results
             
-            return matching_notes
+        Returns:
+            list: Matching notes with search_score, best first
+        """
+        try:
+            return note_search_index.search(query, client_id=client_id,
+                                            include_archived=include_archived, limit=limit)
             
         except Exception as e:
-            self.logger.error(f"Error searching notes by keywords: {e}")
+            self.logger.error(f"Error searching notes: {e}")
             return []
     
     def get_notes_by_sentiment(self, client_id: str, sentiment: str) -> List[Dict[str, Any]]:
@@ -239,23 +889,7 @@ class FirestoreSchema:
         Returns:
             list: List of notes with specified sentiment
         """
-        try:
-            notes_ref = db.collection('clients').document(client_id).collection('notes')
-            filtered_notes = []
-            
-            for doc in notes_ref.stream():
-                note_data = doc.to_dict()
-                note_sentiment = note_data.get('sentiment', {}).get('sentiment', 'neutral')
-                
-                if note_sentiment == sentiment:
-                    note_data['note_id'] = doc.id
-                    filtered_notes.append(note_data)
-            
-            return filtered_notes
-            
-        except Exception as e:
-            self.logger.error(f"Error filtering notes by sentiment: {e}")
-            return []
+        return self.query_notes(client_id=client_id, sentiment=sentiment)
     
     def get_notes_by_domain(self, client_id: str, domain: str, min_score: float = 0.0) -> List[Dict[str, Any]]:
         """
@@ -288,5 +922,292 @@ class FirestoreSchema:
             self.logger.error(f"Error filtering notes by domain: {e}")
             return []
 
+    def _analytics_rollup_ref(self):
+        return db.collection(ANALYTICS_ROLLUP_COLLECTION).document(ANALYTICS_ROLLUP_DOCUMENT)
+    
+    def _analytics_keyword_ref(self, keyword: str):
+        # Keywords may contain '/' and other characters not allowed in document IDs
+        doc_id = hashlib.sha1(keyword.encode('utf-8')).hexdigest()
+        return self._analytics_rollup_ref().collection(ANALYTICS_KEYWORDS_COLLECTION).document(doc_id)
+    
+    def _analytics_day_ref(self, day: str):
+        return self._analytics_rollup_ref().collection(ANALYTICS_DAILY_COLLECTION).document(day)
+    
+    def _analytics_rollup_writes(self, note_data: Dict[str, Any], sign: int) -> List[tuple]:
+        """
+        Build the increment writes for one note's rollup contribution
+        
+        Args:
+            note_data (dict): Analyzed note document
+            sign (int): 1 when the note is added, -1 when it is removed
+            
+        Returns:
+            list: (document reference, merge payload) pairs; empty for unanalyzed
+            notes and notes of archived clients
+        """
+        return self._analytics_rollup_notes_writes([note_data], sign)
+    
+    def _analytics_rollup_notes_writes(self, notes: List[Dict[str, Any]], sign: int) -> List[tuple]:
+        """
+        Build the increment writes for the combined rollup contribution of several notes
+        
+        The totals go to the rollup document; keyword counts and daily buckets go
+        to one small document per keyword and per day, so the rollup document
+        stays the same size however many keywords and days accumulate.
+        
+        Notes of archived clients are ignored: they left the rollup when the
+        client was archived (set_client_notes_archived), so adding or deleting
+        one must not change the totals again.
+        
+        Args:
+            notes (list): Note documents (unanalyzed ones are ignored)
+            sign (int): 1 when the notes are added, -1 when they are removed
+            
+        Returns:
+            list: (document reference, merge payload) pairs; empty if no note counts
+        """
+        total_notes = 0
+        sentiment_sum = 0.0
+        positive = 0
+        domain_sums = {domain: 0.0 for domain in ANALYTICS_DOMAINS}
+        keyword_counts = {}
+        daily = {}
+        
+        for note_data in notes:
+            if 'sentiment' not in note_data or note_data.get('client_archived'):
+                continue
+            
+            display_score = sentiment_display_score(note_data.get('sentiment', {}).get('score', 0))
+            tags = note_data.get('tags', {})
+            total_notes += 1
+            sentiment_sum += display_score
+            if display_score > 6.0:
+                positive += 1
+            for domain in ANALYTICS_DOMAINS:
+                domain_sums[domain] += domain_display_score(tags.get(domain, {}).get('score', 0.0))
+            for keyword in note_data.get('keywords', []):
+                if keyword:
+                    keyword_counts[keyword] = keyword_counts.get(keyword, 0) + 1
+            day = note_day(note_data)
+            if day:
+                bucket = daily.setdefault(day, [0.0, 0])
+                bucket[0] += display_score
+                bucket[1] += 1
+        
+        if not total_notes:
+            return []
+        
+        writes = [(self._analytics_rollup_ref(), {
+            'total_notes': firestore.Increment(sign * total_notes),
+            'sentiment_display_sum': firestore.Increment(sign * sentiment_sum),
+            'positive_improvements': firestore.Increment(sign * positive),
+            'domain_display_sums': {
+                domain: firestore.Increment(sign * domain_sums[domain]) for domain in ANALYTICS_DOMAINS
+            },
+            'updated_at': datetime.now()
+        })]
+        
+        for keyword, count in keyword_counts.items():
+            writes.append((self._analytics_keyword_ref(keyword), {
+                'keyword': keyword,
+                'count': firestore.Increment(sign * count)
+            }))
+        
+        for day, (display_sum, count) in daily.items():
+            writes.append((self._analytics_day_ref(day), {
+                'sentiment_display_sum': firestore.Increment(sign * display_sum),
+                'count': firestore.Increment(sign * count)
+            }))
+        
+        return writes
+    
+    def _run_rollup_transaction(self, note_refs: List[Any], plan) -> Any:
+        """
+        Run _write_with_rollup, waiting up to ANALYTICS_REBUILD_WAIT seconds for
+        a running rollup rebuild to finish
+        
+        Raises:
+            AnalyticsRollupBusy: If the rebuild is still running after the wait
+        """
+        deadline = time.monotonic() + ANALYTICS_REBUILD_WAIT
+        while True:
+            try:
+                return _write_with_rollup(db.transaction(), self._analytics_rollup_ref(), note_refs, plan)
+            except AnalyticsRollupBusy:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(1.0)
+    
+    def get_analytics_rollup(self, top_keywords: int = ANALYTICS_TOP_KEYWORDS,
+                             days: int = ANALYTICS_TREND_DAYS) -> Optional[Dict[str, Any]]:
+        """
+        Read the materialized analytics rollup
+        
+        Args:
+            top_keywords (int): Number of most frequent keywords to include
+            days (int): Number of most recent daily buckets to include (ending today)
+            
+        Returns:
+            dict or None: Rollup totals with 'keyword_counts' (top keywords) and
+            'daily' (recent days), or None if it has not been built yet or was
+            built in an older layout
+            
+        Raises:
+            Exception: Firestore read errors are raised rather than reported as a
+            missing rollup, so a transient failure never triggers a rebuild
+        """
+        rollup_ref = self._analytics_rollup_ref()
+        doc = rollup_ref.get()
+        if not doc.exists:
+            return None
+        rollup = doc.to_dict()
+        if rollup.get('schema_version') != ANALYTICS_ROLLUP_SCHEMA_VERSION:
+            return None
+        
+        keywords_query = (rollup_ref.collection(ANALYTICS_KEYWORDS_COLLECTION)
+                          .order_by('count', direction='DESCENDING')
+                          .limit(top_keywords))
+        rollup['keyword_counts'] = {}
+        for keyword_doc in keywords_query.stream():
+            keyword_data = keyword_doc.to_dict()
+            rollup['keyword_counts'][keyword_data.get('keyword', keyword_doc.id)] = keyword_data.get('count', 0)
+        
+        today = datetime.now()
+        day_refs = [self._analytics_day_ref((today - timedelta(days=offset)).strftime('%Y-%m-%d'))
+                    for offset in range(days)]
+        rollup['daily'] = {}
+        for day_doc in db.get_all(day_refs):
+            if day_doc.exists:
+                rollup['daily'][day_doc.id] = day_doc.to_dict()
+        
+        return rollup
+    
+    def start_analytics_rollup_rebuild(self) -> bool:
+        """
+        Rebuild the analytics rollup on a background thread
+        
+        Returns:
+            bool: False if this process is already rebuilding it
+        """
+        if not self._rebuild_lock.acquire(blocking=False):
+            return False
+        
+        def run():
+            try:
+                self.rebuild_analytics_rollup()
+            finally:
+                self._rebuild_lock.release()
+        
+        threading.Thread(target=run, name='analytics-rollup-rebuild', daemon=True).start()
+        return True
+    
+    def rebuild_analytics_rollup(self) -> Optional[Dict[str, Any]]:
+        """
+        Recompute the analytics rollup from every note of non-archived clients
+        
+        This streams every note once and is only meant for the initial build or repairs;
+        day-to-day updates are applied by the note writes themselves. The rebuild
+        holds a lease on the rollup document, and note writes wait for it to be
+        released, so no increment lands between the scan and the overwrite.
+        
+        Returns:
+            dict or None: The rebuilt rollup (with every keyword count and daily
+            bucket) or None on failure or if another rebuild is running
+        """
+        rollup_ref = self._analytics_rollup_ref()
+        try:
+            if not _claim_rebuild_lease(db.transaction(), rollup_ref):
+                self.logger.info("Analytics rollup rebuild already running elsewhere")
+                return None
+        except Exception as e:
+            self.logger.error(f"Error starting analytics rollup rebuild: {e}")
+            return None
+        
+        try:
+            rollup = {
+                'total_notes': 0,
+                'sentiment_display_sum': 0.0,
+                'positive_improvements': 0,
+                'domain_display_sums': {domain: 0.0 for domain in ANALYTICS_DOMAINS}
+            }
+            keyword_counts = {}
+            daily = {}
+            
+            # Older notes lack the denormalized client fields the query filters on
+            self.backfill_note_client_fields()
+            
+            # One collection-group query instead of one query per client
+            lease_renewed = time.time()
+            for note_data in self.stream_notes():
+                if time.time() - lease_renewed > ANALYTICS_REBUILD_LEASE / 3:
+                    rollup_ref.update({'rebuild_lease_expires': time.time() + ANALYTICS_REBUILD_LEASE})
+                    lease_renewed = time.time()
+                if 'sentiment' not in note_data:
+                    continue
+                
+                display_score = sentiment_display_score(note_data.get('sentiment', {}).get('score', 0))
+                rollup['total_notes'] += 1
+                rollup['sentiment_display_sum'] += display_score
+                if display_score > 6.0:
+                    rollup['positive_improvements'] += 1
+                
+                tags = note_data.get('tags', {})
+                for domain in ANALYTICS_DOMAINS:
+                    rollup['domain_display_sums'][domain] += domain_display_score(tags.get(domain, {}).get('score', 0.0))
+                
+                for keyword in note_data.get('keywords', []):
+                    if keyword:
+                        keyword_counts[keyword] = keyword_counts.get(keyword, 0) + 1
+                
+                day = note_day(note_data)
+                if day:
+                    bucket = daily.setdefault(day, {'sentiment_display_sum': 0.0, 'count': 0})
+                    bucket['sentiment_display_sum'] += display_score
+                    bucket['count'] += 1
+            
+            rollup['schema_version'] = ANALYTICS_ROLLUP_SCHEMA_VERSION
+            rollup['updated_at'] = datetime.now()
+            rollup['rebuilt_at'] = datetime.now()
+            
+            writer = BulkWriter()
+            keyword_doc_ids = {self._analytics_keyword_ref(keyword).id for keyword in keyword_counts}
+            for keyword_doc in rollup_ref.collection(ANALYTICS_KEYWORDS_COLLECTION).select([]).stream():
+                if keyword_doc.id not in keyword_doc_ids:
+                    writer.delete(keyword_doc.reference)
+            for keyword, count in keyword_counts.items():
+                writer.set(self._analytics_keyword_ref(keyword), {'keyword': keyword, 'count': count})
+            
+            for day_doc in rollup_ref.collection(ANALYTICS_DAILY_COLLECTION).select([]).stream():
+                if day_doc.id not in daily:
+                    writer.delete(day_doc.reference)
+            for day, bucket in daily.items():
+                writer.set(self._analytics_day_ref(day), bucket)
+            
+            result = writer.flush()
+            if result.failed:
+                self.logger.error(f"Analytics rollup rebuild left {result.failure_count} documents unwritten")
+                self._release_rebuild_lease()
+                return None
+            
+            # Written last: overwriting (not merging) drops maps kept inline by the
+            # older layout and releases the lease
+            rollup_ref.set(rollup)
+            
+            rollup['keyword_counts'] = keyword_counts
+            rollup['daily'] = daily
+            self.logger.info(f"Rebuilt analytics rollup from {rollup['total_notes']} notes")
+            return rollup
+            
+        except Exception as e:
+            self.logger.error(f"Error rebuilding analytics rollup: {e}")
+            self._release_rebuild_lease()
+            return None
+    
+    def _release_rebuild_lease(self):
+        try:
+            self._analytics_rollup_ref().update({'rebuild_lease_expires': firestore.DELETE_FIELD})
+        except Exception as e:
+            self.logger.error(f"Error releasing analytics rollup rebuild lease: {e}")
+
 # Initialize global schema instance
 firestore_schema = FirestoreSchema()
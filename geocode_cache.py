@@ -0,0 +1,184 @@
+"""
+Persistent Geocode Cache
+SQLite-backed cache of geocoding results keyed by the normalized clean_address()
+output, with negative caching so unresolvable addresses are not retried on every run
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_CACHE_ENABLED = os.getenv('GEOCODE_CACHE_ENABLED', 'true').lower() == 'true'
+GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', 'geocode_cache.db')
+
+# Seconds a "no result" answer is trusted before the address is tried again
+GEOCODE_NEGATIVE_TTL = int(os.getenv('GEOCODE_NEGATIVE_TTL', str(7 * 24 * 3600)))
+
+# Seconds a successful result is trusted (0 = never expires)
+GEOCODE_POSITIVE_TTL = int(os.getenv('GEOCODE_POSITIVE_TTL', '0'))
+
+
+def normalize_address_key(cleaned_address):
+    """
+    Build the cache key for a clean_address() result
+
+    Args:
+        cleaned_address (str): Output of clean_address()
+
+    Returns:
+        str: Lowercased address with uniform whitespace and comma spacing
+    """
+    key = cleaned_address.lower().strip()
+    key = re.sub(r'\s*,\s*', ', ', key)
+    key = re.sub(r'\s+', ' ', key)
+    return key.strip(' ,')
+
+
+class GeocodeCache:
+    """SQLite cache of geocoding results (positive and negative)"""
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, negative_ttl=GEOCODE_NEGATIVE_TTL,
+                 positive_ttl=GEOCODE_POSITIVE_TTL, enabled=GEOCODE_CACHE_ENABLED):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.positive_ttl = positive_ttl
+        self.enabled = enabled
+        self._conn = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'stores': 0}
+
+        if self.enabled:
+            self._open()
+
+    def _open(self):
+        try:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS geocode_cache ('
+                'address_key TEXT PRIMARY KEY, provider TEXT, lat REAL, lng REAL, '
+                'result TEXT, cached_at REAL NOT NULL)'
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Geocode cache disabled, could not open {self.path}: {e}")
+            self._conn = None
+
+    def get(self, cleaned_address):
+        """
+        Look up a cached geocoding result
+
+        Args:
+            cleaned_address (str): Output of clean_address()
+
+        Returns:
+            dict or None: None on a miss; otherwise {'coords', 'provider', 'cached_at'},
+            where coords is None for a cached negative result
+        """
+        if self._conn is None:
+            return None
+
+        key = normalize_address_key(cleaned_address)
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    'SELECT provider, result, cached_at FROM geocode_cache WHERE address_key = ?', (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Geocode cache read failed: {e}")
+                return None
+
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+
+            provider, result, cached_at = row
+            ttl = self.positive_ttl if result else self.negative_ttl
+            if ttl and time.time() - cached_at > ttl:
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+
+            if result:
+                self.stats['hits'] += 1
+                return {'coords': json.loads(result), 'provider': provider, 'cached_at': cached_at}
+
+            self.stats['negative_hits'] += 1
+            return {'coords': None, 'provider': provider, 'cached_at': cached_at}
+
+    def put(self, cleaned_address, coords, provider=None):
+        """
+        Store a geocoding result; coords=None records a negative result
+
+        Args:
+            cleaned_address (str): Output of clean_address()
+            coords (dict or None): Geocoded coordinates with 'lat', 'lng', 'source'
+            provider (str, optional): Provider name, defaults to coords['source']
+        """
+        if self._conn is None:
+            return
+
+        key = normalize_address_key(cleaned_address)
+        if coords:
+            provider = provider or coords.get('source')
+            values = (key, provider, coords.get('lat'), coords.get('lng'), json.dumps(coords), time.time())
+        else:
+            values = (key, provider, None, None, None, time.time())
+
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO geocode_cache '
+                    '(address_key, provider, lat, lng, result, cached_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    values
+                )
+                self._conn.commit()
+                self.stats['stores'] += 1
+            except sqlite3.Error as e:
+                logger.warning(f"Geocode cache write failed: {e}")
+
+    def invalidate(self, cleaned_address):
+        """Remove one address from the cache"""
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute('DELETE FROM geocode_cache WHERE address_key = ?',
+                                   (normalize_address_key(cleaned_address),))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Geocode cache delete failed: {e}")
+
+    def get_stats(self):
+        """
+        Get hit-rate counters for this process and the persistent entry counts
+
+        Returns:
+            dict: Cache statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+            stats['hit_rate'] = round((stats['hits'] + stats['negative_hits']) / lookups, 3) if lookups else 0.0
+            stats['enabled'] = self._conn is not None
+            stats['negative_ttl_seconds'] = self.negative_ttl
+            if self._conn is not None:
+                try:
+                    stats['entries'] = self._conn.execute('SELECT COUNT(*) FROM geocode_cache').fetchone()[0]
+                    stats['negative_entries'] = self._conn.execute(
+                        'SELECT COUNT(*) FROM geocode_cache WHERE result IS NULL').fetchone()[0]
+                    stats['entries_by_provider'] = dict(self._conn.execute(
+                        'SELECT provider, COUNT(*) FROM geocode_cache WHERE result IS NOT NULL GROUP BY provider'
+                    ).fetchall())
+                except sqlite3.Error:
+                    pass
+        return stats
+
+
+# Global instance
+geocode_cache = GeocodeCache()
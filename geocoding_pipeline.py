@@ -0,0 +1,270 @@
+"""
+Geocoding Pipeline
+Concurrent geocoding with a token-bucket rate limiter per provider, a bounded
+worker pool and pooled HTTP sessions, backed by the persistent geocode cache
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from geocode_cache import geocode_cache, normalize_address_key
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_GEOCODING_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+NOMINATIM_BASE_URL = 'https://nominatim.openstreetmap.org/search'
+
+# Requests per second allowed for each provider (Nominatim's usage policy is 1/s)
+GOOGLE_GEOCODING_QPS = float(os.getenv('GOOGLE_GEOCODING_QPS', '40'))
+NOMINATIM_QPS = float(os.getenv('NOMINATIM_QPS', '0.9'))
+
+# Concurrent lookups in a batch
+GEOCODING_WORKERS = int(os.getenv('GEOCODING_WORKERS', '8'))
+
+
+class GeocodingError(Exception):
+    """Raised when a geocoding provider could not answer (network, HTTP or quota error)"""
+    pass
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a request may be sent"""
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.waited_seconds += wait
+            time.sleep(wait)
+
+
+def _pooled_session(pool_size, headers=None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+class GeocodingPipeline:
+    """Rate-limited, concurrent geocoder (Google first when configured, then Nominatim)"""
+
+    def __init__(self, google_api_key=None, max_workers=GEOCODING_WORKERS,
+                 google_qps=GOOGLE_GEOCODING_QPS, nominatim_qps=NOMINATIM_QPS):
+        self.google_api_key = google_api_key
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='geocoder')
+
+        self._google_session = _pooled_session(max_workers)
+        self._nominatim_session = _pooled_session(max_workers, {'User-Agent': 'BreakFree-App/1.0'})  # Required by Nominatim
+
+        # Nominatim gets capacity 1 so requests are never sent in a burst
+        self._buckets = {
+            'google': TokenBucket(google_qps),
+            'nominatim': TokenBucket(nominatim_qps, capacity=1)
+        }
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'google': {'requests': 0, 'errors': 0},
+            'nominatim': {'requests': 0, 'errors': 0}
+        }
+
+    def _count(self, provider, key):
+        with self._stats_lock:
+            self.stats[provider][key] += 1
+
+    def geocode_with_google(self, address):
+        """
+        Geocode using Google Geocoding API.
+        Returns None when Google has no result; raises GeocodingError when it could not answer.
+        """
+        params = {
+            'address': address,
+            'key': self.google_api_key,
+            'region': 'ph',  # Bias towards Philippines
+            'bounds': '13.9,120.8|14.7,121.6'  # Laguna bounds
+        }
+
+        self._buckets['google'].acquire()
+        self._count('google', 'requests')
+        try:
+            response = self._google_session.get(GOOGLE_GEOCODING_URL, params=params, timeout=10)
+            if response.status_code != 200:
+                raise GeocodingError(f"HTTP {response.status_code}")
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self._count('google', 'errors')
+            raise GeocodingError(str(e))
+        except GeocodingError:
+            self._count('google', 'errors')
+            raise
+
+        if data['status'] == 'OK' and data['results']:
+            location = data['results'][0]['geometry']['location']
+            coords = {
+                'lat': round(location['lat'], 6),
+                'lng': round(location['lng'], 6),
+                'source': 'google',
+                'formatted_address': data['results'][0]['formatted_address']
+            }
+            print(f"Google geocoded '{address}' to {coords['lat']}, {coords['lng']}")
+            return coords
+
+        if data['status'] == 'ZERO_RESULTS':
+            return None
+
+        # OVER_QUERY_LIMIT, REQUEST_DENIED, etc. say nothing about the address
+        self._count('google', 'errors')
+        raise GeocodingError(f"status {data['status']}")
+
+    def geocode_with_nominatim(self, address):
+        """
+        Geocode using Nominatim (OpenStreetMap) service.
+        Returns None when Nominatim has no result; raises GeocodingError when it could not answer.
+        """
+        params = {
+            'q': address,
+            'format': 'json',
+            'limit': 1,
+            'countrycodes': 'ph',  # Limit to Philippines
+            'bounded': 1,
+            'viewbox': '120.8,13.9,121.6,14.7',  # Laguna bounds (west,south,east,north)
+            'addressdetails': 1
+        }
+
+        self._buckets['nominatim'].acquire()
+        self._count('nominatim', 'requests')
+        try:
+            response = self._nominatim_session.get(NOMINATIM_BASE_URL, params=params, timeout=10)
+            if response.status_code != 200:
+                raise GeocodingError(f"HTTP {response.status_code}")
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self._count('nominatim', 'errors')
+            raise GeocodingError(str(e))
+        except GeocodingError:
+            self._count('nominatim', 'errors')
+            raise
+
+        if data and len(data) > 0:
+            result = data[0]
+            coords = {
+                'lat': round(float(result['lat']), 6),
+                'lng': round(float(result['lon']), 6),
+                'source': 'nominatim',
+                'formatted_address': result.get('display_name', address)
+            }
+            print(f"Nominatim geocoded '{address}' to {coords['lat']}, {coords['lng']}")
+            return coords
+
+        return None
+
+    def geocode(self, cleaned_address):
+        """
+        Geocode one cleaned address, answering from the geocode cache when possible
+
+        Args:
+            cleaned_address (str): Output of clean_address()
+
+        Returns:
+            dict or None: Coordinates with 'lat', 'lng', 'source', 'formatted_address'
+        """
+        # Previously resolved (or known unresolvable) addresses skip the providers
+        cached = geocode_cache.get(cleaned_address)
+        if cached is not None:
+            return dict(cached['coords']) if cached['coords'] else None
+
+        coords = None
+        provider_failed = False
+
+        # Try Google Geocoding API first (if API key is available)
+        if self.google_api_key:
+            try:
+                coords = self.geocode_with_google(cleaned_address)
+            except GeocodingError as e:
+                print(f"Google geocoding error for '{cleaned_address}': {e}")
+                provider_failed = True
+
+        # Fallback to Nominatim (OpenStreetMap)
+        if not coords:
+            try:
+                coords = self.geocode_with_nominatim(cleaned_address)
+            except GeocodingError as e:
+                print(f"Nominatim geocoding error for '{cleaned_address}': {e}")
+                provider_failed = True
+
+        # Only remember "not found" when every provider actually answered
+        if coords or not provider_failed:
+            geocode_cache.put(cleaned_address, coords)
+
+        return coords
+
+    def geocode_many(self, cleaned_addresses):
+        """
+        Geocode a batch concurrently, resolving each distinct address once; each
+        provider is held to its own rate by its token bucket
+
+        Args:
+            cleaned_addresses (list): clean_address() outputs
+
+        Returns:
+            dict: Normalized address key -> coordinates or None
+        """
+        unique = {}
+        for cleaned_address in cleaned_addresses:
+            unique.setdefault(normalize_address_key(cleaned_address), cleaned_address)
+
+        futures = {key: self._executor.submit(self.geocode, address) for key, address in unique.items()}
+
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                print(f"Geocoding error for '{unique[key]}': {e}")
+                results[key] = None
+        return results
+
+    def get_stats(self):
+        """
+        Get per-provider request/error counts and rate-limit wait time
+
+        Returns:
+            dict: Pipeline statistics
+        """
+        with self._stats_lock:
+            stats = {provider: dict(counts) for provider, counts in self.stats.items()}
+        for provider, bucket in self._buckets.items():
+            stats[provider]['rate_per_second'] = bucket.rate
+            stats[provider]['throttled_seconds'] = round(bucket.waited_seconds, 2)
+        stats['workers'] = self.max_workers
+        stats['google_enabled'] = bool(self.google_api_key)
+        return stats
+
+
+# Global instance
+geocoding_pipeline = GeocodingPipeline(google_api_key=os.getenv('GOOGLE_GEOCODING_API_KEY'))
@@ -0,0 +1,182 @@
+"""
+Compiled Keyword Matcher
+Resolves every domain and sentiment lexicon term in a note with one tokenization
+pass over a token -> (kind, domain, category) index, instead of one substring
+scan per lexicon word
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Words with inner hyphens/apostrophes stay one token ("well-rested", "didn't")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+# Seconds between lexicon file modification checks
+LEXICON_RELOAD_INTERVAL = float(os.getenv('NLP_LEXICON_RELOAD_INTERVAL', '5'))
+
+
+class KeywordMatch:
+    """Distinct lexicon terms found in one text, grouped by kind"""
+
+    def __init__(self, domain_counts, sentiment_counts, terms):
+        self.domain_counts = domain_counts
+        self.sentiment_counts = sentiment_counts
+        self.terms = terms
+
+
+class KeywordMatcher:
+    """
+    Token-index matcher for domain and sentiment lexicons
+
+    Each distinct term counts once per text, like the original substring checks,
+    but only whole tokens (or whole token sequences for multi-word terms) match,
+    so "calm" no longer matches "becalmed" and "mad" no longer matches "made".
+    """
+
+    def __init__(self, domain_keywords, sentiment_keywords, lexicon_path=None):
+        self.default_domain_keywords = domain_keywords
+        self.default_sentiment_keywords = sentiment_keywords
+        self.lexicon_path = lexicon_path
+        self._lexicon_mtime = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._compiled = None
+        self.reload()
+
+    def _compile(self, domain_keywords, sentiment_keywords):
+        """Build an immutable (index, max_ngram, domains, version) tuple"""
+        index = {}
+        max_ngram = 1
+
+        def add(term, entry):
+            nonlocal max_ngram
+            key = tuple(TOKEN_PATTERN.findall(term.lower()))
+            if not key:
+                return
+            max_ngram = max(max_ngram, len(key))
+            entries = index.setdefault(key, [])
+            if entry not in entries:
+                entries.append(entry)
+
+        for domain, categories in domain_keywords.items():
+            for category, words in categories.items():
+                for word in words:
+                    add(word, ('domain', domain, category))
+        for polarity, words in sentiment_keywords.items():
+            for word in words:
+                add(word, ('sentiment', None, polarity))
+
+        index = {key: tuple(entries) for key, entries in index.items()}
+        domains = {domain: tuple(categories) for domain, categories in domain_keywords.items()}
+        payload = json.dumps([domain_keywords, sentiment_keywords], sort_keys=True)
+        version = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:8]
+        return index, max_ngram, domains, version
+
+    def load(self, domain_keywords, sentiment_keywords):
+        """
+        Replace the lexicons; the new index is swapped in atomically so
+        concurrent match() calls see either the old or the new lexicon
+
+        Args:
+            domain_keywords (dict): {domain: {category: [terms]}}
+            sentiment_keywords (dict): {'positive': [terms], 'negative': [terms]}
+        """
+        self._compiled = self._compile(domain_keywords, sentiment_keywords)
+
+    def reload(self):
+        """
+        Load the lexicon file if configured (missing sections use the built-in
+        lexicons), otherwise the built-in lexicons
+
+        Returns:
+            bool: True if a lexicon file was loaded
+        """
+        domain_keywords = self.default_domain_keywords
+        sentiment_keywords = self.default_sentiment_keywords
+        loaded_file = False
+
+        if self.lexicon_path and os.path.exists(self.lexicon_path):
+            try:
+                with open(self.lexicon_path, 'r', encoding='utf-8') as f:
+                    lexicon = json.load(f)
+                domain_keywords = lexicon.get('domains', domain_keywords)
+                sentiment_keywords = lexicon.get('sentiment', sentiment_keywords)
+                self._lexicon_mtime = os.path.getmtime(self.lexicon_path)
+                loaded_file = True
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load lexicon file {self.lexicon_path}, keeping current lexicons: {e}")
+                if self._compiled is not None:
+                    return False
+
+        self.load(domain_keywords, sentiment_keywords)
+        if loaded_file:
+            logger.info(f"Loaded keyword lexicons from {self.lexicon_path} (version {self.version})")
+        return loaded_file
+
+    def maybe_reload(self):
+        """Reload the lexicon file if it changed (checked at most every few seconds)"""
+        if not self.lexicon_path:
+            return
+        now = time.monotonic()
+        if now - self._last_check < LEXICON_RELOAD_INTERVAL:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = now
+            try:
+                mtime = os.path.getmtime(self.lexicon_path)
+            except OSError:
+                return
+            if mtime != self._lexicon_mtime:
+                self.reload()
+        finally:
+            self._reload_lock.release()
+
+    @property
+    def version(self):
+        """Short hash of the active lexicons (part of the analysis cache key)"""
+        return self._compiled[3]
+
+    @property
+    def domains(self):
+        return self._compiled[2]
+
+    def match(self, text):
+        """
+        Find the distinct lexicon terms in a text
+
+        Args:
+            text (str): Note text
+
+        Returns:
+            KeywordMatch: Per-domain category counts and per-polarity sentiment counts
+        """
+        self.maybe_reload()
+        index, max_ngram, domains, _ = self._compiled
+
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        found = set()
+        for start in range(len(tokens)):
+            for length in range(1, min(max_ngram, len(tokens) - start) + 1):
+                key = tuple(tokens[start:start + length])
+                if key in index:
+                    found.add(key)
+
+        domain_counts = {domain: {category: 0 for category in categories} for domain, categories in domains.items()}
+        sentiment_counts = {'positive': 0, 'negative': 0}
+        for key in found:
+            for kind, domain, category in index[key]:
+                if kind == 'domain':
+                    domain_counts[domain][category] = domain_counts[domain].get(category, 0) + 1
+                else:
+                    sentiment_counts[category] = sentiment_counts.get(category, 0) + 1
+
+        return KeywordMatch(domain_counts, sentiment_counts, sorted(' '.join(key) for key in found))
@@ -5,10 +5,44 @@ A comprehensive API for managing Laguna Province municipalities and barangays wi
 
 import json
 import os
+import logging
+import threading
+from collections import defaultdict
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 from datetime import datetime
 
+from laguna_snapshot import (
+    GazetteerSnapshot, build_snapshot, write_snapshot, source_fingerprint, normalize_place_name, trigrams
+)
+
+logger = logging.getLogger(__name__)
+
+# Compiled snapshot of the location data (default: next to the JSON file)
+LAGUNA_SNAPSHOT_PATH = os.getenv('LAGUNA_SNAPSHOT_PATH')
+
+# Coordinates farther than this from every barangay/municipality center are not reverse geocoded
+REVERSE_GEOCODE_MAX_KM = float(os.getenv('LAGUNA_REVERSE_GEOCODE_MAX_KM', '15'))
+
+# Fetched barangay centroids farther than this from their municipality center are rejected
+CENTROID_MAX_OFFSET_KM = 15.0
+
+# Tokens that mark the next words as a barangay name ("Brgy. Magsaysay")
+BARANGAY_MARKERS = {'brgy', 'bgy', 'barangay'}
+
+# Province/country words; only matched as a place name right after a barangay marker
+CONTEXT_TOKENS = {'laguna', 'philippines', 'ph'}
+
+# Minimum trigram similarity (Dice coefficient) for a fuzzy search match
+FUZZY_MIN_SIMILARITY = 0.45
+
+# Search match tiers, best first
+MATCH_EXACT, MATCH_PREFIX, MATCH_WORD_PREFIX, MATCH_SUBSTRING, MATCH_FUZZY = range(5)
+
+# Municipality names that are also common street names; they need the province
+# name or one of their barangays in the address to count
+WEAK_MUNICIPALITY_IDS = {'bay', 'rizal', 'magsaysay', 'victoria'}
+
 @dataclass
 class Municipality:
     """Data class for municipality information"""
@@ -20,10 +54,13 @@ class Municipality:
     population: Optional[int] = None
     area_km2: Optional[float] = None
     barangays: List[str] = None
+    barangay_centroids: Dict[str, List[float]] = None  # barangay -> [lat, lng], where known
     
     def __post_init__(self):
         if self.barangays is None:
             self.barangays = []
+        if self.barangay_centroids is None:
+            self.barangay_centroids = {}
 
 @dataclass
 class LocationSearchResult:
@@ -39,36 +76,106 @@ class LocationSearchResult:
 class LagunaLocationAPI:
     """Main API class for Laguna Province locations"""
     
-    def __init__(self, data_file: str = "laguna_locations.json"):
+    def __init__(self, data_file: str = "laguna_locations.json", snapshot_file: Optional[str] = None):
+        # Nothing is read here; the snapshot is mapped on first use
         self.data_file = data_file
-        self.municipalities: Dict[str, Municipality] = {}
-        self.load_data()
+        self.snapshot_file = snapshot_file or LAGUNA_SNAPSHOT_PATH or os.path.splitext(data_file)[0] + '.snapshot'
+        self._snapshot: Optional[GazetteerSnapshot] = None
+        self._municipalities: Optional[Dict[str, Municipality]] = None
+        self._municipality_list: List[Municipality] = []
+        self._municipalities_by_name: Dict[str, Municipality] = {}
+        self._load_lock = threading.RLock()
+    
+    @property
+    def snapshot(self) -> GazetteerSnapshot:
+        """Compiled location data, loaded on first access"""
+        if self._snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self.load_data()
+        return self._snapshot
+    
+    @property
+    def municipalities(self) -> Dict[str, Municipality]:
+        """Municipalities by id, materialized from the snapshot on first access"""
+        if self._municipalities is None:
+            with self._load_lock:
+                if self._municipalities is None:
+                    snapshot = self.snapshot
+                    municipality_list = [Municipality(**snapshot.municipality(i))
+                                         for i in range(snapshot.municipality_count)]
+                    by_name = {}
+                    for municipality in municipality_list:
+                        name_key = ' '.join(normalize_place_name(municipality.name))
+                        by_name[name_key] = municipality
+                        if name_key.endswith(' city'):
+                            by_name.setdefault(name_key[:-len(' city')], municipality)
+                        by_name.setdefault(municipality.id, municipality)
+                    self._municipality_list = municipality_list
+                    self._municipalities_by_name = by_name
+                    self._municipalities = {municipality.id: municipality for municipality in municipality_list}
+        return self._municipalities
     
     def load_data(self):
-        """Load location data from JSON file or create default data"""
+        """
+        Map the compiled snapshot of the location data, rebuilding it first when
+        the JSON file (or the built-in default data, if there is no file) changed
+        """
+        with self._load_lock:
+            source = self._read_source()
+            fingerprint = source_fingerprint(source)
+            
+            snapshot = None
+            try:
+                snapshot = GazetteerSnapshot.open(self.snapshot_file)
+                if snapshot.fingerprint != fingerprint:
+                    snapshot.close()
+                    snapshot = None
+            except (OSError, ValueError):
+                snapshot = None
+            
+            if snapshot is None:
+                snapshot = self._compile_snapshot(source, fingerprint)
+            
+            self._snapshot = snapshot
+            self._municipalities = None
+            logger.info(f"Loaded {snapshot.municipality_count} municipalities from {self.snapshot_file}")
+    
+    def _read_source(self) -> bytes:
+        """Raw location data: the JSON file, or the built-in data if it does not exist"""
         if os.path.exists(self.data_file):
             try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self._load_from_dict(data)
-                print(f"Loaded {len(self.municipalities)} municipalities from {self.data_file}")
-            except Exception as e:
-                print(f"Error loading data file: {e}")
-                self._create_default_data()
+                with open(self.data_file, 'rb') as f:
+                    return f.read()
+            except OSError as e:
+                logger.error(f"Error reading data file {self.data_file}: {e}")
         else:
-            print(f"Data file {self.data_file} not found, creating default data")
-            self._create_default_data()
-            self.save_data()
+            logger.warning(f"Data file {self.data_file} not found, using default data")
+        return self._default_source()
+    
+    def _default_source(self) -> bytes:
+        data = {'municipalities': [asdict(muni) for muni in self._create_default_data()]}
+        return json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')
     
-    def _load_from_dict(self, data: dict):
-        """Load municipalities from dictionary data"""
-        self.municipalities = {}
-        for muni_data in data.get('municipalities', []):
-            municipality = Municipality(**muni_data)
-            self.municipalities[municipality.id] = municipality
+    def _compile_snapshot(self, source: bytes, fingerprint: bytes) -> GazetteerSnapshot:
+        """Compile and write the snapshot; keep it in memory if the file cannot be written"""
+        try:
+            municipalities = json.loads(source.decode('utf-8'))['municipalities']
+        except (ValueError, KeyError) as e:
+            logger.error(f"Error loading data file {self.data_file}, using default data: {e}")
+            municipalities = json.loads(self._default_source().decode('utf-8'))['municipalities']
+        
+        data = build_snapshot(municipalities, fingerprint)
+        try:
+            write_snapshot(self.snapshot_file, data)
+            logger.info(f"Compiled location snapshot {self.snapshot_file} ({len(data)} bytes)")
+            return GazetteerSnapshot.open(self.snapshot_file)
+        except OSError as e:
+            logger.warning(f"Could not write location snapshot {self.snapshot_file}, keeping it in memory: {e}")
+            return GazetteerSnapshot(data)
     
-    def _create_default_data(self):
-        """Create default Laguna location data with correct barangays"""
+    def _create_default_data(self) -> List[Municipality]:
+        """Default Laguna location data with correct barangays"""
         default_municipalities = [
             # Cities
             Municipality("calamba", "Calamba City", "city", 14.1877, 121.1251, 539671, 149.50, [
@@ -236,8 +343,7 @@ class LagunaLocationAPI:
             ])
         ]
         
-        for municipality in default_municipalities:
-            self.municipalities[municipality.id] = municipality
+        return default_municipalities
     
     def save_data(self):
         """Save location data to JSON file"""
@@ -249,21 +355,151 @@ class LagunaLocationAPI:
             }
             with open(self.data_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
-            print(f"Saved {len(self.municipalities)} municipalities to {self.data_file}")
+            logger.info(f"Saved {len(self.municipalities)} municipalities to {self.data_file}")
         except Exception as e:
-            print(f"Error saving data: {e}")
+            logger.error(f"Error saving data: {e}")
     
+    def resolve_address(self, address: str) -> Optional[LocationSearchResult]:
+        """
+        Resolve a free-form address to a municipality (and barangay when named)
+        from the local gazetteer, without any network call
+
+        The address is scanned once, left to right, taking the longest known
+        place name at each token, so "San Pablo Norte" is a Santa Cruz barangay
+        rather than San Pablo City.
+
+        Args:
+            address (str): Free-form address, e.g. "Brgy. Parian, Calamba City, Laguna"
+
+        Returns:
+            LocationSearchResult or None: Best municipality/barangay match
+        """
+        tokens = normalize_place_name(address or '')
+        has_province = 'laguna' in tokens
+        snapshot = self.snapshot
+        municipality_list = self._municipality_list_loaded()
+
+        # spans: (position, entries) for each matched place name
+        spans = []
+        position = 0
+        after_marker = False
+        while position < len(tokens):
+            token = tokens[position]
+            if token in BARANGAY_MARKERS:
+                after_marker = True
+                position += 1
+                continue
+
+            matched_length = 0
+            if token not in CONTEXT_TOKENS or after_marker:
+                for length in range(min(snapshot.max_place_tokens, len(tokens) - position), 0, -1):
+                    entries = [(municipality_list[index].id, barangay) for index, barangay
+                               in snapshot.lookup_place(' '.join(tokens[position:position + length]))]
+                    if entries:
+                        if after_marker:
+                            # A name after "Brgy." is a barangay, not a municipality
+                            entries = [entry for entry in entries if entry[1] is not None] or entries
+                        spans.append((position, entries))
+                        matched_length = length
+                        break
+
+            after_marker = False
+            position += matched_length or 1
+
+        def supporting_barangays(municipality_id, span_position):
+            return [(position, barangay) for position, entries in spans if position != span_position
+                    for entry_id, barangay in entries if entry_id == municipality_id and barangay]
+
+        # Rank municipality mentions: backed by one of its barangays, then a
+        # distinctive name, then the later mention (addresses end with the town)
+        best = None
+        for position, entries in spans:
+            for municipality_id, barangay in entries:
+                if barangay is not None:
+                    continue
+                supported = bool(supporting_barangays(municipality_id, position))
+                strong = municipality_id not in WEAK_MUNICIPALITY_IDS
+                if not (strong or supported or has_province):
+                    continue
+                rank = (supported, strong, position)
+                if best is None or rank > best[0]:
+                    best = (rank, municipality_id, position)
+
+        municipality = None
+        barangay = None
+        if best is not None:
+            _, municipality_id, position = best
+            municipality = self.municipalities[municipality_id]
+            barangays = supporting_barangays(municipality_id, position)
+            if barangays:
+                barangay = barangays[-1][1]
+        else:
+            # No town named: accept a barangay only if it is unambiguous and the
+            # address is clearly a Laguna address
+            candidates = {(entry_id, name) for _, entries in spans for entry_id, name in entries if name}
+            if len(candidates) == 1 and has_province:
+                municipality_id, barangay = candidates.pop()
+                municipality = self.municipalities[municipality_id]
+
+        if municipality is None:
+            return None
+        return self._search_result(municipality, barangay)
+
+    def _municipality_list_loaded(self) -> List[Municipality]:
+        """Municipalities in snapshot order (snapshot records refer to them by index)"""
+        self.municipalities
+        return self._municipality_list
+
+    def _search_result(self, municipality: Municipality, barangay: Optional[str] = None) -> LocationSearchResult:
+        if barangay:
+            # Barangay centroid where known, otherwise the municipality center
+            lat, lng = municipality.barangay_centroids.get(barangay) or (municipality.lat, municipality.lng)
+            return LocationSearchResult(
+                type='barangay',
+                name=f"{barangay}, {municipality.name}",
+                municipality_id=municipality.id,
+                municipality_name=municipality.name,
+                lat=lat,
+                lng=lng,
+                barangay=barangay
+            )
+        return LocationSearchResult(
+            type='municipality',
+            name=municipality.name,
+            municipality_id=municipality.id,
+            municipality_name=municipality.name,
+            lat=municipality.lat,
+            lng=municipality.lng
+        )
+
+    def reverse_geocode(self, lat: float, lng: float,
+                        max_distance_km: float = REVERSE_GEOCODE_MAX_KM) -> Optional[LocationSearchResult]:
+        """
+        Map coordinates to the nearest barangay centroid, or to the nearest
+        municipality center where barangay centroids are not available
+
+        Args:
+            lat (float): Latitude
+            lng (float): Longitude
+            max_distance_km (float): Return None beyond this distance (outside Laguna)
+
+        Returns:
+            LocationSearchResult or None: Barangay/municipality containing the point's nearest center
+        """
+        nearest = self.snapshot.nearest_place(lat, lng, max_distance_km)
+        if nearest is None:
+            return None
+        muni_index, barangay, _, _, _ = nearest
+        return self._search_result(self._municipality_list_loaded()[muni_index], barangay)
+
     def get_municipality(self, municipality_id: str) -> Optional[Municipality]:
         """Get municipality by ID"""
         return self.municipalities.get(municipality_id)
     
     def get_municipality_by_name(self, name: str) -> Optional[Municipality]:
-        """Get municipality by name (case-insensitive)"""
-        name_lower = name.lower()
-        for municipality in self.municipalities.values():
-            if municipality.name.lower() == name_lower:
-                return municipality
-        return None
+        """Get municipality by name (case, accent and "City" suffix insensitive)"""
+        self.municipalities
+        return self._municipalities_by_name.get(' '.join(normalize_place_name(name)))
     
     def get_all_municipalities(self) -> List[Municipality]:
         """Get all municipalities"""
@@ -278,38 +514,70 @@ class LagunaLocationAPI:
         municipality = self.get_municipality(municipality_id)
         return municipality.barangays if municipality else []
     
-    def search_locations(self, query: str) -> List[LocationSearchResult]:
-        """Search for locations by name"""
-        query_lower = query.lower()
-        results = []
-        
-        # Search municipalities
-        for municipality in self.municipalities.values():
-            if query_lower in municipality.name.lower() or query_lower in municipality.id.lower():
-                results.append(LocationSearchResult(
-                    type='municipality',
-                    name=municipality.name,
-                    municipality_id=municipality.id,
-                    municipality_name=municipality.name,
-                    lat=municipality.lat,
-                    lng=municipality.lng
-                ))
-        
-        # Search barangays
-        for municipality in self.municipalities.values():
-            for barangay in municipality.barangays:
-                if query_lower in barangay.lower():
-                    results.append(LocationSearchResult(
-                        type='barangay',
-                        name=f"{barangay}, {municipality.name}",
-                        municipality_id=municipality.id,
-                        municipality_name=municipality.name,
-                        lat=municipality.lat,
-                        lng=municipality.lng,
-                        barangay=barangay
-                    ))
-        
-        return results
+    def search_locations(self, query: str, limit: Optional[int] = None) -> List[LocationSearchResult]:
+        """
+        Search municipalities and barangays by name, best matches first
+
+        Matches are ranked exact name, name prefix, word prefix ("pedro" ->
+        San Pedro), substring, then trigram fuzzy match for typos; municipalities
+        come before barangays within a tier. Accents and abbreviations
+        ("Sta.", "Sto.") are normalized on both sides.
+
+        Args:
+            query (str): Search text
+            limit (int, optional): Maximum number of results
+
+        Returns:
+            List[LocationSearchResult]: Ranked results
+        """
+        query_key = ' '.join(normalize_place_name(query))
+        if not query_key:
+            return []
+
+        snapshot = self.snapshot
+        municipality_list = self._municipality_list_loaded()
+        tiers: Dict[int, int] = {}
+        entries: Dict[int, Tuple[int, Optional[str], str]] = {}
+
+        def entry(entry_id):
+            if entry_id not in entries:
+                entries[entry_id] = snapshot.entry(entry_id)
+            return entries[entry_id]
+
+        for entry_id, start in snapshot.prefix_matches(query_key):
+            if start == 0:
+                name_key = entry(entry_id)[2]
+                exact = name_key == query_key or name_key == f"{query_key} city"
+                tier = MATCH_EXACT if exact else MATCH_PREFIX
+            else:
+                tier = MATCH_WORD_PREFIX
+            if tier < tiers.get(entry_id, MATCH_FUZZY + 1):
+                tiers[entry_id] = tier
+
+        # Substring and fuzzy matches are only needed when prefixes did not fill the page
+        if len(query_key) >= 3 and (limit is None or len(tiers) < limit):
+            query_trigrams = trigrams(query_key)
+            shared: Dict[int, int] = defaultdict(int)
+            for trigram in query_trigrams:
+                for entry_id in snapshot.trigram_postings(trigram):
+                    shared[entry_id] += 1
+
+            for entry_id, count in shared.items():
+                if entry_id in tiers:
+                    continue
+                if query_key in entry(entry_id)[2]:
+                    tiers[entry_id] = MATCH_SUBSTRING
+                elif 2 * count / (len(query_trigrams) + snapshot.entry_trigram_count(entry_id)) >= FUZZY_MIN_SIMILARITY:
+                    tiers[entry_id] = MATCH_FUZZY
+
+        def rank(entry_id):
+            _, barangay, name_key = entry(entry_id)
+            return (tiers[entry_id], barangay is not None, len(name_key), name_key)
+
+        ranked = sorted(tiers, key=rank)
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [self._search_result(municipality_list[entry(entry_id)[0]], entry(entry_id)[1]) for entry_id in ranked]
     
     def get_location_stats(self) -> Dict:
         """Get statistics about the location data"""
@@ -317,12 +585,14 @@ class LagunaLocationAPI:
         cities = len(self.get_municipalities_by_type('city'))
         municipalities = len(self.get_municipalities_by_type('municipality'))
         total_barangays = sum(len(muni.barangays) for muni in self.municipalities.values())
+        barangay_centroids = sum(len(muni.barangay_centroids) for muni in self.municipalities.values())
         
         return {
             'total_municipalities': total_municipalities,
             'cities': cities,
             'municipalities': municipalities,
             'total_barangays': total_barangays,
+            'barangays_with_centroids': barangay_centroids,
             'last_updated': datetime.now().isoformat()
         }
 
@@ -339,8 +609,72 @@ def get_all_municipalities() -> List[Municipality]:
 def get_barangays(municipality_id: str) -> List[str]:
     return laguna_api.get_barangays(municipality_id)
 
-def search_locations(query: str) -> List[LocationSearchResult]:
-    return laguna_api.search_locations(query)
+def search_locations(query: str, limit: Optional[int] = None) -> List[LocationSearchResult]:
+    return laguna_api.search_locations(query, limit)
+
+def resolve_address(address: str) -> Optional[LocationSearchResult]:
+    return laguna_api.resolve_address(address)
+
+def reverse_geocode(lat: float, lng: float) -> Optional[LocationSearchResult]:
+    return laguna_api.reverse_geocode(lat, lng)
 
 def get_location_stats() -> Dict:
-    return laguna_api.get_location_stats()
\ No newline at end of file
+    return laguna_api.get_location_stats()
+
+
+def fetch_barangay_centroids(api: LagunaLocationAPI, municipality_ids: Optional[List[str]] = None,
+                             refresh: bool = False) -> int:
+    """
+    Look up barangay centroids with Nominatim (rate limited by the geocoding
+    pipeline) and store them in the location JSON file. Results far from the
+    municipality center are rejected rather than stored.
+
+    Args:
+        api (LagunaLocationAPI): API whose data file is updated
+        municipality_ids (list, optional): Only these municipalities
+        refresh (bool): Also look up barangays that already have a centroid
+
+    Returns:
+        int: Number of centroids stored
+    """
+    from geocoding_pipeline import geocoding_pipeline, GeocodingError
+    from laguna_snapshot import distance_km
+
+    stored = 0
+    for municipality in api.get_all_municipalities():
+        if municipality_ids and municipality.id not in municipality_ids:
+            continue
+        for barangay in dict.fromkeys(municipality.barangays):
+            if barangay in municipality.barangay_centroids and not refresh:
+                continue
+            try:
+                coords = geocoding_pipeline.geocode_with_nominatim(
+                    f"{barangay}, {municipality.name}, Laguna, Philippines")
+            except GeocodingError as e:
+                logger.warning(f"Centroid lookup failed for {barangay}, {municipality.name}: {e}")
+                continue
+            if not coords:
+                continue
+            if distance_km(municipality.lat, municipality.lng, coords['lat'], coords['lng']) > CENTROID_MAX_OFFSET_KM:
+                logger.warning(f"Rejected centroid for {barangay}, {municipality.name}: too far from the town center")
+                continue
+            municipality.barangay_centroids[barangay] = [coords['lat'], coords['lng']]
+            stored += 1
+        api.save_data()
+    return stored
+
+
+if __name__ == '__main__':
+    # Populate barangay centroids: python laguna_locations_api.py --fetch-centroids [--municipality calamba]
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Laguna location data maintenance')
+    parser.add_argument('--fetch-centroids', action='store_true', help='Look up missing barangay centroids')
+    parser.add_argument('--municipality', action='append', help='Limit to a municipality id (repeatable)')
+    parser.add_argument('--refresh', action='store_true', help='Also re-fetch existing centroids')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.fetch_centroids:
+        print(f"Stored {fetch_barangay_centroids(laguna_api, args.municipality, args.refresh)} barangay centroids")
+    print(laguna_api.get_location_stats())
@@ -0,0 +1,457 @@
+"""
+Laguna Gazetteer Snapshot
+Precompiled, memory-mappable form of laguna_locations.json: fixed-width record
+arrays, a string table with an offsets array, and the sorted search and address
+indexes. Workers map it read-only on first use instead of parsing JSON and
+building Python indexes, and forked workers share its pages through the OS
+page cache.
+"""
+
+import os
+import re
+import math
+import mmap
+import struct
+import hashlib
+import logging
+import tempfile
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout or the indexing rules change; old snapshots are rebuilt
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_MAGIC = b'LGZS'
+
+# Abbreviations expanded before matching ("Sta. Rosa" -> "santa rosa")
+PLACE_ALIASES = {
+    'sta': 'santa',
+    'sto': 'santo',
+    'gen': 'general',
+    'pob': 'poblacion',
+}
+
+# Reverse geocoding grid cell size in degrees (~2.2 km)
+GRID_CELL_DEGREES = 0.02
+KM_PER_DEGREE = 111.32
+
+# Section ids, in file order
+(STRINGS, STRING_OFFSETS, MUNICIPALITIES, BARANGAYS, ENTRIES, PREFIXES,
+ TRIGRAMS, TRIGRAM_POSTINGS, ENTRY_TRIGRAM_COUNTS, PLACES, PLACE_POSTINGS,
+ GRID_CELLS, GRID_POINTS) = range(13)
+SECTION_COUNT = 13
+
+# magic, format version, longest place name in tokens, source fingerprint, (offset, length) per section
+_HEADER = struct.Struct('<4sHH32s' + 'II' * SECTION_COUNT)
+
+_OFFSET = struct.Struct('<I')
+# id string, name string, type string, lat, lng, population (-1 = unknown), area (NaN = unknown), first barangay, barangay count
+_MUNICIPALITY = struct.Struct('<IIIddqdII')
+# name string, centroid lat, lng (NaN = no centroid)
+_BARANGAY = struct.Struct('<Idd')
+# municipality index, barangay index (-1 for the municipality itself), normalized name string
+_ENTRY = struct.Struct('<HiI')
+# searchable string, entry id, start of the word the suffix begins at
+_PREFIX = struct.Struct('<IHH')
+# trigram, first posting, posting count
+_TRIGRAM = struct.Struct('<3sII')
+_POSTING = struct.Struct('<H')
+# normalized place name string, first posting, posting count
+_PLACE = struct.Struct('<III')
+# municipality index, barangay index (-1 for the municipality itself)
+_PLACE_POSTING = struct.Struct('<Hi')
+# grid row, grid column, first point, point count
+_GRID_CELL = struct.Struct('<iiII')
+# lat, lng, municipality index, barangay index (-1 for the municipality center)
+_GRID_POINT = struct.Struct('<ddHi')
+
+
+def normalize_place_name(text: str) -> List[str]:
+    """Lowercase, strip accents (ñ -> n), split on punctuation and expand abbreviations"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [PLACE_ALIASES.get(token, token) for token in re.findall(r'[a-z0-9]+', text)]
+
+
+def trigrams(text: str) -> set:
+    """Padded character trigrams of a normalized name"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def grid_cell(lat: float, lng: float) -> Tuple[int, int]:
+    return math.floor(lat / GRID_CELL_DEGREES), math.floor(lng / GRID_CELL_DEGREES)
+
+
+def distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Equirectangular distance, accurate to well under 1% at provincial scale"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * 6371.0
+
+
+def source_fingerprint(source: bytes) -> bytes:
+    """Fingerprint of the source data and the normalization rules it is indexed with"""
+    digest = hashlib.sha256(source)
+    digest.update(repr(sorted(PLACE_ALIASES.items())).encode('utf-8'))
+    return digest.digest()
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.blob = bytearray()
+        self.offsets = [0]
+
+    def add(self, text: str) -> int:
+        if text not in self.ids:
+            self.blob += text.encode('utf-8')
+            self.offsets.append(len(self.blob))
+            self.ids[text] = len(self.ids)
+        return self.ids[text]
+
+
+def build_snapshot(municipalities: List[dict], fingerprint: bytes) -> bytes:
+    """
+    Compile municipality records into a snapshot
+
+    Args:
+        municipalities (list): Municipality dicts as stored in laguna_locations.json
+            (optional 'barangay_centroids': {barangay: [lat, lng]})
+        fingerprint (bytes): source_fingerprint() of the data they were read from
+
+    Returns:
+        bytes: Snapshot file contents
+    """
+    strings = _StringTable()
+    municipality_records = []
+    barangay_records = []
+    first_barangays = []
+    grid_points = []  # (lat, lng, municipality index, barangay index)
+    entries = []  # (municipality index, barangay index, normalized name)
+    places: Dict[str, List[Tuple[int, int]]] = {}
+
+    def add_place(name, posting):
+        key = ' '.join(normalize_place_name(name))
+        if key and posting not in places.setdefault(key, []):
+            places[key].append(posting)
+
+    for muni_index, muni in enumerate(municipalities):
+        first_barangay = len(barangay_records)
+        first_barangays.append(first_barangay)
+        centroids = muni.get('barangay_centroids') or {}
+        indexed = set()
+        for barangay in muni.get('barangays') or []:
+            centroid = centroids.get(barangay)
+            lat, lng = (float(centroid[0]), float(centroid[1])) if centroid else (math.nan, math.nan)
+            if centroid and barangay not in indexed:
+                grid_points.append((lat, lng, muni_index, len(barangay_records)))
+                indexed.add(barangay)
+            barangay_records.append(_BARANGAY.pack(strings.add(barangay), lat, lng))
+        grid_points.append((float(muni['lat']), float(muni['lng']), muni_index, -1))
+        population = muni.get('population')
+        area = muni.get('area_km2')
+        municipality_records.append(_MUNICIPALITY.pack(
+            strings.add(muni['id']), strings.add(muni['name']), strings.add(muni['type']),
+            float(muni['lat']), float(muni['lng']),
+            -1 if population is None else int(population),
+            math.nan if area is None else float(area),
+            first_barangay, len(barangay_records) - first_barangay
+        ))
+
+        name_tokens = normalize_place_name(muni['name'])
+        add_place(muni['name'], (muni_index, -1))
+        add_place(muni['id'], (muni_index, -1))
+        if name_tokens and name_tokens[-1] == 'city':
+            add_place(' '.join(name_tokens[:-1]), (muni_index, -1))
+        entries.append((muni_index, -1, ' '.join(name_tokens)))
+
+    # Barangay search entries follow all municipalities (one per distinct name)
+    for muni_index, muni in enumerate(municipalities):
+        first_barangay = first_barangays[muni_index]
+        seen = {}
+        for offset, barangay in enumerate(muni.get('barangays') or []):
+            if barangay in seen:
+                continue
+            seen[barangay] = first_barangay + offset
+            add_place(barangay, (muni_index, first_barangay + offset))
+            entries.append((muni_index, first_barangay + offset, ' '.join(normalize_place_name(barangay))))
+
+    prefix_records = []
+    trigram_postings: Dict[str, List[int]] = {}
+    entry_trigram_counts = []
+    for entry_id, (muni_index, barangay_index, name_key) in enumerate(entries):
+        # Barangays are also reachable as "<barangay> <municipality>" ("parian cal")
+        searchable = name_key
+        if barangay_index >= 0:
+            searchable = f"{name_key} {entries[muni_index][2]}"
+        searchable_id = strings.add(searchable)
+        word_starts = [0] + [i + 1 for i, c in enumerate(name_key) if c == ' ']
+        for start in word_starts:
+            prefix_records.append((searchable[start:], searchable_id, entry_id, start))
+
+        entry_trigrams = trigrams(name_key)
+        entry_trigram_counts.append(len(entry_trigrams))
+        for trigram in entry_trigrams:
+            trigram_postings.setdefault(trigram, []).append(entry_id)
+
+    entry_records = [_ENTRY.pack(m, b, strings.add(key)) for m, b, key in entries]
+    place_keys = sorted(places)
+    place_key_ids = [strings.add(key) for key in place_keys]
+
+    sections = [b''] * SECTION_COUNT
+    sections[MUNICIPALITIES] = b''.join(municipality_records)
+    sections[BARANGAYS] = b''.join(barangay_records)
+    sections[ENTRIES] = b''.join(entry_records)
+    sections[PREFIXES] = b''.join(_PREFIX.pack(searchable_id, entry_id, start)
+                                  for _, searchable_id, entry_id, start in sorted(prefix_records))
+
+    trigram_records, postings = [], []
+    for trigram in sorted(trigram_postings):
+        trigram_records.append(_TRIGRAM.pack(trigram.encode('ascii'), len(postings), len(trigram_postings[trigram])))
+        postings.extend(trigram_postings[trigram])
+    sections[TRIGRAMS] = b''.join(trigram_records)
+    sections[TRIGRAM_POSTINGS] = b''.join(_POSTING.pack(entry_id) for entry_id in postings)
+    sections[ENTRY_TRIGRAM_COUNTS] = b''.join(_POSTING.pack(count) for count in entry_trigram_counts)
+
+    place_records, place_postings = [], []
+    for key, key_id in zip(place_keys, place_key_ids):
+        place_records.append(_PLACE.pack(key_id, len(place_postings), len(places[key])))
+        place_postings.extend(places[key])
+    sections[PLACES] = b''.join(place_records)
+    sections[PLACE_POSTINGS] = b''.join(_PLACE_POSTING.pack(m, b) for m, b in place_postings)
+
+    # Reverse geocoding grid: points sorted by cell, plus a sorted cell table
+    grid_points.sort(key=lambda point: grid_cell(point[0], point[1]))
+    cell_records = []
+    for index, (lat, lng, _, _) in enumerate(grid_points):
+        cell = grid_cell(lat, lng)
+        if cell_records and cell_records[-1][:2] == cell:
+            cell_records[-1][3] += 1
+        else:
+            cell_records.append([cell[0], cell[1], index, 1])
+    sections[GRID_CELLS] = b''.join(_GRID_CELL.pack(*record) for record in cell_records)
+    sections[GRID_POINTS] = b''.join(_GRID_POINT.pack(*point) for point in grid_points)
+
+    # The string table grows while the other sections are packed, so it is serialized last
+    sections[STRINGS] = bytes(strings.blob)
+    sections[STRING_OFFSETS] = b''.join(_OFFSET.pack(offset) for offset in strings.offsets)
+
+    table = []
+    offset = _HEADER.size
+    for section in sections:
+        table.extend((offset, len(section)))
+        offset += len(section)
+
+    max_tokens = max((len(key.split(' ')) for key in place_keys), default=1)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, max_tokens, fingerprint, *table)
+    return header + b''.join(sections)
+
+
+class GazetteerSnapshot:
+    """Read-only view over a snapshot buffer (an mmap or bytes); nothing is unpacked up front"""
+
+    def __init__(self, buffer):
+        self._buf = buffer
+        if len(buffer) < _HEADER.size:
+            raise ValueError("truncated gazetteer snapshot")
+        fields = _HEADER.unpack_from(buffer, 0)
+        magic, version, self.max_place_tokens, self.fingerprint = fields[:4]
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError("unsupported gazetteer snapshot format")
+        table = fields[4:]
+        self._sections = [(table[2 * i], table[2 * i + 1]) for i in range(SECTION_COUNT)]
+        if self._sections[-1][0] + self._sections[-1][1] > len(buffer):
+            raise ValueError("truncated gazetteer snapshot")
+
+    @classmethod
+    def open(cls, path: str) -> 'GazetteerSnapshot':
+        """Memory-map a snapshot file read-only"""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def _count(self, section: int, record: struct.Struct) -> int:
+        return self._sections[section][1] // record.size
+
+    def _record(self, section: int, record: struct.Struct, index: int) -> tuple:
+        return record.unpack_from(self._buf, self._sections[section][0] + index * record.size)
+
+    def _string_bytes(self, string_id: int) -> bytes:
+        base = self._sections[STRING_OFFSETS][0] + string_id * _OFFSET.size
+        start, end = struct.unpack_from('<II', self._buf, base)
+        blob = self._sections[STRINGS][0]
+        return self._buf[blob + start:blob + end]
+
+    def string(self, string_id: int) -> str:
+        return self._string_bytes(string_id).decode('utf-8')
+
+    @property
+    def municipality_count(self) -> int:
+        return self._count(MUNICIPALITIES, _MUNICIPALITY)
+
+    def municipality(self, index: int) -> dict:
+        """Municipality fields in the laguna_locations.json layout"""
+        id_id, name_id, type_id, lat, lng, population, area, first, count = \
+            self._record(MUNICIPALITIES, _MUNICIPALITY, index)
+        centroids = {}
+        for i in range(first, first + count):
+            centroid = self.barangay_centroid(i)
+            if centroid:
+                centroids[self.barangay(i)] = list(centroid)
+        return {
+            'id': self.string(id_id),
+            'name': self.string(name_id),
+            'type': self.string(type_id),
+            'lat': lat,
+            'lng': lng,
+            'population': None if population < 0 else population,
+            'area_km2': None if math.isnan(area) else area,
+            'barangays': [self.barangay(first + i) for i in range(count)],
+            'barangay_centroids': centroids
+        }
+
+    def barangay(self, index: int) -> str:
+        return self.string(self._record(BARANGAYS, _BARANGAY, index)[0])
+
+    def barangay_centroid(self, index: int) -> Optional[Tuple[float, float]]:
+        _, lat, lng = self._record(BARANGAYS, _BARANGAY, index)
+        return None if math.isnan(lat) else (lat, lng)
+
+    @property
+    def entry_count(self) -> int:
+        return self._count(ENTRIES, _ENTRY)
+
+    def entry(self, entry_id: int) -> Tuple[int, Optional[str], str]:
+        """Search entry as (municipality index, barangay name or None, normalized name)"""
+        muni_index, barangay_index, key_id = self._record(ENTRIES, _ENTRY, entry_id)
+        barangay = self.barangay(barangay_index) if barangay_index >= 0 else None
+        return muni_index, barangay, self.string(key_id)
+
+    def entry_trigram_count(self, entry_id: int) -> int:
+        return self._record(ENTRY_TRIGRAM_COUNTS, _POSTING, entry_id)[0]
+
+    def prefix_matches(self, prefix: str) -> List[Tuple[int, int]]:
+        """
+        Entries with a word start beginning with a normalized prefix
+
+        Returns:
+            list: (entry id, word start) pairs; start 0 means the whole name matches
+        """
+        target = prefix.encode('ascii', 'ignore')
+        count = self._count(PREFIXES, _PREFIX)
+
+        def suffix(index):
+            searchable_id, _, start = self._record(PREFIXES, _PREFIX, index)
+            return self._string_bytes(searchable_id)[start:]
+
+        index = bisect_left(range(count), target, key=suffix)
+        matches = []
+        while index < count:
+            searchable_id, entry_id, start = self._record(PREFIXES, _PREFIX, index)
+            if not self._string_bytes(searchable_id)[start:].startswith(target):
+                break
+            matches.append((entry_id, start))
+            index += 1
+        return matches
+
+    def trigram_postings(self, trigram: str) -> List[int]:
+        """Entry ids whose normalized name contains a trigram"""
+        target = trigram.encode('ascii', 'ignore')
+        count = self._count(TRIGRAMS, _TRIGRAM)
+        index = bisect_left(range(count), target, key=lambda i: self._record(TRIGRAMS, _TRIGRAM, i)[0])
+        if index == count:
+            return []
+        key, first, length = self._record(TRIGRAMS, _TRIGRAM, index)
+        if key != target:
+            return []
+        base = self._sections[TRIGRAM_POSTINGS][0]
+        return list(struct.unpack_from(f'<{length}H', self._buf, base + first * _POSTING.size))
+
+    def lookup_place(self, key: str) -> List[Tuple[int, Optional[str]]]:
+        """
+        Places whose normalized name is exactly `key`
+
+        Returns:
+            list: (municipality index, barangay name or None for the municipality itself)
+        """
+        target = key.encode('ascii', 'ignore')
+        count = self._count(PLACES, _PLACE)
+        index = bisect_left(range(count), target,
+                            key=lambda i: self._string_bytes(self._record(PLACES, _PLACE, i)[0]))
+        if index == count:
+            return []
+        key_id, first, length = self._record(PLACES, _PLACE, index)
+        if self._string_bytes(key_id) != target:
+            return []
+        places = []
+        for i in range(first, first + length):
+            muni_index, barangay_index = self._record(PLACE_POSTINGS, _PLACE_POSTING, i)
+            places.append((muni_index, self.barangay(barangay_index) if barangay_index >= 0 else None))
+        return places
+
+
+    def _grid_cell_points(self, row: int, col: int) -> range:
+        count = self._count(GRID_CELLS, _GRID_CELL)
+        index = bisect_left(range(count), (row, col), key=lambda i: self._record(GRID_CELLS, _GRID_CELL, i)[:2])
+        if index == count:
+            return range(0)
+        cell_row, cell_col, first, length = self._record(GRID_CELLS, _GRID_CELL, index)
+        if (cell_row, cell_col) != (row, col):
+            return range(0)
+        return range(first, first + length)
+
+    def nearest_place(self, lat: float, lng: float,
+                      max_distance_km: float) -> Optional[Tuple[int, Optional[str], float, float, float]]:
+        """
+        Nearest barangay centroid or municipality center, searching grid cells
+        ring by ring outward from the query point
+
+        Returns:
+            tuple or None: (municipality index, barangay name or None, lat, lng, distance in km)
+        """
+        row, col = grid_cell(lat, lng)
+        # A cell is at least this far away per ring (longitude degrees shrink with latitude)
+        ring_km = GRID_CELL_DEGREES * KM_PER_DEGREE * math.cos(math.radians(min(abs(lat), 89.0)))
+        max_ring = int(max_distance_km / ring_km) + 1
+
+        best = None
+        for ring in range(max_ring + 1):
+            if best is not None and (ring - 1) * ring_km > best[4]:
+                break
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    for index in self._grid_cell_points(r, c):
+                        point_lat, point_lng, muni_index, barangay_index = self._record(GRID_POINTS, _GRID_POINT, index)
+                        distance = distance_km(lat, lng, point_lat, point_lng)
+                        if distance <= max_distance_km and (best is None or distance < best[4]):
+                            best = (muni_index, barangay_index, point_lat, point_lng, distance)
+
+        if best is None:
+            return None
+        muni_index, barangay_index, point_lat, point_lng, distance = best
+        barangay = self.barangay(barangay_index) if barangay_index >= 0 else None
+        return muni_index, barangay, point_lat, point_lng, distance
+
+
+def write_snapshot(path: str, data: bytes):
+    """Write a snapshot atomically so concurrent workers never map a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.laguna_snapshot_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
@@ -0,0 +1,365 @@
+"""
+Client Map Index
+Zoom-aware grid clustering of client locations for the map. Every zoom level
+keeps a grid of cells sized to roughly CLUSTER_RADIUS_PX screen pixels, each
+cell holding running counts and coordinate sums per (care_type, status), so a
+viewport query touches only the cells inside the bounding box and its response
+grows with the viewport rather than with the caseload
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Cluster cell size in screen pixels (Leaflet tiles are 256px)
+CLUSTER_RADIUS_PX = int(os.getenv('MAP_CLUSTER_RADIUS_PX', '60'))
+
+# Above this zoom every client is returned as an individual point
+MAX_CLUSTER_ZOOM = int(os.getenv('MAP_MAX_CLUSTER_ZOOM', '17'))
+
+# Clusters up to this size list their members for the popup
+CLUSTER_MEMBER_LIMIT = int(os.getenv('MAP_CLUSTER_MEMBER_LIMIT', '10'))
+
+# Seconds before the index is resynchronized with Firestore
+MAP_INDEX_TTL = float(os.getenv('MAP_INDEX_TTL', '60'))
+
+CARE_TYPES = ('in_house', 'after_care')
+STATUSES = ('active', 'inactive', 'relapsed')
+
+# Fields the index needs from each client document
+MAP_FIELDS = ['name', 'address', 'care_type', 'status', 'coordinates', 'archived']
+
+
+def cell_degrees(zoom):
+    """Width in degrees of a cluster cell at a zoom level"""
+    return 360.0 / (2 ** zoom) * CLUSTER_RADIUS_PX / 256
+
+
+def parse_coordinates(coordinates):
+    """
+    Read a stored coordinates value (dict, or JSON string from older records)
+
+    Args:
+        coordinates: Value of a client's 'coordinates' field
+
+    Returns:
+        tuple or None: (lat, lng) when both are valid numbers
+    """
+    if isinstance(coordinates, str):
+        try:
+            coordinates = json.loads(coordinates)
+        except ValueError:
+            return None
+    if not isinstance(coordinates, dict) or 'lat' not in coordinates or 'lng' not in coordinates:
+        return None
+    try:
+        lat = float(coordinates['lat'])
+        lng = float(coordinates['lng'])
+    except (ValueError, TypeError):
+        return None
+    if math.isnan(lat) or math.isnan(lng):
+        return None
+    return lat, lng
+
+
+def map_point(client_id, client_dict):
+    """
+    Normalize a client document into a map point, as /api/clients/locations does
+
+    Args:
+        client_id (str): Firestore document id
+        client_dict (dict): Client document data
+
+    Returns:
+        dict or None: Point with 'id', 'name', 'lat', 'lng', 'care_type', 'status'
+        and 'source' (how the coordinates were obtained), or None when the client
+        is archived or has no valid coordinates
+    """
+    if client_dict.get('archived'):
+        return None
+    raw_coordinates = client_dict.get('coordinates', {})
+    coords = parse_coordinates(raw_coordinates)
+    if coords is None:
+        return None
+    source = raw_coordinates.get('source') if isinstance(raw_coordinates, dict) else None
+
+    care_type = str(client_dict.get('care_type', 'in_house')).lower().replace(' ', '_')
+    care_type = 'after_care' if care_type in ['after_care', 'aftercare'] else 'in_house'
+    status = str(client_dict.get('status', 'active')).lower()
+    if status not in STATUSES:
+        status = 'active'
+
+    return {
+        'id': client_id,
+        'name': client_dict.get('name', 'Unknown Client'),
+        'lat': coords[0],
+        'lng': coords[1],
+        'care_type': care_type,
+        'status': status,
+        'source': source or 'unknown'
+    }
+
+
+class _CellGroup:
+    """Running aggregate of the clients of one (care_type, status) in a cell"""
+    __slots__ = ('members', 'sum_lat', 'sum_lng')
+
+    def __init__(self):
+        self.members = set()
+        self.sum_lat = 0.0
+        self.sum_lng = 0.0
+
+
+class ClientMapIndex:
+    """Per-zoom grid clustering index over client map points"""
+
+    def __init__(self, loader=None, ttl=MAP_INDEX_TTL, max_zoom=MAX_CLUSTER_ZOOM):
+        """
+        Args:
+            loader (callable): Returns an iterable of (client_id, client_dict)
+                for the full client set; used by ensure_fresh()
+            ttl (float): Seconds before ensure_fresh() resynchronizes
+            max_zoom (int): Finest zoom level that is clustered
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.max_zoom = max_zoom
+        self._lock = threading.RLock()
+        self._points = {}
+        # One dict per zoom level: (row, col) -> {(care_type, status): _CellGroup}
+        self._levels = [{} for _ in range(max_zoom + 1)]
+        self._cell_sizes = [cell_degrees(zoom) for zoom in range(max_zoom + 1)]
+        self._loaded_at = None
+        self._stale = True
+        self.stats = {'syncs': 0, 'upserts': 0, 'removals': 0, 'last_sync_ms': 0.0}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        Register a callback for point changes, called as listener(old, new)
+        with the previous and current point dicts (either may be None)
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            for point in self._points.values():
+                listener(None, point)
+
+    def _notify(self, old, new):
+        for listener in self._listeners:
+            listener(old, new)
+
+    def _cell(self, zoom, lat, lng):
+        size = self._cell_sizes[zoom]
+        return math.floor(lat / size), math.floor(lng / size)
+
+    def _add(self, point):
+        key = (point['care_type'], point['status'])
+        for zoom, level in enumerate(self._levels):
+            cell = level.setdefault(self._cell(zoom, point['lat'], point['lng']), {})
+            group = cell.get(key)
+            if group is None:
+                group = cell[key] = _CellGroup()
+            group.members.add(point['id'])
+            group.sum_lat += point['lat']
+            group.sum_lng += point['lng']
+
+    def _discard(self, point):
+        key = (point['care_type'], point['status'])
+        for zoom, level in enumerate(self._levels):
+            cell_key = self._cell(zoom, point['lat'], point['lng'])
+            cell = level[cell_key]
+            group = cell[key]
+            group.members.discard(point['id'])
+            group.sum_lat -= point['lat']
+            group.sum_lng -= point['lng']
+            if not group.members:
+                del cell[key]
+                if not cell:
+                    del level[cell_key]
+
+    def upsert(self, client_id, client_dict):
+        """
+        Add, move or drop one client according to its current document
+
+        Args:
+            client_id (str): Firestore document id
+            client_dict (dict): Client document data (None when deleted)
+
+        Returns:
+            bool: True if the index changed
+        """
+        point = map_point(client_id, client_dict) if client_dict is not None else None
+        with self._lock:
+            current = self._points.get(client_id)
+            if current == point:
+                return False
+            if current is not None:
+                self._discard(current)
+                del self._points[client_id]
+            if point is not None:
+                self._add(point)
+                self._points[client_id] = point
+            self.stats['upserts'] += 1
+            self._notify(current, point)
+            return True
+
+    def remove(self, client_id):
+        """Drop a client from the index (deleted or archived)"""
+        with self._lock:
+            current = self._points.pop(client_id, None)
+            if current is None:
+                return False
+            self._discard(current)
+            self.stats['removals'] += 1
+            self._notify(current, None)
+            return True
+
+    def sync(self, records):
+        """
+        Bring the index in line with a full client listing, touching only the
+        cells of clients that were added, moved, changed or removed
+
+        Args:
+            records: Iterable of (client_id, client_dict)
+
+        Returns:
+            int: Number of clients whose entry changed
+        """
+        start = time.perf_counter()
+        changed = 0
+        with self._lock:
+            seen = set()
+            for client_id, client_dict in records:
+                seen.add(client_id)
+                if self.upsert(client_id, client_dict):
+                    changed += 1
+            for client_id in [cid for cid in self._points if cid not in seen]:
+                if self.remove(client_id):
+                    changed += 1
+            self._loaded_at = time.time()
+            self._stale = False
+            self.stats['syncs'] += 1
+            self.stats['last_sync_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        if changed:
+            logger.info("Map index synced: %d changed, %d points", changed, len(self._points))
+        return changed
+
+    def invalidate(self):
+        """Mark the index stale so the next query resynchronizes with Firestore"""
+        self._stale = True
+
+    def ensure_fresh(self):
+        """Resynchronize through the loader when stale or older than the TTL"""
+        if self.loader is None:
+            return
+        expired = self._loaded_at is None or time.time() - self._loaded_at > self.ttl
+        if self._stale or expired:
+            # Load outside the lock: the loader may take locks of its own
+            self.sync(list(self.loader()))
+
+    def clusters(self, bbox, zoom, care_types=None, statuses=None):
+        """
+        Clusters and single points inside a bounding box at a zoom level
+
+        Args:
+            bbox (tuple): (west, south, east, north) in degrees
+            zoom (int): Map zoom level
+            care_types (set): Only count these care types (None for all)
+            statuses (set): Only count these statuses (None for all)
+
+        Returns:
+            list: Dicts with 'type' 'cluster' ('lat', 'lng', 'count', 'care_type',
+            'status' breakdowns, and 'clients' for small clusters) or 'point'
+        """
+        west, south, east, north = bbox
+        zoom = max(0, int(zoom))
+
+        with self._lock:
+            if zoom > self.max_zoom:
+                return [dict(point, type='point') for point in self._points.values()
+                        if south <= point['lat'] <= north and west <= point['lng'] <= east
+                        and (care_types is None or point['care_type'] in care_types)
+                        and (statuses is None or point['status'] in statuses)]
+
+            level = self._levels[zoom]
+            min_row, min_col = self._cell(zoom, south, west)
+            max_row, max_col = self._cell(zoom, north, east)
+            span = (max_row - min_row + 1) * (max_col - min_col + 1)
+            if span <= len(level):
+                cells = ((key, level.get(key)) for key in
+                         ((row, col) for row in range(min_row, max_row + 1)
+                          for col in range(min_col, max_col + 1)))
+            else:
+                cells = ((key, cell) for key, cell in level.items()
+                         if min_row <= key[0] <= max_row and min_col <= key[1] <= max_col)
+
+            results = []
+            for _, cell in cells:
+                if cell:
+                    result = self._summarize(cell, care_types, statuses)
+                    if result:
+                        results.append(result)
+            return results
+
+    def _summarize(self, cell, care_types, statuses):
+        count = 0
+        sum_lat = sum_lng = 0.0
+        by_care_type = {}
+        by_status = {}
+        members = []
+        member_limit = max(CLUSTER_MEMBER_LIMIT, 1)
+        for (care_type, status), group in cell.items():
+            if care_types is not None and care_type not in care_types:
+                continue
+            if statuses is not None and status not in statuses:
+                continue
+            size = len(group.members)
+            count += size
+            sum_lat += group.sum_lat
+            sum_lng += group.sum_lng
+            by_care_type[care_type] = by_care_type.get(care_type, 0) + size
+            by_status[status] = by_status.get(status, 0) + size
+            if count <= member_limit:
+                members.extend(group.members)
+
+        if count == 0:
+            return None
+        if count == 1:
+            return dict(self._points[members[0]], type='point')
+
+        cluster = {
+            'type': 'cluster',
+            'lat': round(sum_lat / count, 6),
+            'lng': round(sum_lng / count, 6),
+            'count': count,
+            'care_type': by_care_type,
+            'status': by_status
+        }
+        if count <= CLUSTER_MEMBER_LIMIT:
+            cluster['clients'] = [self._points[client_id] for client_id in members]
+        return cluster
+
+    def get_stats(self):
+        """
+        Get index size and synchronization statistics
+
+        Returns:
+            dict: Index statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['points'] = len(self._points)
+            stats['cells'] = sum(len(level) for level in self._levels)
+            stats['max_zoom'] = self.max_zoom
+            stats['stale'] = self._stale
+            stats['age_seconds'] = round(time.time() - self._loaded_at, 1) if self._loaded_at else None
+        return stats
+
+
+# Global instance (app.py sets the loader)
+client_map_index = ClientMapIndex()
@@ -0,0 +1,99 @@
+"""
+ONNX Runtime Inference Backend
+Exports the Hugging Face sequence-classification models used by nlp_analyzer to
+ONNX (optionally with dynamic int8 quantization) and wraps them in regular
+transformers pipelines, so callers do not change
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Exported models are stored here and reused on later starts
+ONNX_MODEL_DIR = os.getenv('NLP_ONNX_MODEL_DIR', 'onnx_models')
+
+FP32_FILE_NAME = 'model.onnx'
+INT8_FILE_NAME = 'model_int8.onnx'
+
+
+def _model_dir(model_name):
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace('/', '--'))
+
+
+def export_model(model_name, quantize=False):
+    """
+    Export a model to ONNX once, plus an int8 copy when requested
+
+    Args:
+        model_name (str): Hugging Face model identifier
+        quantize (bool): Also produce a dynamically int8-quantized model
+
+    Returns:
+        tuple: (model directory, ONNX file name to load)
+    """
+    if not ONNX_AVAILABLE:
+        raise ImportError("optimum[onnxruntime] is not installed")
+
+    from transformers import AutoTokenizer
+
+    model_dir = _model_dir(model_name)
+    fp32_path = os.path.join(model_dir, FP32_FILE_NAME)
+
+    if not os.path.exists(fp32_path):
+        logger.info(f"Exporting {model_name} to ONNX in {model_dir}")
+        model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+        model.save_pretrained(model_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+    if not quantize:
+        return model_dir, FP32_FILE_NAME
+
+    int8_path = os.path.join(model_dir, INT8_FILE_NAME)
+    if not os.path.exists(int8_path):
+        logger.info(f"Quantizing {model_name} to int8")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    return model_dir, INT8_FILE_NAME
+
+
+def load_onnx_pipeline(task, model_name, quantize=False, **pipeline_kwargs):
+    """
+    Build a transformers pipeline that runs through ONNX Runtime
+
+    Args:
+        task (str): Pipeline task, e.g. 'sentiment-analysis' or 'zero-shot-classification'
+        model_name (str): Hugging Face model identifier
+        quantize (bool): Use the int8-quantized export
+        **pipeline_kwargs: Extra pipeline arguments (e.g. return_all_scores)
+
+    Returns:
+        transformers.Pipeline: Pipeline backed by an ORT model
+    """
+    from transformers import pipeline, AutoTokenizer
+
+    model_dir, file_name = export_model(model_name, quantize)
+    model = ORTModelForSequenceClassification.from_pretrained(model_dir, file_name=file_name)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    return pipeline(task, model=model, tokenizer=tokenizer, **pipeline_kwargs)
+
+
+if __name__ == '__main__':
+    # Pre-export models (e.g. in a deploy step): python nlp_onnx.py [--quantize]
+    import argparse
+    from nlp_analyzer import SENTIMENT_MODEL_NAME, DOMAIN_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description='Export NLP models to ONNX')
+    parser.add_argument('--quantize', action='store_true', help='Also write int8 dynamically quantized models')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    for name in (SENTIMENT_MODEL_NAME, DOMAIN_MODEL_NAME):
+        print(export_model(name, args.quantize))
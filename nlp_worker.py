@@ -0,0 +1,438 @@
+"""
+NLP Inference Worker
+Runs the nlp_analyzer models in a separate process and serves analysis jobs
+over a local socket, so slow model calls never block a web request thread
+"""
+
+import os
+import sys
+import hmac
+import time
+import hashlib
+import queue
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from nlp_analyzer import nlp_analyzer
+
+logger = logging.getLogger(__name__)
+
+# Where analysis runs: 'inprocess' (inside the Flask process, the default),
+# 'remote' (a worker started separately with `python nlp_worker.py`) or
+# 'local' (the app spawns a worker child process at startup)
+NLP_WORKER_MODE = os.getenv('NLP_WORKER_MODE', 'inprocess').lower()
+
+# 'host:port' for TCP or a filesystem path for a Unix socket
+NLP_WORKER_ADDRESS = os.getenv('NLP_WORKER_ADDRESS', '127.0.0.1:6070')
+
+# Shared secret for the worker channel. Connections unpickle what they receive,
+# so there is no built-in default: a separately started worker needs this set.
+# Without it, 'local' mode derives a key from the address and a random secret in
+# NLP_WORKER_KEY_FILE, shared by every app process on the host (reloader, gunicorn workers)
+NLP_WORKER_AUTHKEY = os.getenv('NLP_WORKER_AUTHKEY', '').encode() or None
+NLP_WORKER_KEY_FILE = os.getenv(
+    'NLP_WORKER_KEY_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.nlp_worker.key'))
+
+# Seconds a request waits for its analysis before giving up
+NLP_WORKER_TIMEOUT = float(os.getenv('NLP_WORKER_TIMEOUT', '15'))
+
+# Analyze in-process if the worker cannot be reached (not on timeouts)
+NLP_WORKER_FALLBACK = os.getenv('NLP_WORKER_FALLBACK', 'true').lower() == 'true'
+
+# Micro-batching: jobs arriving within BATCH_WAIT seconds share one model pass
+NLP_WORKER_MAX_BATCH = int(os.getenv('NLP_WORKER_MAX_BATCH', '16'))
+NLP_WORKER_BATCH_WAIT = float(os.getenv('NLP_WORKER_BATCH_WAIT', '0.02'))
+
+
+class NLPWorkerError(Exception):
+    """Raised when the NLP worker is unreachable or a job fails"""
+    pass
+
+
+class NLPWorkerTimeout(NLPWorkerError):
+    """Raised when a job does not complete within the timeout"""
+    pass
+
+
+def _local_secret(path=NLP_WORKER_KEY_FILE):
+    """
+    Random secret shared by the app processes on this host, created on first use
+
+    The file is written under a temporary name and linked into place, so
+    processes starting together all read the secret of the first one to finish
+
+    Args:
+        path (str): Key file location
+
+    Returns:
+        bytes: The secret
+    """
+    try:
+        with open(path, 'rb') as f:
+            secret = f.read()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+
+    directory = os.path.dirname(path) or '.'
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}")
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, os.urandom(32).hex().encode())
+    finally:
+        os.close(fd)
+    try:
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass  # Another process created it first
+    finally:
+        os.remove(temp_path)
+
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def default_authkey(address=NLP_WORKER_ADDRESS):
+    """
+    Authkey to use when none is passed explicitly
+
+    Args:
+        address (str): Worker address (the local key differs per address)
+
+    Returns:
+        bytes or None: NLP_WORKER_AUTHKEY, else the host-local key in 'local'
+        mode, else None
+    """
+    if NLP_WORKER_AUTHKEY:
+        return NLP_WORKER_AUTHKEY
+    if NLP_WORKER_MODE == 'local':
+        return hmac.new(_local_secret(), address.encode(), hashlib.sha256).digest()
+    return None
+
+
+def parse_address(address):
+    """
+    Convert a configured worker address into a multiprocessing address
+
+    Args:
+        address (str): 'host:port' or a Unix socket path
+
+    Returns:
+        tuple or str: (host, port) for TCP, the path for a Unix socket
+    """
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return (host, int(port))
+    return address
+
+
+class NLPWorkerServer:
+    """Owns the NLP models and answers analysis jobs from web processes"""
+
+    def __init__(self, address=NLP_WORKER_ADDRESS, authkey=None,
+                 max_batch=NLP_WORKER_MAX_BATCH, batch_wait=NLP_WORKER_BATCH_WAIT):
+        self.address = address
+        self.authkey = authkey or default_authkey(address)
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.jobs = queue.Queue()
+        self.processed = 0
+
+    def serve_forever(self):
+        """Warm up the models, then accept connections until the process exits"""
+        if not self.authkey:
+            raise NLPWorkerError("NLP_WORKER_AUTHKEY must be set to run a standalone NLP worker")
+        nlp_analyzer.warm_up()
+
+        listen_address = parse_address(self.address)
+        if isinstance(listen_address, str) and os.path.exists(listen_address):
+            os.remove(listen_address)  # Stale socket from a previous run
+
+        listener = Listener(listen_address, authkey=self.authkey)
+        logger.info(f"NLP worker listening on {self.address}")
+
+        threading.Thread(target=self._batch_loop, name='nlp-worker-batcher', daemon=True).start()
+
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected NLP worker connection with a bad authkey")
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        """Read jobs from one web process and queue them for the batcher"""
+        send_lock = threading.Lock()
+        try:
+            while True:
+                message = conn.recv()
+                op = message.get('op')
+
+                if op == 'analyze':
+                    self.jobs.put((conn, send_lock, message['id'], message['text']))
+                elif op == 'ping':
+                    self._send(conn, send_lock, {
+                        'id': message.get('id'),
+                        'ok': True,
+                        'readiness': nlp_analyzer.get_readiness(),
+                        'queued': self.jobs.qsize(),
+                        'processed': self.processed
+                    })
+                else:
+                    self._send(conn, send_lock, {'id': message.get('id'), 'ok': False, 'error': f"Unknown op: {op}"})
+        except (EOFError, OSError):
+            pass  # Web process disconnected
+        finally:
+            conn.close()
+
+    def _batch_loop(self):
+        """Drain queued jobs in micro-batches through analyze_notes_batch"""
+        while True:
+            batch = [self.jobs.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.jobs.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                analyses = nlp_analyzer.analyze_notes_batch([job[3] for job in batch], batch_size=self.max_batch)
+                replies = [{'id': job[2], 'ok': True, 'analysis': analysis} for job, analysis in zip(batch, analyses)]
+            except Exception as e:
+                logger.error(f"NLP worker batch of {len(batch)} failed: {e}")
+                replies = [{'id': job[2], 'ok': False, 'error': str(e)} for job in batch]
+
+            self.processed += len(batch)
+            for job, reply in zip(batch, replies):
+                self._send(job[0], job[1], reply)
+
+    def _send(self, conn, send_lock, message):
+        try:
+            with send_lock:
+                conn.send(message)
+        except (OSError, ValueError):
+            logger.warning("NLP worker could not deliver a reply; client disconnected")
+
+
+class NLPWorkerClient:
+    """
+    Submits analysis jobs to an NLP worker over one shared connection.
+    Replies are matched to jobs by id, so many request threads can wait at once
+    """
+
+    def __init__(self, address=NLP_WORKER_ADDRESS, authkey=None, timeout=NLP_WORKER_TIMEOUT):
+        self.address = address
+        self.authkey = authkey or default_authkey(address)
+        self.timeout = timeout
+        self._conn = None
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        """Open the shared connection and its reply reader (caller holds the lock)"""
+        if self._conn is None:
+            if not self.authkey:
+                raise NLPWorkerError("NLP_WORKER_AUTHKEY must be set to reach an NLP worker")
+            try:
+                conn = Client(parse_address(self.address), authkey=self.authkey)
+            except (OSError, AuthenticationError) as e:
+                raise NLPWorkerError(f"NLP worker unavailable at {self.address}: {e}")
+            self._conn = conn
+            threading.Thread(target=self._read_loop, args=(conn,), name='nlp-worker-replies', daemon=True).start()
+        return self._conn
+
+    def _read_loop(self, conn):
+        try:
+            while True:
+                reply = conn.recv()
+                with self._lock:
+                    future = self._pending.pop(reply.get('id'), None)
+                if future is None:
+                    continue  # Caller already timed out
+                if reply.get('ok'):
+                    future.set_result(reply)
+                else:
+                    future.set_exception(NLPWorkerError(reply.get('error', 'NLP worker job failed')))
+        except (EOFError, OSError) as e:
+            self._drop(conn, NLPWorkerError(f"Lost connection to NLP worker: {e}"))
+
+    def _drop(self, conn, error):
+        """Forget a dead connection and fail every job still waiting on it"""
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def _submit(self, message):
+        future = Future()
+        with self._lock:
+            conn = self._connect()
+            job_id = next(self._ids)
+            message['id'] = job_id
+            self._pending[job_id] = future
+            try:
+                conn.send(message)
+            except (OSError, ValueError) as e:
+                self._pending.pop(job_id, None)
+                self._drop(conn, NLPWorkerError(f"Lost connection to NLP worker: {e}"))
+                raise NLPWorkerError(f"Failed to send job to NLP worker: {e}")
+        return job_id, future
+
+    def _wait(self, job_id, future, timeout):
+        try:
+            return future.result(timeout=timeout if timeout is not None else self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(job_id, None)
+            raise NLPWorkerTimeout(f"NLP worker did not answer within {timeout or self.timeout}s")
+
+    def submit(self, text):
+        """
+        Queue a note for analysis without waiting
+
+        Args:
+            text (str): Raw narrative text
+
+        Returns:
+            Future: Resolves to the worker reply; reply['analysis'] holds the result
+        """
+        return self._submit({'op': 'analyze', 'text': text})[1]
+
+    def analyze(self, text, timeout=None):
+        """
+        Analyze a note on the worker and wait for the result
+
+        Args:
+            text (str): Raw narrative text
+            timeout (float, optional): Seconds to wait, defaults to NLP_WORKER_TIMEOUT
+
+        Returns:
+            dict: Same structure as nlp_analyzer.analyze_note
+        """
+        job_id, future = self._submit({'op': 'analyze', 'text': text})
+        return self._wait(job_id, future, timeout)['analysis']
+
+    def ping(self, timeout=2.0):
+        """
+        Check the worker is up
+
+        Returns:
+            dict: Worker readiness, queue depth and processed job count
+        """
+        job_id, future = self._submit({'op': 'ping'})
+        reply = self._wait(job_id, future, timeout)
+        return {key: reply[key] for key in ('readiness', 'queued', 'processed')}
+
+
+def run_worker(address=NLP_WORKER_ADDRESS, authkey=None):
+    """Process entry point for a worker"""
+    logging.basicConfig(level=logging.INFO)
+    NLPWorkerServer(address, authkey).serve_forever()
+
+
+def start_local_worker(address=NLP_WORKER_ADDRESS, authkey=None, wait=60.0):
+    """
+    Spawn a worker as a child of the current process (the local stand-in for a
+    separately deployed worker). Reuses a worker already listening at the address
+    if it accepts the same authkey, so app processes sharing the default key
+    share one worker
+
+    Args:
+        address (str): Worker address
+        authkey (bytes): Shared secret, defaults to default_authkey(address)
+        wait (float): Seconds to wait for the worker to accept connections
+
+    Returns:
+        multiprocessing.Process or None: The spawned process, None if reused
+    """
+    # Spawned children re-import the main module; never start a worker from one
+    if multiprocessing.parent_process() is not None:
+        return None
+
+    authkey = authkey or default_authkey(address)
+    probe = NLPWorkerClient(address, authkey)
+    try:
+        probe.ping()
+        logger.info(f"Reusing NLP worker already running at {address}")
+        return None
+    except NLPWorkerError:
+        pass
+
+    process = multiprocessing.Process(target=run_worker, args=(address, authkey), name='nlp-worker', daemon=True)
+    process.start()
+
+    # The listener only opens after warm-up, so wait for the models to load. If
+    # another app process started a worker at the same moment, ours cannot bind
+    # and exits; keep waiting for theirs, which accepts the same key
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        try:
+            probe.ping()
+            if not process.is_alive():
+                logger.info(f"Using the NLP worker another app process started at {address}")
+                return None
+            logger.info(f"Local NLP worker started at {address} (pid {process.pid})")
+            return process
+        except NLPWorkerError:
+            time.sleep(0.5)
+
+    logger.warning(f"Local NLP worker at {address} is not answering yet; requests will fall back to in-process analysis")
+    return process
+
+
+def analyze_note(text, timeout=None):
+    """
+    Analyze a note where NLP_WORKER_MODE says inference should run
+
+    Args:
+        text (str): Raw narrative text
+        timeout (float, optional): Seconds to wait for the worker
+
+    Returns:
+        dict: Same structure as nlp_analyzer.analyze_note
+
+    Raises:
+        NLPWorkerTimeout: The worker did not answer in time
+        NLPWorkerError: The worker is unreachable and fallback is disabled
+    """
+    if NLP_WORKER_MODE == 'inprocess':
+        return nlp_analyzer.analyze_note(text)
+
+    try:
+        return nlp_worker_client.analyze(text, timeout)
+    except NLPWorkerTimeout:
+        raise
+    except NLPWorkerError as e:
+        if not NLP_WORKER_FALLBACK:
+            raise
+        logger.warning(f"{e}; analyzing in-process instead")
+        return nlp_analyzer.analyze_note(text)
+
+
+# Global client instance
+nlp_worker_client = NLPWorkerClient()
+
+
+if __name__ == '__main__':
+    # Standalone worker: python nlp_worker.py [address]
+    run_worker(sys.argv[1] if len(sys.argv) > 1 else NLP_WORKER_ADDRESS)
@@ -0,0 +1,195 @@
+"""
+Asynchronous Note Ingestion
+Notes are stored immediately with analysis_status 'pending' and analyzed by a
+background executor, which patches the NLP results onto the same document
+"""
+
+import os
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import nlp_worker
+from firestore_schema import firestore_schema
+
+logger = logging.getLogger(__name__)
+
+# 'async' saves notes first and analyzes in the background; 'sync' keeps the
+# original analyze-then-save request path
+NOTE_ANALYSIS_MODE = os.getenv('NOTE_ANALYSIS_MODE', 'async').lower()
+
+NOTE_ANALYSIS_WORKERS = int(os.getenv('NOTE_ANALYSIS_WORKERS', '2'))
+NOTE_ANALYSIS_MAX_ATTEMPTS = int(os.getenv('NOTE_ANALYSIS_MAX_ATTEMPTS', '4'))
+
+# First retry after RETRY_BASE seconds, doubling on every further attempt
+NOTE_ANALYSIS_RETRY_BASE = float(os.getenv('NOTE_ANALYSIS_RETRY_BASE', '2.0'))
+
+# Pending notes untouched for STALE_AFTER seconds were lost with a restarted
+# process; every process sweeps for them each SWEEP_INTERVAL seconds (0 disables)
+NOTE_ANALYSIS_STALE_AFTER = float(os.getenv('NOTE_ANALYSIS_STALE_AFTER', '600'))
+NOTE_ANALYSIS_SWEEP_INTERVAL = float(os.getenv('NOTE_ANALYSIS_SWEEP_INTERVAL', '300'))
+
+
+class NoteIngestionQueue:
+    """Background executor that analyzes pending notes with retry and backoff"""
+
+    def __init__(self, max_workers=NOTE_ANALYSIS_WORKERS, max_attempts=NOTE_ANALYSIS_MAX_ATTEMPTS,
+                 retry_base=NOTE_ANALYSIS_RETRY_BASE):
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='note-analysis')
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._sweeper = None
+        self.stats = {'submitted': 0, 'completed': 0, 'retried': 0, 'failed': 0, 'recovered': 0}
+
+    def submit(self, client_id, note_id, text, attempts=0):
+        """
+        Queue a stored note for background analysis
+
+        Args:
+            client_id (str): Client identifier
+            note_id (str): Note document ID
+            text (str): Raw note text
+            attempts (int): Attempts already made (when requeueing)
+
+        Returns:
+            bool: False if the note is already queued or running
+        """
+        key = (client_id, note_id)
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+            self.stats['submitted'] += 1
+
+        self._executor.submit(self._run, client_id, note_id, text, attempts)
+        return True
+
+    def _run(self, client_id, note_id, text, attempts):
+        key = (client_id, note_id)
+        try:
+            analysis = nlp_worker.analyze_note(text)
+            if not firestore_schema.complete_note_analysis(client_id, note_id, analysis):
+                if firestore_schema.get_note(client_id, note_id) is None:
+                    logger.info(f"Note {note_id} was deleted before its analysis finished")
+                    self._finish(key)
+                    return
+                raise RuntimeError('Failed to store analysis results')
+
+            with self._lock:
+                self.stats['completed'] += 1
+            self._finish(key)
+
+        except Exception as e:
+            attempts += 1
+            exhausted = attempts >= self.max_attempts
+            firestore_schema.record_note_analysis_attempt(client_id, note_id, str(e), failed=exhausted)
+
+            if exhausted:
+                logger.error(f"Giving up on analysis of note {note_id} after {attempts} attempts: {e}")
+                with self._lock:
+                    self.stats['failed'] += 1
+                self._finish(key)
+                return
+
+            # Back off on a timer so the retry does not hold an executor thread
+            delay = self.retry_base * (2 ** (attempts - 1))
+            logger.warning(f"Analysis of note {note_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+            with self._lock:
+                self.stats['retried'] += 1
+            timer = threading.Timer(delay, self._executor.submit, args=(self._run, client_id, note_id, text, attempts))
+            timer.daemon = True
+            timer.start()
+
+    def _finish(self, key):
+        with self._lock:
+            self._in_flight.discard(key)
+
+    def requeue_unanalyzed(self, include_failed=True):
+        """
+        Queue every stored note that still lacks analysis, e.g. after a restart
+        lost the in-memory queue or once a model outage is fixed
+
+        Args:
+            include_failed (bool): Also retry notes whose retries were exhausted
+
+        Returns:
+            int: Number of notes queued
+        """
+        queued = 0
+        for note in firestore_schema.get_unanalyzed_notes(include_failed=include_failed):
+            # Results are only stored on pending notes
+            if note.get('analysis_status') == 'failed':
+                if not firestore_schema.reset_note_analysis(note['client_id'], note['note_id']):
+                    continue
+            if self.submit(note['client_id'], note['note_id'], note.get('text', '')):
+                queued += 1
+        logger.info(f"Requeued {queued} unanalyzed notes")
+        return queued
+
+    def requeue_stale(self, stale_after=NOTE_ANALYSIS_STALE_AFTER):
+        """
+        Queue pending notes whose analysis was abandoned, claiming each one first
+        so concurrent sweeps in other processes do not queue it too
+
+        Args:
+            stale_after (float): Seconds since a note was last claimed or attempted
+
+        Returns:
+            int: Number of notes queued
+        """
+        queued = 0
+        for note in firestore_schema.get_unanalyzed_notes(include_failed=False):
+            client_id, note_id = note['client_id'], note['note_id']
+            with self._lock:
+                if (client_id, note_id) in self._in_flight:
+                    continue
+            if not firestore_schema.claim_stale_pending_note(client_id, note_id, stale_after):
+                continue
+            if self.submit(client_id, note_id, note.get('text', ''), attempts=note.get('analysis_attempts', 0)):
+                queued += 1
+        if queued:
+            with self._lock:
+                self.stats['recovered'] += queued
+            logger.info(f"Requeued {queued} stale pending notes")
+        return queued
+
+    def start_sweeper(self, interval=NOTE_ANALYSIS_SWEEP_INTERVAL):
+        """
+        Sweep for stale pending notes now and then every interval seconds
+
+        Returns:
+            bool: False if the sweeper is disabled or already running
+        """
+        if interval <= 0 or self._sweeper is not None:
+            return False
+
+        def sweep():
+            while True:
+                try:
+                    self.requeue_stale()
+                except Exception as e:
+                    logger.error(f"Stale note sweep failed: {e}")
+                time.sleep(interval)
+
+        self._sweeper = threading.Thread(target=sweep, name='note-analysis-sweeper', daemon=True)
+        self._sweeper.start()
+        return True
+
+    def get_stats(self):
+        """
+        Get executor counters
+
+        Returns:
+            dict: Submitted/completed/retried/failed counts and in-flight notes
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._in_flight)
+        return stats
+
+
+# Global instance
+note_ingestion = NoteIngestionQueue()
@@ -0,0 +1,479 @@
+"""
+Note Search Index
+In-memory inverted index over client note text and extracted keywords.
+Notes are tokenized with the NLP pipeline's clean_text rules; each term keeps
+its positions per note, so a query is answered from posting lists with BM25
+ranking, quoted phrase matching and prefix (term*) expansion, for one client
+or across all clients. The index follows the notes collection group through an
+on_snapshot listener, so notes written by any process are searchable within
+seconds; this process's own writes are applied as soon as they succeed. The
+initial load runs in the background at startup. If the listener fails the index
+keeps serving for at most NOTE_SEARCH_MAX_STALENESS seconds, then resubscribes.
+With NOTE_SEARCH_LIVE=off it is rebuilt by a full scan every NOTE_SEARCH_TTL seconds
+"""
+
+import os
+import re
+import math
+import time
+import heapq
+import bisect
+import logging
+import threading
+
+from firebase_config import db
+from nlp_analyzer import clean_text
+
+logger = logging.getLogger(__name__)
+
+# 'on' follows the notes collection group with a listener; 'off' rebuilds by a full scan every TTL
+NOTE_SEARCH_LIVE = os.getenv('NOTE_SEARCH_LIVE', 'on').lower() != 'off'
+
+# Seconds before a listener-less index is rebuilt (bounds how stale other processes' notes are)
+NOTE_SEARCH_TTL = float(os.getenv('NOTE_SEARCH_TTL', '600'))
+
+# Longest time (seconds) a failed listener may keep serving before resubscribing
+NOTE_SEARCH_MAX_STALENESS = float(os.getenv('NOTE_SEARCH_MAX_STALENESS', '30'))
+
+# Seconds a search waits for the initial load before answering from what is indexed
+NOTE_SEARCH_START_TIMEOUT = float(os.getenv('NOTE_SEARCH_START_TIMEOUT', '30'))
+
+# Most indexed terms a single prefix query expands to
+NOTE_SEARCH_PREFIX_LIMIT = int(os.getenv('NOTE_SEARCH_PREFIX_LIMIT', '50'))
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Keyword terms are placed after the text at this position offset so phrases never span both
+KEYWORD_POSITION_OFFSET = 100000
+
+_TOKEN_RE = re.compile(r'\w+')
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    """Lowercased word tokens of a text, cleaned like note analysis input"""
+    if not isinstance(text, str) or not text.strip():
+        return []
+    return _TOKEN_RE.findall(clean_text(text))
+
+
+def parse_query(query):
+    """
+    Split a search string into clauses
+
+    Args:
+        query (str): Terms, "quoted phrases" and prefix terms ending in *
+
+    Returns:
+        list: ('term', token), ('phrase', [tokens]) and ('prefix', stem) tuples
+    """
+    clauses = []
+    for phrase, word in _QUERY_RE.findall(query or ''):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) == 1:
+                clauses.append(('term', tokens[0]))
+            elif tokens:
+                clauses.append(('phrase', tokens))
+            continue
+        tokens = tokenize(word)
+        if not tokens:
+            continue
+        if word.endswith('*'):
+            # A prefix applies to the last token ("self-cont*" is self + cont*)
+            if len(tokens) > 1:
+                clauses.append(('phrase', tokens[:-1]))
+            clauses.append(('prefix', tokens[-1]))
+        elif len(tokens) > 1:
+            # Hyphenated or punctuated words must appear as written
+            clauses.append(('phrase', tokens))
+        else:
+            clauses.append(('term', tokens[0]))
+    return clauses
+
+
+class NoteSearchIndex:
+    """Positional inverted index with BM25 ranking over client notes"""
+
+    def __init__(self, live=NOTE_SEARCH_LIVE, ttl=NOTE_SEARCH_TTL, prefix_limit=NOTE_SEARCH_PREFIX_LIMIT,
+                 max_staleness=NOTE_SEARCH_MAX_STALENESS, start_timeout=NOTE_SEARCH_START_TIMEOUT):
+        """
+        Args:
+            live (bool): Follow the notes collection group with a listener
+            ttl (float): Seconds before ensure_loaded() rebuilds when not live
+            prefix_limit (int): Most terms a prefix query expands to
+            max_staleness (float): Seconds a failed listener may keep serving
+            start_timeout (float): Seconds to wait for the initial load
+        """
+        self.live = live
+        self.ttl = ttl
+        self.prefix_limit = prefix_limit
+        self.max_staleness = max_staleness
+        self.start_timeout = start_timeout
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loaded_at = None
+        self._ready = threading.Event()
+        self._watch = None
+        self._reconcile = False
+        self._unhealthy_since = None
+        # Updates received while a build streams notes, replayed once it has indexed them
+        self._building = False
+        self._pending = []
+        self._reset()
+        self.stats = {'builds': 0, 'updates': 0, 'removals': 0, 'searches': 0, 'last_build_ms': 0.0,
+                      'snapshots': 0, 'resyncs': 0, 'errors': 0}
+
+    def _reset(self):
+        # term -> {(client_id, note_id): [positions]}
+        self._postings = {}
+        # Sorted terms for prefix expansion
+        self._terms = []
+        # (client_id, note_id) -> {'length', 'terms', 'archived', 'note'}
+        self._docs = {}
+        self._total_length = 0
+
+    # ---- maintenance -------------------------------------------------------
+
+    def _index(self, client_id, note_id, note_data):
+        key = (client_id, note_id)
+        self._unindex(key)
+
+        positions = {}
+        tokens = tokenize(note_data.get('text', ''))
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        length = len(tokens)
+        position = KEYWORD_POSITION_OFFSET
+        for keyword in note_data.get('keywords') or []:
+            for token in tokenize(keyword):
+                positions.setdefault(token, []).append(position)
+                position += 1
+                length += 1
+            # Leave a gap so consecutive keywords do not form phrases
+            position += 1
+
+        if not length:
+            return
+        for term, term_positions in positions.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[key] = term_positions
+
+        note = dict(note_data)
+        note['note_id'] = note_id
+        note.setdefault('client_id', client_id)
+        self._docs[key] = {
+            'length': length,
+            'terms': list(positions),
+            'archived': bool(note_data.get('client_archived', False)),
+            'note': note
+        }
+        self._total_length += length
+
+    def _unindex(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return False
+        for term in doc['terms']:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._terms, term)
+                if index < len(self._terms) and self._terms[index] == term:
+                    del self._terms[index]
+        self._total_length -= doc['length']
+        return True
+
+    def build(self):
+        """
+        Rebuild the index from every note in Firestore
+
+        Returns:
+            int: Number of notes indexed
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self._building = True
+            self._pending = []
+        try:
+            notes = []
+            for doc in db.collection_group('notes').stream():
+                note_data = doc.to_dict()
+                notes.append((note_data.get('client_id') or doc.reference.parent.parent.id, doc.id, note_data))
+        except Exception:
+            with self._lock:
+                self._building = False
+                self._pending = []
+            raise
+
+        with self._lock:
+            self._reset()
+            for client_id, note_id, note_data in notes:
+                self._index(client_id, note_id, note_data)
+            # The stream may have missed changes made while it ran
+            for update, args in self._pending:
+                update(*args)
+            self._building = False
+            self._pending = []
+            self._loaded_at = time.time()
+            self._ready.set()
+            self.stats['builds'] += 1
+            self.stats['last_build_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            logger.info(f"Note search index built: {len(self._docs)} notes, {len(self._postings)} terms")
+            return len(self._docs)
+
+    @staticmethod
+    def _note_key(doc):
+        return doc.reference.parent.parent.id, doc.id
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        try:
+            with self._lock:
+                if self._reconcile:
+                    # The first snapshot after subscribing holds every note;
+                    # notes deleted while unsubscribed are absent from it
+                    present = {self._note_key(doc) for doc in snapshots}
+                    for key in [key for key in self._docs if key not in present]:
+                        self._unindex(key)
+                    self._reconcile = False
+                for change in changes:
+                    client_id, note_id = self._note_key(change.document)
+                    if change.type.name == 'REMOVED':
+                        self._unindex((client_id, note_id))
+                    else:
+                        self._index(client_id, note_id, change.document.to_dict())
+                self._loaded_at = time.time()
+                self._unhealthy_since = None
+                self.stats['snapshots'] += 1
+            self._ready.set()
+        except Exception as e:
+            self._mark_unhealthy(e)
+
+    def _mark_unhealthy(self, error):
+        with self._lock:
+            self.stats['errors'] += 1
+            if self._unhealthy_since is None:
+                self._unhealthy_since = time.time()
+        logger.error(f"Note search listener error: {error}")
+
+    def _subscribe(self):
+        """(Re)subscribe to the notes collection group, falling back to a full scan"""
+        self.stats['resyncs'] += 1
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+            self._watch = None
+        self._reconcile = True
+        ready = threading.Event()
+        self._ready = ready
+        try:
+            self._watch = db.collection_group('notes').on_snapshot(self._on_snapshot)
+            if not ready.wait(self.start_timeout):
+                raise TimeoutError(f"No notes snapshot within {self.start_timeout}s")
+            logger.info(f"Note search index following {len(self._docs)} notes")
+        except Exception as e:
+            # Serve a full scan and try the listener again after max_staleness
+            self._mark_unhealthy(e)
+            self.build()
+            self._unhealthy_since = time.time()
+
+    def _needs_load(self):
+        if not self.live:
+            return self._loaded_at is None or time.time() - self._loaded_at > self.ttl
+        if self._watch is not None and self._unhealthy_since is None and not getattr(self._watch, 'is_active', True):
+            self._mark_unhealthy('listener stopped')
+        if self._watch is None and self._unhealthy_since is None:
+            return True
+        return self._unhealthy_since is not None and time.time() - self._unhealthy_since > self.max_staleness
+
+    def _load(self):
+        with self._load_lock:
+            if self._needs_load():
+                if self.live:
+                    self._subscribe()
+                else:
+                    self.build()
+
+    def start(self):
+        """Load the index on a background thread, so no request pays for the initial scan"""
+        threading.Thread(target=self._load, name='note-search-load', daemon=True).start()
+
+    def ensure_loaded(self):
+        """
+        Load the index on first use, resubscribe a failed listener once it has been
+        unhealthy for max_staleness, and rebuild a listener-less index older than the TTL
+        """
+        if self._loaded_at is None and self._load_lock.locked():
+            # The initial load is running (normally started by start()); wait for it
+            self._ready.wait(self.start_timeout)
+            return
+        if self._needs_load():
+            self._load()
+
+    def _update(self, update, *args):
+        """
+        Apply an update to the built index, and queue it for replay if a build
+        is streaming notes (no-op before the first build, which reads the
+        change from Firestore unless it is already streaming)
+        """
+        with self._lock:
+            if self._building:
+                self._pending.append((update, args))
+            if self._loaded_at is not None:
+                update(*args)
+
+    def add_note(self, client_id, note_id, note_data):
+        """
+        Index a new or changed note
+
+        Args:
+            client_id (str): Client identifier
+            note_id (str): Note document ID
+            note_data (dict): Note document data
+        """
+        self._update(self._add_note, client_id, note_id, note_data)
+
+    def _add_note(self, client_id, note_id, note_data):
+        self._index(client_id, note_id, note_data)
+        self.stats['updates'] += 1
+
+    def remove_note(self, client_id, note_id):
+        """Drop a deleted note from the index"""
+        self._update(self._remove_note, client_id, note_id)
+
+    def _remove_note(self, client_id, note_id):
+        if self._unindex((client_id, note_id)):
+            self.stats['removals'] += 1
+
+    def set_client_archived(self, client_id, archived):
+        """Mark a client's notes archived so cross-client searches skip them"""
+        self._update(self._set_client_archived, client_id, archived)
+
+    def _set_client_archived(self, client_id, archived):
+        for (doc_client_id, _), doc in self._docs.items():
+            if doc_client_id == client_id:
+                doc['archived'] = archived
+                doc['note']['client_archived'] = archived
+
+    # ---- search ------------------------------------------------------------
+
+    def _term_scores(self, term, accept):
+        """BM25 contribution of one term for every accepted note containing it"""
+        postings = self._postings.get(term)
+        if not postings:
+            return {}
+        total_docs = len(self._docs)
+        idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        average_length = self._total_length / total_docs
+        scores = {}
+        for key, positions in postings.items():
+            if not accept(key):
+                continue
+            frequency = len(positions)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._docs[key]['length'] / average_length)
+            scores[key] = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return scores
+
+    def _phrase_scores(self, tokens, accept):
+        """Notes containing the tokens consecutively, scored as the sum of their terms"""
+        term_scores = [self._term_scores(token, accept) for token in tokens]
+        if not all(term_scores):
+            return {}
+        candidates = set.intersection(*(set(scores) for scores in term_scores))
+        scores = {}
+        for key in candidates:
+            following = [set(self._postings[token][key]) for token in tokens[1:]]
+            if any(all(start + offset + 1 in positions for offset, positions in enumerate(following))
+                   for start in self._postings[tokens[0]][key]):
+                scores[key] = sum(term_score[key] for term_score in term_scores)
+        return scores
+
+    def _prefix_scores(self, stem, accept):
+        """Best-scoring expansion of a prefix per note"""
+        start = bisect.bisect_left(self._terms, stem)
+        scores = {}
+        for term in self._terms[start:start + self.prefix_limit]:
+            if not term.startswith(stem):
+                break
+            for key, score in self._term_scores(term, accept).items():
+                if score > scores.get(key, 0.0):
+                    scores[key] = score
+        return scores
+
+    def search(self, query, client_id=None, include_archived=False, limit=20):
+        """
+        Rank notes against a query
+
+        A note matches when it satisfies any clause (term, "phrase" or prefix*);
+        its score is the sum of the BM25 scores of the clauses it satisfies.
+
+        Args:
+            query (str): Search string
+            client_id (str): Restrict to one client's notes (None searches all clients)
+            include_archived (bool): Include notes of archived clients in cross-client searches
+            limit (int): Maximum number of results (None for every match)
+
+        Returns:
+            list: Note dicts (with note_id, client_id and search_score), best first
+        """
+        clauses = parse_query(query)
+        if not clauses:
+            return []
+        self.ensure_loaded()
+
+        with self._lock:
+            if not self._docs:
+                return []
+            if client_id is not None:
+                accept = lambda key: key[0] == client_id
+            elif include_archived:
+                accept = lambda key: True
+            else:
+                accept = lambda key: not self._docs[key]['archived']
+
+            totals = {}
+            for kind, value in clauses:
+                if kind == 'term':
+                    scores = self._term_scores(value, accept)
+                elif kind == 'phrase':
+                    scores = self._phrase_scores(value, accept)
+                else:
+                    scores = self._prefix_scores(value, accept)
+                for key, score in scores.items():
+                    totals[key] = totals.get(key, 0.0) + score
+
+            if limit is None:
+                top = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+            else:
+                top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1])
+            results = [dict(self._docs[key]['note'], search_score=round(score, 4)) for key, score in top]
+            self.stats['searches'] += 1
+        return results
+
+    def get_stats(self):
+        """
+        Get index size and maintenance statistics
+
+        Returns:
+            dict: Index statistics
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['notes'] = len(self._docs)
+            stats['terms'] = len(self._postings)
+            stats['age_seconds'] = round(time.time() - self._loaded_at, 1) if self._loaded_at else None
+            stats['live'] = self.live
+            stats['stale'] = self._unhealthy_since is not None
+        return stats
+
+
+# Global instance
+note_search_index = NoteSearchIndex()
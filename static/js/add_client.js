@@ -270,7 +270,8 @@ document.addEventListener('DOMContentLoaded', function() {
             const result = await response.json();
 
             if (result.success) {
-                showNotification('Client added successfully!', 'success');
+                // The message names the Client ID that was actually assigned
+                showNotification(result.message || 'Client added successfully!', 'success');
                 // Wait a moment to show the success message before redirecting
                 setTimeout(() => {
                     window.location.href = '/clients';
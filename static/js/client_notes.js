@@ -174,12 +174,39 @@ class ClientNotesManager {
         notesList.innerHTML = notes.map(note => this.createNoteElement(note)).join('');
     }
 
+    async waitForAnalysis(noteId, attempt = 0) {
+        // Poll the note's analysis status, then refresh the list and summary
+        const maxAttempts = 30;
+        if (!noteId || attempt >= maxAttempts) return;
+
+        try {
+            const response = await fetch(`/clients/${this.clientId}/notes/${noteId}/status`);
+            const data = await response.json();
+
+            if (response.ok && data.analysis_status === 'pending') {
+                setTimeout(() => this.waitForAnalysis(noteId, attempt + 1), Math.min(1000 * (attempt + 1), 5000));
+                return;
+            }
+            if (response.ok && data.analysis_status === 'failed') {
+                this.showError('NLP analysis failed for the new note after several attempts; an administrator can requeue it');
+            }
+        } catch (error) {
+            console.error('Error checking analysis status:', error);
+        }
+
+        this.loadNotes();
+        this.loadNLPSummary();
+    }
+
     createNoteElement(note) {
         const date = new Date(note.created_at).toLocaleString();
         const sentiment = note.sentiment || {};
         const tags = note.tags || {};
         const keywords = note.keywords || [];
 
+        // Notes saved before background analysis finishes have no NLP results yet
+        const isAnalyzed = !note.analysis_status || note.analysis_status === 'complete';
+
         // Get sentiment color
         const sentimentColor = this.getSentimentColor(sentiment.sentiment);
         
@@ -194,10 +221,15 @@ class ClientNotesManager {
                         <span class="note-author">${note.author || 'Staff Member'}</span>
                     </div>
                     <div class="note-sentiment">
+                        ${isAnalyzed ? `
                         <span class="sentiment-badge sentiment-${sentiment.sentiment}" style="background-color: ${sentimentColor}">
                             <i class="fas fa-${this.getSentimentIcon(sentiment.sentiment)}"></i>
                             ${sentiment.sentiment || 'neutral'}
-                        </span>
+                        </span>` : `
+                        <span class="sentiment-badge sentiment-pending">
+                            <i class="fas fa-${note.analysis_status === 'failed' ? 'exclamation-triangle' : 'spinner fa-spin'}"></i>
+                            ${note.analysis_status === 'failed' ? 'analysis failed' : 'analyzing'}
+                        </span>`}
                     </div>
                 </div>
                 <p class="note-content">${note.text}</p>
@@ -399,7 +431,13 @@ class ClientNotesManager {
             const data = await response.json();
             console.log('Server response:', data);
 
-            if (response.ok) {
+            if (response.status === 202) {
+                // Saved; NLP analysis finishes in the background
+                this.hideAddNoteModal();
+                this.loadNotes();
+                this.showSuccess('Note saved! NLP analysis is running...');
+                this.waitForAnalysis(data.note_id);
+            } else if (response.ok) {
                 this.hideAddNoteModal();
                 this.loadNotes();
                 this.loadNLPSummary();
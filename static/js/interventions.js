@@ -78,8 +78,8 @@ function initializeModals() {
         scanBtn.addEventListener('click', () => {
             scanModal.classList.add('active');
             document.body.style.overflow = 'hidden';
-            // Load clients when modal opens
-            loadClientsFromFirebase();
+            // Clients are found through the search box
+            showClientSearchPrompt();
         });
         
         if (closeScanBtn) {
@@ -452,48 +452,24 @@ function initializeScanFunctionality() {
         clientSearchInput.addEventListener('input', filterClients);
     }
     
-    // Load clients when scan modal opens
+    // Prompt for a search when scan modal opens
     const scanModal = document.getElementById('interventionScanModal');
     if (scanModal) {
-        scanModal.addEventListener('show.bs.modal', loadClientsFromFirebase);
+        scanModal.addEventListener('show.bs.modal', showClientSearchPrompt);
     }
 }
 
-function loadClientsFromFirebase() {
-    console.log('Loading clients from Firebase...');
-    
+function showClientSearchPrompt() {
     const clientsList = document.getElementById('clientsList');
     if (!clientsList) return;
     
-    // Show loading state
+    clientsData = [];
     clientsList.innerHTML = `
-        <div class="loading-clients">
-            <i class="fas fa-spinner fa-spin"></i>
-            <p>Loading clients...</p>
+        <div class="no-clients">
+            <i class="fas fa-search"></i>
+            <p>Search by name, client ID or barangay</p>
         </div>
     `;
-    
-    // Fetch clients from API
-    fetch('/api/clients/list')
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                clientsData = data.clients;
-                displayClients(clientsData);
-            } else {
-                throw new Error(data.error || 'Failed to load clients');
-            }
-        })
-        .catch(error => {
-            console.error('Error loading clients:', error);
-            clientsList.innerHTML = `
-                <div class="error-loading">
-                    <i class="fas fa-exclamation-triangle"></i>
-                    <p>Error loading clients: ${error.message}</p>
-                    <button class="btn-secondary" onclick="loadClientsFromFirebase()">Retry</button>
-                </div>
-            `;
-        });
 }
 
 function displayClients(clients) {
@@ -545,13 +521,56 @@ function selectClient(clientId) {
     console.log('Selected client:', selectedClient);
 }
 
+let clientSearchTimer = null;
+let clientSearchRequest = 0;
+
 function filterClients() {
-    const searchTerm = document.getElementById('clientSearchInput').value.toLowerCase();
-    const filteredClients = clientsData.filter(client => 
-        client.name.toLowerCase().includes(searchTerm) ||
-        client.clientId.toLowerCase().includes(searchTerm)
-    );
-    displayClients(filteredClients);
+    const searchTerm = document.getElementById('clientSearchInput').value.trim();
+    clearTimeout(clientSearchTimer);
+    
+    if (!searchTerm) {
+        clientSearchRequest++;
+        showClientSearchPrompt();
+        return;
+    }
+    
+    // Debounce keystrokes, then ask the server-side typeahead index
+    clientSearchTimer = setTimeout(() => {
+        const requestId = ++clientSearchRequest;
+        const clientsList = document.getElementById('clientsList');
+        if (clientsList && clientsData.length === 0) {
+            clientsList.innerHTML = `
+                <div class="loading-clients">
+                    <i class="fas fa-spinner fa-spin"></i>
+                    <p>Searching clients...</p>
+                </div>
+            `;
+        }
+        fetch(`/api/clients/search?q=${encodeURIComponent(searchTerm)}&limit=20`)
+            .then(response => response.json())
+            .then(data => {
+                // Ignore responses to searches the user has already typed past
+                if (requestId !== clientSearchRequest) return;
+                if (!data.success) {
+                    throw new Error(data.error || 'Failed to search clients');
+                }
+                clientsData = data.clients;
+                displayClients(clientsData);
+            })
+            .catch(error => {
+                if (requestId !== clientSearchRequest) return;
+                console.error('Error searching clients:', error);
+                if (clientsList) {
+                    clientsList.innerHTML = `
+                        <div class="error-loading">
+                            <i class="fas fa-exclamation-triangle"></i>
+                            <p>Error searching clients: ${error.message}</p>
+                            <button class="btn-secondary" onclick="filterClients()">Retry</button>
+                        </div>
+                    `;
+                }
+            });
+    }, 150);
 }
 
 function nextStep() {
@@ -633,8 +652,8 @@ function resetScanModal() {
     const searchInput = document.getElementById('clientSearchInput');
     if (searchInput) searchInput.value = '';
     
-    // Reload clients
-    loadClientsFromFirebase();
+    // Back to the search prompt
+    showClientSearchPrompt();
 }
 
 // Scan functionality
@@ -785,4 +804,4 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // Make functions globally available for onclick handlers
 window.selectClient = selectClient;
-window.loadClientsFromFirebase = loadClientsFromFirebase; 
\ No newline at end of file
+window.filterClients = filterClients; 
\ No newline at end of file
@@ -22,7 +22,13 @@ document.addEventListener('DOMContentLoaded', function() {
     let map = null;
     let heatLayer = null;
     let markers = [];
-    let clients = [];
+    // Individual clients in the viewport (points and members of small clusters)
+    let visibleClients = [];
+    let visibleTotal = 0;
+    let visibleItems = [];
+    // Popup details fetched per client when its marker is opened
+    const clientDetails = new Map();
+    let pendingPopupClientId = null;
     let baseLayer = null;
     let isHeatMapVisible = true;
     let isLoading = false;
@@ -108,6 +114,11 @@ document.addEventListener('DOMContentLoaded', function() {
             showHeatMapInfo(e.latlng);
         });
 
+        // Server-side clusters and heat map cells depend on the viewport
+        map.on('moveend', function() {
+            loadViewportLayers();
+        });
+
         // Add zoom control to top-right
         map.zoomControl.setPosition('topright');
 
@@ -128,7 +139,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Store tile layers for later use
         window.tileLayers = tileLayers;
 
-        // Load real client data instead of sample data
+        // Markers and heat map for the initial viewport
         loadClientData();
         
         // Add test markers for demonstration (remove this after testing)
@@ -141,7 +152,7 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('loadingOverlay').style.display = 'flex';
         
         // Show loading in client list if no data yet
-        if (clients.length === 0) {
+        if (visibleClients.length === 0) {
             const locationItems = document.querySelector('.location-items');
             if (locationItems) {
                 locationItems.innerHTML = `
@@ -182,11 +193,11 @@ document.addEventListener('DOMContentLoaded', function() {
         const heatMapUpdateTimeElement = document.getElementById('heatMapUpdateTime');
         
         if (totalPointsElement) {
-            totalPointsElement.textContent = heatData.length;
+            // Each point carries its client count as the intensity
+            totalPointsElement.textContent = heatData.reduce((total, point) => total + point[2], 0);
         }
         
         if (maxDensityElement) {
-            // Calculate max density (for now, just use the count)
             const maxDensity = heatData.length > 0 ? Math.max(...heatData.map(point => point[2])) : 0;
             maxDensityElement.textContent = maxDensity;
         }
@@ -207,19 +218,15 @@ document.addEventListener('DOMContentLoaded', function() {
     function showHeatMapInfo(latlng) {
         if (!isHeatMapVisible) return;
         
-        // Find nearby clients within a reasonable distance
-        const nearbyClients = clients.filter(client => {
-            if (!client.coordinates) return false;
-            const distance = calculateDistance(
-                latlng.lat, latlng.lng,
-                client.coordinates.lat, client.coordinates.lng
-            );
-            return distance <= 5; // Within 5km
-        });
+        // Count clients in the loaded clusters and points within a reasonable distance
+        const nearbyItems = visibleItems.filter(item =>
+            calculateDistance(latlng.lat, latlng.lng, item.lat, item.lng) <= 5 // Within 5km
+        );
+        const nearbyClients = nearbyItems.flatMap(item => item.type === 'point' ? [item] : (item.clients || []));
         
         // Determine density level based on nearby clients
         let densityLevel, densityColor, densityDescription;
-        const clientCount = nearbyClients.length;
+        const clientCount = nearbyItems.reduce((total, item) => total + (item.count || 1), 0);
         
         if (clientCount === 0) {
             densityLevel = "Very Low";
@@ -283,32 +290,23 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Update client count display
     function updateClientCount() {
-        const filteredClients = filterClients();
-        const totalClients = clients.length;
-        const activeClients = filteredClients.length;
+        const shownClients = filterClients().length;
         
         if (window.updateClientCount) {
-            if (activeClients === totalClients) {
-                window.updateClientCount(totalClients);
+            if (!searchInput || !searchInput.value) {
+                window.updateClientCount(visibleTotal);
             } else {
-                window.updateClientCount(`${activeClients} of ${totalClients}`);
+                window.updateClientCount(`${shownClients} of ${visibleTotal}`);
             }
         }
     }
 
-    // Load real client data from API
+    // Load the clusters and heat map for the current viewport
     async function loadClientData() {
         try {
             showLoading();
             console.log('Loading client location data...');
-            const response = await fetch('/api/clients/locations');
-            
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            
-            const clientData = await response.json();
-            console.log('Raw client data:', clientData); // Log raw data
+            await loadViewportLayers();
             
             // Also load location API stats for debugging
             try {
@@ -321,39 +319,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 console.warn('Could not load location API stats:', e);
             }
             
-            // Process and validate client data
-            const invalidClients = []; // Track invalid clients
-            clients = clientData.filter(client => {
-                // Only include clients with valid coordinates
-                const isValid = client.coordinates && 
-                       typeof client.coordinates.lat === 'number' && 
-                       typeof client.coordinates.lng === 'number' &&
-                       !isNaN(client.coordinates.lat) && 
-                       !isNaN(client.coordinates.lng);
-                
-                if (!isValid) {
-                    invalidClients.push({
-                        name: client.name,
-                        address: client.address,
-                        coordinates: client.coordinates
-                    });
-                }
-                return isValid;
-            });
-            
-            console.log('Invalid clients:', invalidClients); // Log invalid clients
-            console.log(`Loaded ${clients.length} clients with valid coordinates`);
+            console.log(`Loaded ${visibleTotal} clients in the current view`);
             
             hideLoading();
             updateLastUpdateTime(); // Update the last update time
             
-            if (clients.length === 0) {
-                console.warn('No clients with valid coordinates found');
+            if (visibleTotal === 0) {
+                console.warn('No clients with valid coordinates in view');
                 showNoDataMessage();
-            } else {
-                updateMap();
-                updateClientList();
-                updateClientCount();
             }
 
             // Start background geocoding for any missing coordinates
@@ -390,13 +363,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Set up periodic refresh to get newly geocoded locations
                 const checkInterval = setInterval(async () => {
                     if (!isLoading) {
-                        const newData = await fetch('/api/clients/locations').then(r => r.json());
-                        console.log('New data from refresh:', newData); // Log refreshed data
-                        if (newData.length > clients.length) {
-                            clients = newData;
-                            updateMap();
-                            updateClientList();
-                            updateClientCount();
+                        const previousTotal = visibleTotal;
+                        await loadViewportLayers();
+                        if (visibleTotal > previousTotal) {
                             showNotification('New client locations added to map', 'success');
                         }
                     }
@@ -459,93 +428,142 @@ document.addEventListener('DOMContentLoaded', function() {
         `;
     }
 
-    // Update map with filtered clients
+    // Update map for the current filters
     function updateMap() {
-        const filteredClients = filterClients();
-        
-        // Clear existing markers
-        markers.forEach(marker => map.removeLayer(marker));
-        markers = [];
-
-        // Update heat map data with enhanced online functionality
-        const heatData = filteredClients.map(client => [
-            client.coordinates.lat,
-            client.coordinates.lng,
-            1 // intensity - could be weighted by factors like client priority, etc.
-        ]);
-        
-        console.log('Updating heat map with', heatData.length, 'data points');
-        heatLayer.setLatLngs(heatData);
-        
-        // Update heat map legend stats
-        updateHeatMapStats(heatData);
+        // Markers and heat map come precomputed from the server for the current viewport
+        loadViewportLayers();
+    }
+    
+    // Query parameters describing the visible bounds, zoom and filters
+    function viewportParams() {
+        return new URLSearchParams({
+            bbox: map.getBounds().toBBoxString(),
+            zoom: map.getZoom(),
+            care_type: clientTypeFilter.value,
+            status: statusFilter.value
+        });
+    }
 
-        // Group clients by location (within 0.001 degrees = ~100m)
-        const locationGroups = groupClientsByLocation(filteredClients, 0.001);
-        
-        // Add markers for each client or group
-        locationGroups.forEach(group => {
-            if (group.clients.length === 1) {
-                // Single client - add individual marker
-                const client = group.clients[0];
-                const markerIcon = getClientMarkerIcon(client);
-                const marker = L.marker([client.coordinates.lat, client.coordinates.lng], {
-                    icon: markerIcon
-                })
-                    .bindPopup(createPopupContent(client))
-                    .addTo(map);
-                markers.push(marker);
-            } else {
-                // Multiple clients at same location - add cluster marker
-                const clusterMarker = createClusterMarker(group);
-                markers.push(clusterMarker);
+    function loadViewportLayers() {
+        const params = viewportParams();
+        return Promise.all([loadHeatMapTile(params), loadClusterMarkers(params)]);
+    }
+
+    // Fetch density grid cells for the viewport and redraw the heat map
+    let heatRequestId = 0;
+    async function loadHeatMapTile(params) {
+        const requestId = ++heatRequestId;
+        try {
+            const response = await fetch(`/api/clients/heatmap?${params}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
             }
-        });
+            const result = await response.json();
+            if (requestId !== heatRequestId || !result.success) return;
 
-        // Update client count
-        updateClientCount();
+            console.log('Updating heat map with', result.points.length, 'grid cells');
+            heatLayer.setLatLngs(result.points);
+            updateHeatMapStats(result.points);
+        } catch (error) {
+            console.error('Error loading heat map:', error);
+        }
     }
-    
-    // Group clients by location proximity
-    function groupClientsByLocation(clients, proximityThreshold = 0.001) {
-        const groups = [];
-        const processed = new Set();
-        
-        clients.forEach((client, index) => {
-            if (processed.has(index)) return;
-            
-            const group = {
-                center: { lat: client.coordinates.lat, lng: client.coordinates.lng },
-                clients: [client]
-            };
-            
-            processed.add(index);
-            
-            // Find other clients at the same location
-            clients.forEach((otherClient, otherIndex) => {
-                if (otherIndex === index || processed.has(otherIndex)) return;
-                
-                const distance = Math.sqrt(
-                    Math.pow(client.coordinates.lat - otherClient.coordinates.lat, 2) +
-                    Math.pow(client.coordinates.lng - otherClient.coordinates.lng, 2)
-                );
-                
-                if (distance <= proximityThreshold) {
-                    group.clients.push(otherClient);
-                    processed.add(otherIndex);
+
+    // Fetch clusters for the visible bounds and zoom and redraw the markers
+    let clusterRequestId = 0;
+    async function loadClusterMarkers(params = viewportParams()) {
+        const requestId = ++clusterRequestId;
+
+        try {
+            const response = await fetch(`/api/clients/clusters?${params}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const result = await response.json();
+
+            // A newer pan/zoom has already been requested
+            if (requestId !== clusterRequestId || !result.success) return;
+
+            markers.forEach(marker => map.removeLayer(marker));
+            markers = [];
+            visibleItems = result.clusters;
+            visibleTotal = result.total;
+            visibleClients = [];
+
+            result.clusters.forEach(item => {
+                if (item.type === 'point') {
+                    visibleClients.push(item);
+                    const marker = L.marker([item.lat, item.lng], {
+                        icon: getClientMarkerIcon(item)
+                    })
+                        .bindPopup(createPopupContent(clientDetails.get(item.id) || pointSummary(item)))
+                        .addTo(map);
+                    marker.clientId = item.id;
+                    marker.on('popupopen', () => loadClientPopup(marker, item));
+                    markers.push(marker);
+                } else {
+                    visibleClients.push(...(item.clients || []));
+                    const group = {
+                        center: { lat: item.lat, lng: item.lng },
+                        clients: item.clients || [],
+                        count: item.count,
+                        careTypes: item.care_type
+                    };
+                    const clusterMarker = createClusterMarker(group);
+                    clusterMarker.on('dblclick', () => map.setView([item.lat, item.lng], map.getZoom() + 2));
+                    markers.push(clusterMarker);
                 }
             });
-            
-            groups.push(group);
-        });
-        
-        return groups;
+
+            updateClientList();
+            updateClientCount();
+
+            // A client picked from the sidebar is now drawn as its own marker
+            if (pendingPopupClientId) {
+                const marker = markers.find(m => m.clientId === pendingPopupClientId);
+                if (marker) {
+                    pendingPopupClientId = null;
+                    marker.openPopup();
+                }
+            }
+        } catch (error) {
+            console.error('Error loading map clusters:', error);
+        }
+    }
+
+    // Popup fields known from a cluster point before its details are fetched
+    function pointSummary(item) {
+        return {
+            ...item,
+            address: 'Loading address...',
+            coordinates: { lat: item.lat, lng: item.lng },
+            coordinate_source: item.source
+        };
+    }
+
+    // Fetch a client's address and coordinate details the first time its popup opens
+    async function loadClientPopup(marker, item) {
+        if (clientDetails.has(item.id)) return;
+        try {
+            const response = await fetch(`/api/clients/${encodeURIComponent(item.id)}/location`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const result = await response.json();
+            if (!result.success) return;
+
+            clientDetails.set(item.id, result.client);
+            marker.setPopupContent(createPopupContent(result.client));
+            updateClientList();
+        } catch (error) {
+            console.error('Error loading client details:', error);
+        }
     }
     
     // Create a cluster marker for multiple clients at the same location
     function createClusterMarker(group) {
         const center = group.center;
-        const clientCount = group.clients.length;
+        const clientCount = group.count || group.clients.length;
         
         // Create cluster icon
         const clusterIcon = L.divIcon({
@@ -582,9 +600,23 @@ document.addEventListener('DOMContentLoaded', function() {
             `;
         }).join('');
         
+        if (group.clients.length === 0) {
+            const careTypes = group.careTypes || {};
+            return `
+                <div class="cluster-popup">
+                    <h4>${group.count} Clients in this area</h4>
+                    <div class="cluster-clients">
+                        <div class="cluster-client-item"><span class="client-type">In-House</span> ${careTypes.in_house || 0}</div>
+                        <div class="cluster-client-item"><span class="client-type">After Care</span> ${careTypes.after_care || 0}</div>
+                    </div>
+                    <p>Zoom in to see individual clients</p>
+                </div>
+            `;
+        }
+
         return `
             <div class="cluster-popup">
-                <h4>${group.clients.length} Clients at this location</h4>
+                <h4>${group.clients.length} Clients ${group.count ? 'in this area' : 'at this location'}</h4>
                 <div class="cluster-clients">
                     ${clientList}
                 </div>
@@ -703,7 +735,7 @@ document.addEventListener('DOMContentLoaded', function() {
         `;
     }
 
-    // Update client list in sidebar
+    // Update client list in sidebar with the clients drawn in the viewport
     function updateClientList() {
         const filteredClients = filterClients();
         const locationItems = document.querySelector('.location-items');
@@ -745,7 +777,7 @@ document.addEventListener('DOMContentLoaded', function() {
             item.className = 'location-item';
             
             // Add coordinate source indicator
-            const sourceClass = client.coordinate_source || 'unknown';
+            const sourceClass = client.source || 'unknown';
             let sourceIcon = 'fas fa-map-marker-alt';
             switch(sourceClass) {
                 case 'google': sourceIcon = 'fab fa-google'; break;
@@ -754,13 +786,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 case 'fallback': sourceIcon = 'fas fa-exclamation-triangle'; break;
             }
             
+            const details = clientDetails.get(client.id) || {};
             item.innerHTML = `
                 <div class="location-icon ${client.care_type === 'in_house' ? 'in-house' : 'after-care'}">
                     <i class="fas fa-user"></i>
                 </div>
                 <div class="location-details">
                     <h4>${client.name}</h4>
-                    <p>${client.formatted_address || client.address}</p>
+                    <p>${details.formatted_address || details.address || ''}</p>
                     <div class="location-meta">
                         <span class="location-type">${client.care_type === 'in_house' ? 'In-House' : 'After Care'}</span>
                         <span class="client-status ${client.status.toLowerCase()}">${client.status}</span>
@@ -772,12 +805,9 @@ document.addEventListener('DOMContentLoaded', function() {
             `;
 
             item.addEventListener('click', () => {
-                map.setView([client.coordinates.lat, client.coordinates.lng], 15);
-                const marker = markers.find(m => 
-                    Math.abs(m.getLatLng().lat - client.coordinates.lat) < 0.0001 && 
-                    Math.abs(m.getLatLng().lng - client.coordinates.lng) < 0.0001
-                );
-                if (marker) marker.openPopup();
+                // The markers are redrawn for the new view; open this client's popup then
+                pendingPopupClientId = client.id;
+                map.setView([client.lat, client.lng], 15);
             });
 
             locationItems.appendChild(item);
@@ -795,7 +825,7 @@ document.addEventListener('DOMContentLoaded', function() {
         };
 
         clients.forEach(client => {
-            const source = client.coordinate_source || 'unknown';
+            const source = client.source || 'unknown';
             if (stats.hasOwnProperty(source)) {
                 stats[source]++;
             } else {
@@ -806,20 +836,15 @@ document.addEventListener('DOMContentLoaded', function() {
         return stats;
     }
 
-    // Filter clients based on selected filters
+    // Filter the clients in view by the search box (type and status are applied by the server)
     function filterClients() {
-        const typeFilter = clientTypeFilter.value;
-        const statusFilterValue = statusFilter.value;
         const searchQuery = searchInput ? searchInput.value.toLowerCase() : '';
 
-        return clients.filter(client => {
-            const matchesType = typeFilter === 'all' || client.care_type === typeFilter;
-            const matchesStatus = statusFilterValue === 'all' || client.status.toLowerCase() === statusFilterValue;
-            const matchesSearch = !searchQuery || 
-                                client.name.toLowerCase().includes(searchQuery) ||
-                                client.address.toLowerCase().includes(searchQuery);
-
-            return matchesType && matchesStatus && matchesSearch;
+        return visibleClients.filter(client => {
+            const address = (clientDetails.get(client.id) || {}).address || '';
+            return !searchQuery ||
+                client.name.toLowerCase().includes(searchQuery) ||
+                address.toLowerCase().includes(searchQuery);
         });
     }
 
@@ -907,23 +932,17 @@ document.addEventListener('DOMContentLoaded', function() {
 
     if (searchInput) {
         searchInput.addEventListener('input', () => {
-            updateMap();
             updateClientList();
+            updateClientCount();
         });
     }
 
     if (clientTypeFilter) {
-        clientTypeFilter.addEventListener('change', () => {
-            updateMap();
-            updateClientList();
-        });
+        clientTypeFilter.addEventListener('change', updateMap);
     }
 
     if (statusFilter) {
-        statusFilter.addEventListener('change', () => {
-            updateMap();
-            updateClientList();
-        });
+        statusFilter.addEventListener('change', updateMap);
     }
 
     if (toggleHeatMapBtn) {
@@ -1066,8 +1085,8 @@ document.addEventListener('DOMContentLoaded', function() {
         // Escape: Clear search
         if (e.key === 'Escape' && searchInput) {
             searchInput.value = '';
-            updateMap();
             updateClientList();
+            updateClientCount();
         }
         
         // F: Fit bounds
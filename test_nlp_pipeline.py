@@ -5,6 +5,7 @@ Demonstrates the functionality of the client notes analysis system
 
 import requests
 import json
+import time
 from datetime import datetime
 
 # Configuration
@@ -66,8 +67,16 @@ def test_note_analysis():
         
         response = requests.post(f"{BASE_URL}/clients/{TEST_CLIENT_ID}/notes", json=note)
         
-        if response.status_code == 201:
+        analysis = None
+        if response.status_code == 202:
+            # Saved immediately; wait for the background analysis to finish
+            note_id = response.json()['note_id']
+            print(f"   Note {i} saved as {note_id}, waiting for analysis...")
+            analysis = wait_for_analysis(note_id)
+        elif response.status_code == 201:
             analysis = response.json()['analysis']
+        
+        if analysis:
             print(f"✅ Note {i} analyzed successfully")
             print(f"   Sentiment: {analysis['sentiment']['sentiment']} (score: {analysis['sentiment']['score']})")
             print(f"   Keywords: {analysis['keywords'][:5]}")  # Show first 5 keywords
@@ -80,6 +89,22 @@ def test_note_analysis():
         
         print()
 
+def wait_for_analysis(note_id, timeout=60):
+    """Poll a note's analysis status until it is no longer pending"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{BASE_URL}/clients/{TEST_CLIENT_ID}/notes/{note_id}/status")
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        if data['analysis_status'] == 'complete':
+            return data['analysis']
+        if data['analysis_status'] == 'failed':
+            print(f"   Analysis failed: {data.get('error')}")
+            return None
+        time.sleep(1)
+    return None
+
 def test_retrieve_notes():
     """Test retrieving client notes with filters"""
     print("=== Testing Note Retrieval ===")
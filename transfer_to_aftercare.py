@@ -20,6 +20,16 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from firebase_config import db
+from firestore_bulk import BulkWriter
+
+def aftercare_update_data():
+    """Fields that move a client into the aftercare system"""
+    return {
+        'status': 'active',  # Set to active in aftercare
+        'care_type': 'after_care',
+        'transfer_to_aftercare_date': datetime.now(),
+        'in_aftercare_system': True
+    }
 
 def list_ready_clients():
     """List all clients that are ready for transfer to aftercare"""
@@ -86,12 +96,7 @@ def transfer_client(client_id):
             return False
         
         # Update client for aftercare system
-        update_data = {
-            'status': 'active',  # Set to active in aftercare
-            'care_type': 'after_care',
-            'transfer_to_aftercare_date': datetime.now(),
-            'in_aftercare_system': True
-        }
+        update_data = aftercare_update_data()
         
         client_ref.update(update_data)
         
@@ -116,7 +121,7 @@ def transfer_all_ready():
         for client in clients:
             client_data = client.to_dict()
             if client_data.get('status') == 'ready_for_aftercare':
-                ready_clients.append(client.id)
+                ready_clients.append((client.reference, client_data.get('name', 'Unknown')))
         
         if not ready_clients:
             print("No clients ready for transfer to aftercare.")
@@ -129,12 +134,18 @@ def transfer_all_ready():
             print("Transfer cancelled.")
             return
         
-        success_count = 0
-        for client_id in ready_clients:
-            if transfer_client(client_id):
-                success_count += 1
+        # One batched write path for every client instead of a round trip each
+        writer = BulkWriter()
+        names = {}
+        for client_ref, name in ready_clients:
+            writer.update(client_ref, aftercare_update_data(), key=client_ref.id)
+            names[client_ref.id] = name
+        result = writer.flush()
+        
+        for client_id, error in result.failed.items():
+            print(f"Error transferring {names[client_id]} ({client_id}): {error}")
         
-        print(f"\nTransfer completed: {success_count}/{len(ready_clients)} clients transferred successfully.")
+        print(f"\nTransfer completed: {result.success_count}/{len(ready_clients)} clients transferred successfully.")
         
     except Exception as e:
         print(f"Error transferring all clients: {str(e)}")